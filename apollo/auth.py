@@ -1,18 +1,111 @@
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Any, Callable, Dict, Optional, Tuple
 
 from fastapi import Depends, HTTPException, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import OAuth2PasswordBearer
 from jose import JWTError, jwt
 from passlib.context import CryptContext
 
-from apollo.crud import query_first_user
+from apollo.crud import query_first_user, update_user_password
 from apollo.main import site_settings
 from apollo.schemas import TokenData, UserModel
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/token")
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+######################################
+# PASSWORD HASHING
+######################################
+
+# bcrypt runs in its own thread pool of PASSWORD_HASHING_WORKERS threads, a burst of
+# logins waits there instead of taking the threads of the other endpoints. Beyond
+# PASSWORD_HASHING_MAX_PENDING calls waiting or running, the new ones are refused
+# with a 503 rather than queued for ever.
+# The cost factor is BCRYPT_ROUNDS: the hashes made with another cost are hashed
+# again at the next successful login.
+
+DEFAULT_BCRYPT_ROUNDS: int = 12
+DEFAULT_PASSWORD_HASHING_WORKERS: int = 2
+DEFAULT_PASSWORD_HASHING_MAX_PENDING: int = 64
+
+_bcrypt_rounds: int = getattr(site_settings, "BCRYPT_ROUNDS", DEFAULT_BCRYPT_ROUNDS)
+pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto",
+                           bcrypt__default_rounds=_bcrypt_rounds,
+                           bcrypt__min_rounds=_bcrypt_rounds,
+                           bcrypt__max_rounds=_bcrypt_rounds)
+
+
+class PasswordHasher:
+    ''' Bounded thread pool running the bcrypt calls, with its metrics '''
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+        self.pending: int = 0
+        self.calls: int = 0
+        self.rejected: int = 0
+        self.total_wait: float = 0
+        self.max_wait: float = 0
+        self.total_duration: float = 0
+
+    @staticmethod
+    def _timed(func: Callable, submitted: float, *args) -> Tuple[Any, float, float]:
+        started = time.perf_counter()
+        result = func(*args)
+        return (result, started - submitted, time.perf_counter() - started)
+
+    async def run(self, func: Callable, *args) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many authentications in progress",
+                headers={"Retry-After": "1"},
+            )
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="password-hashing")
+
+        loop = asyncio.get_event_loop()
+        self.pending += 1
+        try:
+            result, wait, duration = await loop.run_in_executor(self._executor, self._timed, func, time.perf_counter(), *args)
+        finally:
+            self.pending -= 1
+
+        # updated from the event loop only
+        self.calls += 1
+        self.total_wait += wait
+        self.max_wait = max(self.max_wait, wait)
+        self.total_duration += duration
+        return result
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "bcrypt_rounds": _bcrypt_rounds,
+            "pending": self.pending,
+            "calls": self.calls,
+            "rejected": self.rejected,
+            "average_wait": self.total_wait / self.calls if self.calls else None,
+            "max_wait": self.max_wait,
+            "average_duration": self.total_duration / self.calls if self.calls else None
+        }
+
+
+password_hasher = PasswordHasher(
+    workers=getattr(site_settings, "PASSWORD_HASHING_WORKERS", DEFAULT_PASSWORD_HASHING_WORKERS),
+    max_pending=getattr(site_settings, "PASSWORD_HASHING_MAX_PENDING", DEFAULT_PASSWORD_HASHING_MAX_PENDING))
 
 
 def verify_password(plain_password, hashed_password):
@@ -23,18 +116,31 @@ def get_password_hash(password):
     return pwd_context.hash(password)
 
 
+async def hash_password(password: str) -> str:
+    return await password_hasher.run(get_password_hash, password)
+
+######################################
+
+
 def get_user(username: str):
     user = query_first_user(username)
     if user:
         return UserModel.from_orm(user)
 
 
-def authenticate_user(username: str, password: str):
-    user = query_first_user(username)
+async def authenticate_user(username: str, password: str):
+    user = await run_in_threadpool(query_first_user, username)
     if not user:
         return False
-    if not verify_password(password, user.password):
+
+    valid, new_hash = await password_hasher.run(pwd_context.verify_and_update, password, user.password)
+    if not valid:
         return False
+
+    if new_hash is not None:
+        # hashed with another cost factor than BCRYPT_ROUNDS
+        await run_in_threadpool(update_user_password, user.username, new_hash)
+
     return user
 
 
@@ -49,6 +155,65 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None):
     return encoded_jwt
 
 
+######################################
+# AUTHENTICATED USERS CACHE
+######################################
+
+# token -> user of the tokens already validated by this process, so that the dashboard
+# calls do not decode the JWT and query the user again. An entry is kept until the
+# token expires or USER_CACHE_TTL seconds, whichever comes first, the least recently
+# used ones are dropped above USER_CACHE_SIZE entries. A change of a user goes
+# through invalidate_user, the TTL bounds the changes made by other processes.
+# invalidate_user runs in the threads of run_in_threadpool, the cache is only read or
+# changed under _user_cache_lock.
+
+DEFAULT_USER_CACHE_TTL: int = 60
+DEFAULT_USER_CACHE_SIZE: int = 1024
+
+# token -> (user, valid until)
+_user_cache: "OrderedDict[str, Tuple[UserModel, float]]" = OrderedDict()
+_user_cache_lock = threading.Lock()
+
+
+def _get_cached_user(token: str) -> Optional[UserModel]:
+    with _user_cache_lock:
+        entry = _user_cache.get(token)
+        if entry is None:
+            return None
+
+        user, valid_until = entry
+        if time.time() >= valid_until:
+            del _user_cache[token]
+            return None
+
+        _user_cache.move_to_end(token)
+        return user
+
+
+def _cache_user(token: str, user: UserModel, expire: Optional[float]) -> None:
+    valid_until = time.time() + getattr(site_settings, "USER_CACHE_TTL", DEFAULT_USER_CACHE_TTL)
+    if expire is not None:
+        valid_until = min(valid_until, expire)
+
+    cache_size = getattr(site_settings, "USER_CACHE_SIZE", DEFAULT_USER_CACHE_SIZE)
+
+    with _user_cache_lock:
+        _user_cache[token] = (user, valid_until)
+        _user_cache.move_to_end(token)
+
+        while len(_user_cache) > cache_size:
+            _user_cache.popitem(last = False)
+
+
+def invalidate_user(username: str) -> None:
+    ''' Drops the cached tokens of username, to call when the user changes '''
+    with _user_cache_lock:
+        for token in [x for x, (user, _) in _user_cache.items() if user.username == username]:
+            del _user_cache[token]
+
+######################################
+
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     credentials_exception = HTTPException(
         status_code=status.HTTP_401_UNAUTHORIZED,
@@ -56,6 +221,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
 
+    user = _get_cached_user(token)
+    if user is not None:
+        return user
+
     try:
         payload = jwt.decode(token, site_settings.SECRET_KEY, algorithms=[site_settings.ALGORITHM])
         username: str = payload.get("sub")
@@ -70,6 +239,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     if user is None:
         raise credentials_exception
 
+    _cache_user(token, user, payload.get("exp"))
     return user
 
 
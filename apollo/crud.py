@@ -1,10 +1,15 @@
 from logging import error
+import os
+import sqlite3
+import threading
+import uuid
+from typing import Dict, Tuple, Union
 from apollo import models
-from sqlalchemy.sql import text
+from sqlalchemy.sql import bindparam, text
 from sqlalchemy import exc
 import pandas as pd
 from pandas import DataFrame
-from apollo.database import ApolloSessionLocal
+from apollo.database import ApolloSessionLocal, apollo_engine
 
 def query_first_user(username):
     session = ApolloSessionLocal()
@@ -18,12 +23,12 @@ def query_first_user(username):
         return False
 
 
-def register_new_user(user):
+def register_new_user(user, hashed_password):
     session = ApolloSessionLocal()
 
-    from apollo.auth import get_password_hash
+    from apollo.auth import invalidate_user
     new_user = models.UserDB(username=user.username,
-                      password=get_password_hash(user.password),
+                      password=hashed_password,
                       fullname=user.fullname,
                       email=user.email,
                       disabled=0)
@@ -32,12 +37,30 @@ def register_new_user(user):
         session.add(new_user)
         session.commit()
         session.close()
+        invalidate_user(user.username)
         return True
     except exc.SQLAlchemyError as error:
         print("register_new_user SQL error", error)
         session.close()
         return False
 
+
+def update_user_password(username, hashed_password):
+    session = ApolloSessionLocal()
+
+    from apollo.auth import invalidate_user
+
+    try:
+        session.query(models.UserDB).filter_by(username=username).update({"password": hashed_password})
+        session.commit()
+        session.close()
+        invalidate_user(username)
+        return True
+    except exc.SQLAlchemyError as error:
+        print("update_user_password SQL error", error)
+        session.close()
+        return False
+
 #########################################
 
 def update_intervention_type(request_id, value):
@@ -46,13 +69,15 @@ def update_intervention_type(request_id, value):
     query = text('''UPDATE AP_SD_INTERVENTION_CLASSIFICATION
                 SET AP_INTERVENTION_TYPE = (SELECT AP_SD_INTERVENTION_TYPE.id
                                             FROM AP_SD_INTERVENTION_TYPE
-                                            WHERE AP_SD_INTERVENTION_TYPE.AP_TYPE_FR = "{0}")
-                WHERE AP_REQUEST_ID = {1}'''.format(str(value), int(request_id)))
+                                            WHERE AP_SD_INTERVENTION_TYPE.AP_TYPE_FR = :type_fr)
+                WHERE AP_REQUEST_ID = :request_id''')
 
     try:
-        session.execute(query)
+        session.execute(query, {"type_fr": str(value), "request_id": int(request_id)})
         session.commit()
         session.close()
+        # the processes see the new version and load the classification again
+        bump_intervention_classification_version()
         return True
 
     except exc.SQLAlchemyError as commit_error:
@@ -61,54 +86,173 @@ def update_intervention_type(request_id, value):
         return False
 
 
-def get_requests_intervention_types(df: DataFrame):
-    session = ApolloSessionLocal()
+#########################################
+# INTERVENTION CLASSIFICATION
+#########################################
+
+# AP_SD_INTERVENTION_CLASSIFICATION joined with AP_SD_INTERVENTION_TYPE is kept in
+# memory by each process, the classification of the tickets is a dict lookup.
+# The version of the classification is a token in CLASSIFICATION_VERSION_FILE, replaced
+# by update_intervention_type (PATCH /api/request-classification). The map checks it
+# with a stat on every use, without SQL, and is only loaded again when it changed.
+# The requests inserted with the default type do not change the version: the other
+# processes already classify the requests they do not know as the default type.
+
+DEFAULT_INTERVENTION_TYPE: int = 1
+DEFAULT_CLASSIFICATION_VERSION_FILE: str = os.path.join(os.getcwd(), "db", "intervention_classification.version")
+# version of the classification while the file was never written
+INITIAL_CLASSIFICATION_VERSION: str = "0"
+
+INSERT_CLASSIFICATION_SQL: str = '''INSERT OR IGNORE INTO AP_SD_INTERVENTION_CLASSIFICATION (AP_REQUEST_ID, AP_RFC_NUMBER, AP_INTERVENTION_TYPE)
+                                     VALUES (:request_id, :rfc_number, :intervention_type)'''
+SELECT_CLASSIFICATION_SQL: str = '''SELECT AP_REQUEST_ID, AP_INTERVENTION_TYPE FROM AP_SD_INTERVENTION_CLASSIFICATION
+                                     WHERE AP_REQUEST_ID IN :request_ids'''
+# below the default SQLITE_MAX_VARIABLE_NUMBER of the older SQLite versions
+SELECT_CLASSIFICATION_BATCH_SIZE: int = 500
+
+
+def get_classification_version_file() -> str:
+    from apollo.main import site_settings
 
-    # SQLite cannot read lists in format (12345, ) generated by the python tupple()
-    if len(df.index) == 1:
-        ticket_list = "({})".format(df.iloc[0]["AP_SD_REQUEST_ID"])
-    else:
-        ticket_list = tuple(df["AP_SD_REQUEST_ID"])
+    return getattr(site_settings, "CLASSIFICATION_VERSION_FILE", DEFAULT_CLASSIFICATION_VERSION_FILE)
 
-    validator_req = '''SELECT AP_SD_INTERVENTION_CLASSIFICATION.AP_REQUEST_ID
-                        FROM AP_SD_INTERVENTION_CLASSIFICATION
-                        WHERE AP_SD_INTERVENTION_CLASSIFICATION.AP_REQUEST_ID IN {}'''.format(ticket_list)
 
-    # test_query = db.query(models.AP_SD_INTERVENTION_CLASSIFICATION_MODEL).filter(
-    #     models.AP_SD_INTERVENTION_CLASSIFICATION_MODEL.AP_REQUEST_ID.in_(ticket_list)
-    # ).all()
+# (inode, mtime, size) of the version file when it was last read, and its token
+_classification_version_stat: Union[Tuple[int, int, int], None] = None
+_classification_version: str = INITIAL_CLASSIFICATION_VERSION
 
-    # print(list(test_query))
 
+def get_intervention_classification_version() -> str:
+    ''' Returns the version of the classification, the file is only read again when it changed '''
+    global _classification_version_stat, _classification_version
+
+    path = get_classification_version_file()
     try:
-        df_validator = pd.DataFrame(session.execute(validator_req), columns = ["AP_REQUEST_ID"])
+        stat = os.stat(path)
+    except FileNotFoundError:
+        return INITIAL_CLASSIFICATION_VERSION
 
-        df_missing = df.loc[~df["AP_SD_REQUEST_ID"].isin(df_validator["AP_REQUEST_ID"])]
+    version_stat = (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+    if version_stat != _classification_version_stat:
+        with open(path, "r") as version_file:
+            _classification_version = version_file.read().strip() or INITIAL_CLASSIFICATION_VERSION
+        _classification_version_stat = version_stat
 
-        if not df_missing.empty:
-            df_missing["AP_INTERVENTION_TYPE"] = 1
-            df_missing.rename(columns={"AP_SD_REQUEST_ID": "AP_REQUEST_ID",
-                                "AP_SD_RFC_NUMBER": "AP_RFC_NUMBER",
-                                "AP_INTERVENTION_TYPE": "AP_INTERVENTION_TYPE"},
-                        inplace=True)
+    return _classification_version
 
-            session.bulk_insert_mappings(models.AP_SD_INTERVENTION_CLASSIFICATION_MODEL, df_missing.to_dict('records'))
-            session.commit()
 
-        result_req = '''SELECT AP_SD_INTERVENTION_CLASSIFICATION.AP_REQUEST_ID,
-                                AP_SD_INTERVENTION_CLASSIFICATION.AP_INTERVENTION_TYPE,
-                                AP_SD_INTERVENTION_TYPE.AP_TYPE_FR,
-                                AP_SD_INTERVENTION_TYPE.AP_Description_FR
-                        FROM AP_SD_INTERVENTION_CLASSIFICATION
-                        LEFT JOIN AP_SD_INTERVENTION_TYPE on AP_SD_INTERVENTION_CLASSIFICATION.AP_INTERVENTION_TYPE = AP_SD_INTERVENTION_TYPE.id
-                        WHERE AP_SD_INTERVENTION_CLASSIFICATION.AP_REQUEST_ID IN {}'''.format(ticket_list)
+def bump_intervention_classification_version() -> None:
+    ''' Gives the classification a new version, to call after a change of the intervention types '''
+    path = get_classification_version_file()
+    os.makedirs(os.path.dirname(path), exist_ok = True)
 
-        df_result = pd.DataFrame(session.execute(result_req), columns = ["AP_REQUEST_ID", "AP_INTERVENTION_TYPE", "AP_TYPE_FR", "AP_Description_FR"])
+    # written aside then renamed, the readers never see a partial token
+    temp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(temp_path, "w") as version_file:
+        version_file.write(uuid.uuid4().hex)
+    os.replace(temp_path, path)
 
-        session.close()
-        
-        return df_result
 
-    except exc.SQLAlchemyError as error:
+class InterventionClassification:
+    ''' In memory copy of the classification of the requests '''
+
+    def __init__(self):
+        self.pid = os.getpid()
+        # version of the classification loaded, the enriched snapshots merge the classification again when it changes
+        self.version: Union[str, None] = None
+        self.types: Dict[int, int] = {}
+        self.labels: DataFrame = DataFrame(columns = ["AP_TYPE_FR", "AP_Description_FR"])
+
+        self._lock = threading.Lock()
+
+    def refresh(self) -> None:
+        ''' Loads the classification again if its version changed '''
+        # read first, a change made during the load is seen by the next refresh
+        version = get_intervention_classification_version()
+        if version == self.version:
+            return
+
+        with self._lock:
+            if version == self.version:
+                return
+
+            # a connection of the pool for the load only, given back right after
+            with apollo_engine.begin() as connection:
+                labels = connection.execute(text("SELECT id, AP_TYPE_FR, AP_Description_FR FROM AP_SD_INTERVENTION_TYPE")).fetchall()
+                types = connection.execute(text("SELECT AP_REQUEST_ID, AP_INTERVENTION_TYPE FROM AP_SD_INTERVENTION_CLASSIFICATION")).fetchall()
+
+            self.labels = DataFrame([tuple(x) for x in labels], columns = ["id", "AP_TYPE_FR", "AP_Description_FR"]).set_index("id")
+            self.types = dict((x[0], x[1]) for x in types)
+            self.version = version
+
+    def insert_missing(self, df: DataFrame) -> None:
+        ''' Inserts the requests of df not classified yet as DEFAULT_INTERVENTION_TYPE, in one batch '''
+        df_missing = df.loc[df["AP_SD_REQUEST_ID"].map(self.types).isnull(), ("AP_SD_REQUEST_ID", "AP_SD_RFC_NUMBER")]
+        # AP_RFC_NUMBER is UNIQUE NOT NULL, the requests without one stay unclassified
+        df_missing = df_missing.loc[df_missing["AP_SD_RFC_NUMBER"].notnull()]
+        df_missing = df_missing.drop_duplicates(subset = "AP_SD_REQUEST_ID")
+        if df_missing.empty:
+            return
+
+        rows = [{"request_id": int(request_id), "rfc_number": str(rfc_number), "intervention_type": DEFAULT_INTERVENTION_TYPE}
+                for request_id, rfc_number in zip(df_missing["AP_SD_REQUEST_ID"], df_missing["AP_SD_RFC_NUMBER"])]
+
+        select_query = text(SELECT_CLASSIFICATION_SQL).bindparams(bindparam("request_ids", expanding = True))
+        request_ids = [x["request_id"] for x in rows]
+
+        # under the lock, refresh() cannot swap self.types between the insert and the update
+        with self._lock:
+            with apollo_engine.begin() as connection:
+                # OR IGNORE: another worker may have inserted some of them since the last refresh,
+                # or another request may already hold the RFC number
+                connection.execute(text(INSERT_CLASSIFICATION_SQL), rows)
+
+                # only the rows really in the table are known, the ignored ones are tried again next time
+                classified = []
+                for i in range(0, len(request_ids), SELECT_CLASSIFICATION_BATCH_SIZE):
+                    batch = request_ids[i:i + SELECT_CLASSIFICATION_BATCH_SIZE]
+                    classified.extend(connection.execute(select_query, {"request_ids": batch}).fetchall())
+
+            self.types.update((x[0], x[1]) for x in classified)
+
+    def lookup(self, request_ids: pd.Series) -> DataFrame:
+        ''' Returns the classification of the requests, unknown ones as DEFAULT_INTERVENTION_TYPE '''
+        request_ids = request_ids.drop_duplicates()
+        intervention_types = request_ids.map(self.types).fillna(DEFAULT_INTERVENTION_TYPE).astype(int).to_numpy()
+        labels = self.labels.reindex(intervention_types)
+
+        return DataFrame({"AP_REQUEST_ID": request_ids.to_numpy(),
+                          "AP_INTERVENTION_TYPE": intervention_types,
+                          "AP_TYPE_FR": labels["AP_TYPE_FR"].to_numpy(),
+                          "AP_Description_FR": labels["AP_Description_FR"].to_numpy()})
+
+
+_intervention_classification: Union[InterventionClassification, None] = None
+
+
+def get_intervention_classification() -> InterventionClassification:
+    ''' Returns the classification map of the process, up to date with the database '''
+    global _intervention_classification
+
+    # the lock of the map is never shared with the forked workers
+    if _intervention_classification is None or _intervention_classification.pid != os.getpid():
+        _intervention_classification = InterventionClassification()
+
+    _intervention_classification.refresh()
+    return _intervention_classification
+
+
+def get_requests_intervention_types(df: DataFrame):
+    try:
+        classification = get_intervention_classification()
+    except (exc.SQLAlchemyError, sqlite3.Error) as error:
+        print("get_requests_intervention_types SQL error", error)
+        return False
+
+    try:
+        classification.insert_missing(df)
+    except (exc.SQLAlchemyError, sqlite3.Error) as error:
+        # returned unclassified, the insert is tried again on the next call
         print("get_requests_intervention_types SQL error", error)
-        return False
\ No newline at end of file
+
+    return classification.lookup(df["AP_SD_REQUEST_ID"])
@@ -1,6 +1,12 @@
+import os
+import threading
 import urllib
-from sqlalchemy import create_engine, event
+from typing import Any, Dict, List, Union
+
+from sqlalchemy import create_engine, event, exc
 from sqlalchemy.engine.base import Engine
+from sqlalchemy.pool import QueuePool
+from sqlalchemy.sql import text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
@@ -10,24 +16,163 @@ from apollo.main import site_settings
 # /!\ WARNING
 ###############################
 
-def create_spot_engine():
+# The SPOT engine is created once per process, on first use, and its pool keeps the
+# connections to SQLDB open between the refreshes instead of logging in for each query.
+#   * SPOT_POOL_SIZE / SPOT_MAX_OVERFLOW: connections kept open / allowed on top of them
+#   * SPOT_POOL_TIMEOUT: seconds to wait for a connection when all are checked out
+#   * SPOT_POOL_RECYCLE: seconds after which a connection is replaced, before SQLDB drops it
+# The connections are pinged on checkout (pool_pre_ping). site_settings.SPOT_DATABASE_URL
+# points the engine to another database, e.g. a SQLite file standing in for SQLDB.
+
+DEFAULT_SPOT_POOL_SIZE: int = 4
+DEFAULT_SPOT_MAX_OVERFLOW: int = 4
+DEFAULT_SPOT_POOL_TIMEOUT: int = 30
+DEFAULT_SPOT_POOL_RECYCLE: int = 1800
+
+
+def get_spot_database_url() -> str:
+    url: Union[str, None] = getattr(site_settings, "SPOT_DATABASE_URL", None)
+    if url is not None:
+        return url
+
     params = urllib.parse.quote_plus(
         "DRIVER={ODBC Driver 17 for SQL Server};SERVER=SQLDB;UID=" + site_settings.SQLUSR + ";PWD=" + site_settings.SQLPWD + ";")
-    engine = create_engine("mssql+pyodbc:///?odbc_connect=%s" % params)
+    return "mssql+pyodbc:///?odbc_connect=%s" % params
+
+
+def create_spot_engine() -> Engine:
+    ''' Builds a new pooled SPOT engine, use get_spot_engine to share the one of the process '''
+    engine = create_engine(get_spot_database_url(),
+                           poolclass=QueuePool,
+                           pool_size=getattr(site_settings, "SPOT_POOL_SIZE", DEFAULT_SPOT_POOL_SIZE),
+                           max_overflow=getattr(site_settings, "SPOT_MAX_OVERFLOW", DEFAULT_SPOT_MAX_OVERFLOW),
+                           pool_timeout=getattr(site_settings, "SPOT_POOL_TIMEOUT", DEFAULT_SPOT_POOL_TIMEOUT),
+                           pool_recycle=getattr(site_settings, "SPOT_POOL_RECYCLE", DEFAULT_SPOT_POOL_RECYCLE),
+                           pool_pre_ping=True)
 
     return engine
 
+
+_spot_engine: Union[Engine, None] = None
+_spot_engine_pid: Union[int, None] = None
+_spot_engine_lock = threading.Lock()
+
+
+def get_spot_engine() -> Engine:
+    ''' Returns the SPOT engine of the process, created on first use
+
+    A forked executor worker does not reuse the engine, nor the sockets, of its
+    parent: it creates its own the first time it queries SPOT.
+    '''
+    global _spot_engine, _spot_engine_pid
+
+    if _spot_engine is None or _spot_engine_pid != os.getpid():
+        with _spot_engine_lock:
+            if _spot_engine is None or _spot_engine_pid != os.getpid():
+                _spot_engine = create_spot_engine()
+                _spot_engine_pid = os.getpid()
+
+    return _spot_engine
+
+
+def get_spot_pool_status() -> Dict[str, Any]:
+    ''' Returns the state of the pool of the SPOT engine of this process '''
+    if _spot_engine is None or _spot_engine_pid != os.getpid():
+        return {"created": False}
+
+    pool = _spot_engine.pool
+    return {
+        "created": True,
+        "pid": _spot_engine_pid,
+        "size": pool.size(),
+        "checked_in": pool.checkedin(),
+        "checked_out": pool.checkedout(),
+        "overflow": pool.overflow(),
+        "status": pool.status()
+    }
+
+
+def dispose_spot_engine() -> None:
+    global _spot_engine, _spot_engine_pid
+
+    with _spot_engine_lock:
+        if _spot_engine is not None and _spot_engine_pid == os.getpid():
+            _spot_engine.dispose()
+        _spot_engine = None
+        _spot_engine_pid = None
+
 ###############################
 # /!\ WARNING
 ###############################
 
 Base = declarative_base()
 
-def _fk_pragma_on_connect(dbapi_con, con_record):
-    dbapi_con.execute('pragma foreign_keys=ON')
+###############################
+# APOLLO SQLITE
+###############################
+
+# The API process and the executor workers all read and write the same SQLite file.
+# Each connection is set up with:
+#   * journal_mode=WAL: the readers do not block the writer and the other way round
+#   * synchronous=NORMAL: safe with WAL, a commit no longer waits for an fsync
+#   * mmap_size / cache_size: pages read through a memory map, page cache in KiB (negative)
+#   * busy_timeout: a writer waits for the lock instead of failing with "database is locked"
+# site_settings.SQLITE_PRAGMAS overrides some of them. The connections are pooled
+# per process (SQLITE_POOL_SIZE) and keep their prepared statements (cached_statements).
+
+DEFAULT_SQLITE_PRAGMAS: Dict[str, Union[int, str]] = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "foreign_keys": "ON",
+    "mmap_size": 256 * 1024 * 1024,
+    "cache_size": -32 * 1024,
+    "temp_store": "MEMORY",
+    "busy_timeout": 5000
+}
+DEFAULT_SQLITE_POOL_SIZE: int = 5
+DEFAULT_SQLITE_CACHED_STATEMENTS: int = 256
+
+SQLITE_PRAGMAS: Dict[str, Union[int, str]] = dict(DEFAULT_SQLITE_PRAGMAS, **getattr(site_settings, "SQLITE_PRAGMAS", {}))
+
+# indexes missing from the databases created before they were added to the models
+APOLLO_INDEXES: List[str] = [
+    "CREATE INDEX IF NOT EXISTS ix_AP_SD_INTERVENTION_CLASSIFICATION_AP_INTERVENTION_TYPE "
+    "ON AP_SD_INTERVENTION_CLASSIFICATION (AP_INTERVENTION_TYPE)"
+]
+
+
+def _sqlite_pragmas_on_connect(dbapi_con, con_record):
+    con_record.info["pid"] = os.getpid()
+
+    cursor = dbapi_con.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute("PRAGMA {}={}".format(name, value))
+    cursor.close()
+
+
+def _check_pid_on_checkout(dbapi_con, con_record, con_proxy):
+    # a connection inherited by a forked worker is dropped, the worker opens its own
+    if con_record.info["pid"] != os.getpid():
+        con_record.connection = con_proxy.connection = None
+        raise exc.DisconnectionError("Connection record belongs to pid {}, attempting to check out in pid {}".format(
+            con_record.info["pid"], os.getpid()))
+
+
+apollo_engine: Engine = create_engine('sqlite:///{}'.format(site_settings.DB_LOCATION),
+                                      connect_args={"check_same_thread": False,
+                                                    "cached_statements": getattr(site_settings, "SQLITE_CACHED_STATEMENTS", DEFAULT_SQLITE_CACHED_STATEMENTS)},
+                                      poolclass=QueuePool,
+                                      pool_size=getattr(site_settings, "SQLITE_POOL_SIZE", DEFAULT_SQLITE_POOL_SIZE),
+                                      max_overflow=10)
+
+event.listen(apollo_engine, 'connect', _sqlite_pragmas_on_connect)
+event.listen(apollo_engine, 'checkout', _check_pid_on_checkout)
 
-apollo_engine: Engine = create_engine('sqlite:///{}'.format(site_settings.DB_LOCATION), connect_args={"check_same_thread": False})
+ApolloSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind = apollo_engine)
 
-event.listen(apollo_engine, 'connect', _fk_pragma_on_connect)
 
-ApolloSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind = apollo_engine)
\ No newline at end of file
+def create_apollo_indexes() -> None:
+    with apollo_engine.connect() as connection:
+        for statement in APOLLO_INDEXES:
+            connection.execute(text(statement))
+        connection.execute(text("PRAGMA optimize"))
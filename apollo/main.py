@@ -13,19 +13,24 @@ site_settings = config.SettingsDebugDocker()
 
 import asyncio
 import functools
+import hashlib
 import logging
 from concurrent.futures import ProcessPoolExecutor
+from contextvars import ContextVar
 from datetime import timedelta
 from logging.handlers import RotatingFileHandler
-from typing import Optional, List
+from typing import Any, Dict, Optional, List
 
-from fastapi import Depends, FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.concurrency import run_in_threadpool
 from fastapi.logger import logger as fastapi_logger
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.security import OAuth2PasswordRequestForm
 
 from apollo import auth, crud
-from apollo.pipeline import data_workflows
+from apollo.database import create_apollo_indexes, dispose_spot_engine, get_spot_engine, get_spot_pool_status
+from apollo.pipeline import data_collection, data_preparation, data_workflows, scoring_rules
+from apollo.pipeline.data_scheduler import SpotPrefetchScheduler
 from apollo import schemas
 
 ######################################
@@ -51,6 +56,7 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
     allow_credentials=True,
+    expose_headers=["ETag", "X-Total-Count"],
 )
 
 
@@ -70,14 +76,181 @@ handler.setFormatter(formatter)
 # PARALLEL PROCESSING
 ######################################
 
-executor = ProcessPoolExecutor()
+# the workers map the SPOT snapshots from shared memory, adding some does not copy the data
+executor = ProcessPoolExecutor(max_workers=getattr(site_settings, "WORKERS", None))
 
-async def run_task(func, *param):
+async def run_task(func, *param, snapshot: bool = True):
     
     loop = asyncio.get_event_loop()
 
+    # the SPOT versions are resolved here, concurrently and without blocking the loop,
+    # the worker only maps them and runs the pandas stages
+    snapshot_versions = None
+    if snapshot:
+        # the versions the ETag of the response was computed from, when it has one
+        snapshot_versions = request_snapshot_versions.get()
+        if snapshot_versions is None:
+            snapshot_versions = await data_collection.get_snapshot_versions(
+                engine=get_spot_engine, memcached_client_factory=data_workflows.create_memcached_client)
+
     print("process started")
-    return await loop.run_in_executor(executor, functools.partial(func, *param))
+    return await loop.run_in_executor(executor, functools.partial(data_workflows.run_flow, snapshot_versions, func, *param))
+
+
+######################################
+# DATATABLES
+######################################
+
+# The datatable flows return one page of rows already encoded to JSON and the number
+# of rows of the datatable, sent in X-Total-Count. The endpoints send the rows in a
+# Response as they are, their response_model only documents them.
+
+def get_datatable_page(offset: int = Query(0, ge=0),
+                       limit: Optional[int] = Query(None, ge=0),
+                       sort: Optional[str] = Query(None, description="field, -field for the descending order"),
+                       filter: List[str] = Query([], description="field:text, repeated for several fields")) -> Dict[str, Any]:
+    try:
+        return data_preparation.parse_datatable_page(offset, limit, sort, filter)
+    except ValueError as error:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=str(error),
+        )
+
+
+def datatable_response(result) -> Response:
+    content, total = result
+    return Response(content=content, media_type="application/json", headers={"X-Total-Count": str(total)})
+
+
+######################################
+# ETAG
+######################################
+
+# The responses of the GET endpoints only change when a new SPOT version is published
+# (or the scoring rules / request classification change). Their ETag is a hash of the
+# snapshot uuids, of those versions, of the path and query parameters and of the
+# Authorization header, so it is never shared between users. A matching If-None-Match
+# is answered with a 304 by the API process, without running the flow in a worker.
+# The uuids resolved for the ETag are the ones run_task serves.
+# The token is checked first (signature, expiry, active user): the requests which
+# would get a 401 go straight to the route, they never resolve the SPOT versions nor
+# get a 304. The versions of the rules and of the classification are read in a thread.
+
+# GET endpoints not computed from the SPOT snapshot
+NOT_SNAPSHOT_PATHS = {
+    "/api/users/me",
+    "/api/spot-prefetch-status",
+    "/api/spot-pool-status",
+    "/api/password-hashing-status",
+    "/api/request-classification",
+    "/api/employee_mouvement_calendar",
+}
+
+request_snapshot_versions: ContextVar = ContextVar("request_snapshot_versions", default=None)
+
+
+async def get_etag_user(request: Request) -> Optional[schemas.UserModel]:
+    ''' Returns the active user of the bearer token of the request, None if the route would refuse it '''
+    scheme, _, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+
+    try:
+        user = await auth.get_current_active_user(await auth.get_current_user(token))
+    except HTTPException:
+        return None
+
+    if user.disabled:
+        return None
+
+    return user
+
+
+def get_etag_versions() -> List[str]:
+    # stats the rule and classification version files, run in a thread
+    return [str(scoring_rules.get_scoring_rules().version), crud.get_intervention_classification_version()]
+
+
+def get_snapshot_etag(request: Request, snapshot_versions: Dict[str, str], versions: List[str]) -> str:
+    etag = hashlib.sha1()
+    etag.update(request.url.path.encode("utf-8"))
+    etag.update(repr(sorted(request.query_params.multi_items())).encode("utf-8"))
+    etag.update(repr(sorted(snapshot_versions.items())).encode("utf-8"))
+    etag.update(repr(versions).encode("utf-8"))
+    etag.update(request.headers.get("Authorization", "").encode("utf-8"))
+
+    return '"{}"'.format(etag.hexdigest())
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    for candidate in if_none_match.split(","):
+        candidate = candidate.strip()
+        if candidate.startswith("W/"):
+            candidate = candidate[2:]
+        if candidate == "*" or candidate == etag:
+            return True
+
+    return False
+
+
+@app.middleware("http")
+async def snapshot_etag(request: Request, call_next):
+    if (request.method != "GET" or not request.url.path.startswith("/api/")
+            or request.url.path in NOT_SNAPSHOT_PATHS or "Authorization" not in request.headers):
+        return await call_next(request)
+
+    if await get_etag_user(request) is None:
+        return await call_next(request)
+
+    try:
+        snapshot_versions = await data_collection.get_snapshot_versions(
+            engine=get_spot_engine, memcached_client_factory=data_workflows.create_memcached_client)
+        etag = get_snapshot_etag(request, snapshot_versions, await run_in_threadpool(get_etag_versions))
+    except Exception as error:
+        # served without ETag, the flow reports the error
+        fastapi_logger.error("ETag not computed for {}: {}".format(request.url.path, error))
+        return await call_next(request)
+
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache"}
+
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is not None and etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    token = request_snapshot_versions.set(snapshot_versions)
+    try:
+        response = await call_next(request)
+    finally:
+        request_snapshot_versions.reset(token)
+
+    if response.status_code == 200:
+        response.headers.update(headers)
+
+    return response
+
+
+######################################
+# SPOT PREFETCH
+######################################
+
+spot_prefetch_scheduler = SpotPrefetchScheduler(engine=get_spot_engine,
+                                                memcached_client_factory=data_workflows.create_memcached_client,
+                                                cache_expire=site_settings.CACHE_EXPIRE)
+
+@app.on_event("startup")
+async def apollo_database_indexes():
+    create_apollo_indexes()
+
+@app.on_event("startup")
+async def start_spot_prefetch():
+    if not site_settings.TESTING:
+        spot_prefetch_scheduler.start()
+
+@app.on_event("shutdown")
+async def stop_spot_prefetch():
+    await spot_prefetch_scheduler.stop()
+    dispose_spot_engine()
 
 
 ######################################
@@ -96,8 +269,8 @@ async def main_route(current_user: schemas.UserModel = Depends(auth.get_current_
 
 
 @app.post("/api/token")
-def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
-    user = auth.authenticate_user(form_data.username, form_data.password)
+async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
+    user = await auth.authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -115,8 +288,8 @@ def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
 
 
 @app.post("/api/register", status_code=status.HTTP_201_CREATED)
-def register(user: schemas.UserModel):
-    existing_user = auth.get_user(user.username)
+async def register(user: schemas.UserModel):
+    existing_user = await run_in_threadpool(auth.get_user, user.username)
     if existing_user:
         raise HTTPException(
             status_code=status.HTTP_409_CONFLICT,
@@ -124,7 +297,8 @@ def register(user: schemas.UserModel):
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-    new_user_status = crud.register_new_user(user)
+    hashed_password = await auth.hash_password(user.password)
+    new_user_status = await run_in_threadpool(crud.register_new_user, user, hashed_password)
 
     if new_user_status:
         return True
@@ -135,6 +309,38 @@ async def read_users_me(current_user: schemas.UserModel = Depends(auth.get_curre
     return current_user.username
 
 
+######################################
+# STATUS
+######################################
+
+@app.get("/api/spot-prefetch-status", status_code=200)
+async def spot_prefetch_status(current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    return spot_prefetch_scheduler.status()
+
+
+@app.get("/api/spot-pool-status", status_code=200)
+async def spot_pool_status(current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    return get_spot_pool_status()
+
+
+@app.get("/api/password-hashing-status", status_code=200)
+async def password_hashing_status(current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    return auth.password_hasher.status()
+
+
+@app.post("/api/spot-refresh", status_code=200)
+async def spot_refresh(full_reload: bool = False, current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    try:
+        await spot_prefetch_scheduler.run_once(full_reload=full_reload)
+    except Exception:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail=spot_prefetch_scheduler.last_error,
+        )
+
+    return spot_prefetch_scheduler.status()
+
+
 ######################################
 # REQUEST CLASSIFICATION
 ######################################
@@ -155,7 +361,7 @@ async def proxi_table_update(params: schemas.RequestClassificationChangeModel,
 
 @app.get("/api/employee_mouvement_calendar")
 async def employee_mouvement_calendar(current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_employee_mouvement_calendar)
+    result = await run_task(data_workflows.flow_get_employee_mouvement_calendar, snapshot=False)
     return result
 
 @app.get("/api/rdv_calendar")
@@ -175,9 +381,9 @@ async def suspended_mail_not_recontacted_table(tech_filter: Optional[str] = None
 
 @app.get("/api/suspended_mail_not_recontacted_datatable", response_model= List[schemas.DatatableItemResponseModel])
 async def suspended_mail_not_recontacted_datatable(tech_filter: Optional[str] = None,
-            current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_suspended_mail_not_recontacted_datatable, tech_filter)
-    return result
+            page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_suspended_mail_not_recontacted_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/suspended_mail_not_recontacted_indicator", response_model= int)
@@ -192,9 +398,9 @@ async def suspended_mail_not_recontacted_indicator(tech_filter: Optional[str] =
 ######################################
 
 @app.get("/api/under_observation_tickets_datatable", response_model= List[schemas.DatatableItemResponseModel])
-async def under_observation_tickets_datatable(tech_filter: Optional[str] = None, current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_tickets_under_observation_datatable, tech_filter)
-    return result
+async def under_observation_tickets_datatable(tech_filter: Optional[str] = None, page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_tickets_under_observation_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/under_observation_tickets_indicator", response_model= int)
@@ -210,9 +416,9 @@ async def under_observation_tickets_indicator(tech_filter: Optional[str] = None,
 
 @app.get("/api/software_installation_datatable", response_model= List[schemas.DatatableItemResponseModel])
 async def software_installation_datatable(tech_filter: Optional[str] = None,
-        current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_software_installation_datatable, tech_filter)
-    return result
+        page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_software_installation_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/software_installation_indicator", response_model= int)
@@ -228,9 +434,9 @@ async def software_installation_indicator(tech_filter: Optional[str] = None,
 
 @app.get("/api/new_arrivals_datatable", response_model= List[schemas.DatatableItemResponseModel])
 async def new_arrivals_datatable(tech_filter: Optional[str] = None,
-        current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_new_arrivals_datatable, tech_filter)
-    return result
+        page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_new_arrivals_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/new_arrivals_datatable_indicator", response_model= int)
@@ -245,9 +451,9 @@ async def new_arrivals_datatable_indicator(tech_filter: Optional[str] = None,
 ######################################
 
 @app.get("/api/suspended_gt_x_datatable", response_model= List[schemas.DatatableItemResponseModel])
-async def suspended_mail_not_recontacted_datatable(inter_type: str = None, tech_filter: Optional[str] = None, current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_suspended_gt_x_datatable, inter_type, tech_filter)
-    return result
+async def suspended_mail_not_recontacted_datatable(inter_type: str = None, tech_filter: Optional[str] = None, page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_suspended_gt_x_datatable, inter_type, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/suspended_gt_x_indicator", response_model= int)
@@ -263,9 +469,9 @@ async def suspended_mail_not_recontacted_indicator(inter_type: str = None,
 ######################################
 
 @app.get("/api/contacted_x_times_datatable", response_model= List[schemas.DatatableItemResponseModel])
-async def contacted_x_times_datatable(tech_filter: Optional[str] = None, current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_contacted_x_times_datatable, tech_filter)
-    return result
+async def contacted_x_times_datatable(tech_filter: Optional[str] = None, page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_contacted_x_times_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/contacted_x_times_indicator", response_model= int)
@@ -280,9 +486,9 @@ async def contacted_x_times_indicator(tech_filter: Optional[str] = None,
 ######################################
 
 @app.get("/api/not_suspended_incidents_datatable", response_model= List[schemas.DatatableItemResponseModel])
-async def not_suspended_incidents_datatable(tech_filter: Optional[str] = None, current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_not_suspended_incidents_datatable, tech_filter)
-    return result
+async def not_suspended_incidents_datatable(tech_filter: Optional[str] = None, page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_not_suspended_incidents_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/not_suspended_incidents_indicator",response_model= int)
@@ -297,9 +503,9 @@ async def not_suspended_incidents_indicator(tech_filter: Optional[str] = None,
 ######################################
 
 @app.get("/api/industrial_tickets_datatable", response_model= List[schemas.DatatableItemResponseModel])
-async def industrial_tickets_datatable(tech_filter: Optional[str] = None, current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_industrial_tickets_datatable, tech_filter)
-    return result
+async def industrial_tickets_datatable(tech_filter: Optional[str] = None, page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_industrial_tickets_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/industrial_tickets_total_indicator", response_model= int)
@@ -314,9 +520,9 @@ async def industrial_tickets_total_indicator(tech_filter: Optional[str] = None,
 ######################################
 
 @app.get("/api/security_tickets_datatable", response_model= List[schemas.DatatableItemResponseModel])
-async def security_tickets_datatable(tech_filter: Optional[str] = None, current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_security_tickets_datatable, tech_filter)
-    return result
+async def security_tickets_datatable(tech_filter: Optional[str] = None, page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_security_tickets_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/security_tickets_total_indicator", response_model= int)
@@ -331,9 +537,9 @@ async def security_tickets_total_indicator(tech_filter: Optional[str] = None,
 ######################################
 
 @app.get("/api/vip_tickets_datatable", response_model= List[schemas.DatatableItemResponseModel])
-async def vip_tickets_datatable(tech_filter: Optional[str] = None, current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_vip_tickets_datatable, tech_filter)
-    return result
+async def vip_tickets_datatable(tech_filter: Optional[str] = None, page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_vip_tickets_datatable, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/vip_tickets_total_indicator", response_model= int)
@@ -350,9 +556,9 @@ async def vip_tickets_total_indicator(tech_filter: Optional[str] = None,
 @app.get("/api/ticket_flow_datatable", response_model= List[schemas.DatatableItemResponseModel])
 async def ticket_flow_datatable(inter_type: Optional[str] = None,
         tech_filter: Optional[str] = None,
-        current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
-    result = await run_task(data_workflows.flow_get_ticket_flow_datatable, inter_type, tech_filter)
-    return result
+        page: Dict[str, Any] = Depends(get_datatable_page), current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_ticket_flow_datatable, inter_type, tech_filter, page)
+    return datatable_response(result)
 
 
 @app.get("/api/ticket_flow_indicator", response_model= int)
@@ -382,3 +588,15 @@ async def tickets_by_expiration_table(inter_type: Optional[str] = None,
 async def technician_total_tickets_table(current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
     result = await run_task(data_workflows.flow_get_technician_tickets_table)
     return result
+
+
+######################################
+# DASHBOARD
+######################################
+
+@app.get("/api/dashboard", response_model= schemas.DashboardResponseModel)
+async def dashboard(inter_type: Optional[str] = None,
+        tech_filter: Optional[str] = None,
+        current_user: schemas.UserModel = Depends(auth.get_current_active_user)):
+    result = await run_task(data_workflows.flow_get_dashboard, inter_type, tech_filter)
+    return result
@@ -22,7 +22,7 @@ class AP_SD_INTERVENTION_CLASSIFICATION_MODEL(Base):
     AP_REQUEST_ID = Column(Integer, unique=True)
     AP_RFC_NUMBER = Column(String(100), unique=True, nullable=False)
     AP_INTERVENTION_TYPE = Column(Integer, ForeignKey(
-        'AP_SD_INTERVENTION_TYPE.id'), nullable=False)
+        'AP_SD_INTERVENTION_TYPE.id'), nullable=False, index=True)
 
     intervention_rel = relationship("AP_SD_INTERVENTION_TYPE_MODEL")
 
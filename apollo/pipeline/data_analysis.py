@@ -1,91 +1,88 @@
-import re
+import numpy as np
 import pandas as pd
-from pandas.tseries.offsets import BDay
 
+from apollo.pipeline import data_schema, scoring_rules
 
-def get_suspended_mail_not_recontacted(df, df_operations):
-    assert isinstance(df, pd.DataFrame)
-    assert isinstance(df_operations, pd.DataFrame)
-    
-    mask_status = (df["AP_SD_STATUS_ID"].isin([39, 42]))
-    df = df.loc[mask_status]
 
-    if not df.empty:
-        df_operations = df_operations.loc[df_operations["AP_AM_RFC_NUMBER"].isin(df["AP_SD_RFC_NUMBER"])]
+######################################
+# USER NOTIFICATIONS
+######################################
 
-        def get_operations_contacted_by_mail_and_last_action(df_ops):
-            print(df_ops)
-            regex_notification_task = "Appel sortant utilisateur|Notification au demandeur|Relance vers l'utilisateur|Envoi de mail au demandeur"
-            df_ops = df_ops[df_ops["AP_AM_OPERATION_TYPE_NAME"].str.contains(regex_notification_task, flags=re.IGNORECASE, regex=True)]
+def _to_wall_time(series):
+    ''' Drops the timezone of a Europe/Paris datetime series, keeping the local wall time '''
+    return series.dt.tz_localize(None).to_numpy()
 
-            if df_ops.empty:
-                return pd.Series(data=[True], index=["suspended_mail_not_recontacted"])
 
-            else:
-                df_ops["date"] = df_ops["AP_AM_START_DATE"].dt.date
-                df_ops = df_ops.sort_values("AP_AM_START_DATE", ascending = False).drop_duplicates(subset = "date", keep = "first")
-                no_of_contacts = len(df_ops.index)
-                
-                df_last_contact = df_ops.loc[df_ops["AP_AM_START_DATE"] == df_ops["AP_AM_START_DATE"].max()]
-                df_last_contact.drop_duplicates(subset="AP_AM_START_DATE", inplace=True)
+def _add_business_days(wall_time, days):
+    ''' Vectorized equivalent of timestamp + days * BDay() on local wall times (NaT stays NaT)
+
+    A BDay step from a weekend day lands on the next business day, like a step
+    from the previous Friday: the weekend dates are rolled backward.
+    '''
+    dates = wall_time.astype("datetime64[D]")
+    valid = ~np.isnat(dates)
+
+    result = np.full(len(wall_time), np.datetime64("NaT"), dtype=wall_time.dtype)
+    target = np.busday_offset(dates[valid], np.broadcast_to(days, len(wall_time))[valid], roll="backward")
+    result[valid] = target.astype(wall_time.dtype) + (wall_time[valid] - dates[valid].astype(wall_time.dtype))
+    return result
+
 
-                if (no_of_contacts >= 3) & (pd.Timestamp.now(tz = 'Europe/Paris') > (df_last_contact["AP_AM_START_DATE"] + 3*BDay())).bool():
-                    return pd.Series(data=[True], index=["suspended_mail_not_recontacted"])
-                elif (no_of_contacts == 2) & (pd.Timestamp.now(tz = 'Europe/Paris') > (df_last_contact["AP_AM_START_DATE"] + 2*BDay())).bool():
-                    return pd.Series(data=[True], index=["suspended_mail_not_recontacted"])
-                elif (no_of_contacts == 1) & (pd.Timestamp.now(tz = 'Europe/Paris') > (df_last_contact["AP_AM_START_DATE"] + 1*BDay())).bool():
-                    return pd.Series(data=[True], index=["suspended_mail_not_recontacted"])
-                else:
-                    return pd.Series(data=[False],index=["suspended_mail_not_recontacted"])
+def _count_business_days(first, last):
+    ''' Vectorized equivalent of len(pd.date_range(first, last, freq=BDay())) on local wall times
 
-        df_operations = df_operations.groupby("AP_AM_RFC_NUMBER").apply(get_operations_contacted_by_mail_and_last_action)
-        
-        df = df.merge(df_operations, left_on="AP_SD_RFC_NUMBER", right_on = "AP_AM_RFC_NUMBER", how = "left", suffixes=(False, False))
+    The range is generated at the time of day of first, from first rolled forward to a
+    business day. Like date_range, last is rolled backward to a business day, keeping
+    its time of day, only when first was not rolled. The day of the end of the range
+    only counts when it is a business day reached at or after the time of first.
+    '''
+    first_dates = first.astype("datetime64[D]")
+    last_dates = last.astype("datetime64[D]")
+    valid = ~(np.isnat(first_dates) | np.isnat(last_dates))
 
-    if not df.empty:
-        df = df.loc[df["suspended_mail_not_recontacted"] == True]
-        df.drop(columns=["suspended_mail_not_recontacted"], inplace = True)
+    first, first_dates, last, last_dates = first[valid], first_dates[valid], last[valid], last_dates[valid]
+    start_dates = np.busday_offset(first_dates, 0, roll="forward")
+    end_dates = np.where(np.is_busday(first_dates), np.busday_offset(last_dates, 0, roll="backward"), last_dates)
+    end_day_included = np.is_busday(end_dates) & ((last - last_dates.astype(last.dtype)) >= (first - first_dates.astype(first.dtype)))
+
+    result = np.zeros(len(valid), dtype=np.int64)
+    result[valid] = np.maximum(np.busday_count(start_dates, end_dates) + end_day_included, 0)
+    return result
+
+
+def get_suspended_mail_not_recontacted(df):
+    assert isinstance(df, pd.DataFrame)
+    assert "C_NO_OF_CONTACTS" in df.columns
+
+    mask_status = (df["AP_SD_STATUS_ID"].isin([39, 42]))
+    df = df.loc[mask_status].reset_index(drop=True)
+
+    # the user is recontacted 1, 2 then 3 business days after the last notification
+    delay = df["C_NO_OF_CONTACTS"].clip(upper=3).to_numpy()
+    deadline = _add_business_days(_to_wall_time(df["C_LAST_CONTACT"]), delay)
+    now = data_schema.get_now().tz_localize(None).to_datetime64()
+
+    # tickets with actions but never notified are not recontacted either
+    mask_not_recontacted = (df["C_NO_OF_ACTIONS"] > 0).to_numpy() & ((df["C_NO_OF_CONTACTS"] == 0).to_numpy() | (now > deadline))
+    df = df.loc[mask_not_recontacted]
 
     assert isinstance(df, pd.DataFrame)
     return df
 
 
-def get_contacted_x_times(df, df_operations, no_of_min_contacts):
+def get_contacted_x_times(df, no_of_min_contacts):
     assert isinstance(df, pd.DataFrame)
-    assert isinstance(df_operations, pd.DataFrame)
     assert isinstance(no_of_min_contacts, int)
-
-    def get_operations_contacted_x_times(df_ops):
-        regex_notification_task = "Appel sortant utilisateur|Notification au demandeur|Relance vers l'utilisateur|Envoi de mail au demandeur"
-        df_ops = df_ops[df_ops["AP_AM_OPERATION_TYPE_NAME"].str.contains(regex_notification_task, flags=re.IGNORECASE, regex=True)]
-        df_ops["date"] = df_ops["AP_AM_START_DATE"].dt.date
-        df_ops = df_ops.sort_values("AP_AM_START_DATE", ascending = False).drop_duplicates(subset = "date", keep = "first")
-
-        no_of_contacts = len(df_ops)
-
-        if (no_of_contacts >= no_of_min_contacts):
-            first_contact_date = df_ops["AP_AM_START_DATE"].min()
-            last_contact_date = df_ops["AP_AM_START_DATE"].max()
-            bdays_since_creation_and_last_contact = len(pd.date_range(start = first_contact_date, end = last_contact_date, freq = BDay()))
-            if bdays_since_creation_and_last_contact >= 7:
-                return pd.Series(data=[True], index=["contacted_by_mail_x_times"])
-            else:
-                return pd.Series(data=[False], index=["contacted_by_mail_x_times"])
-        else:
-            return pd.Series(data=[False], index=["contacted_by_mail_x_times"])
+    assert "C_NO_OF_CONTACTS" in df.columns
 
     mask_status = (df["AP_SD_STATUS_ID"].isin([39,42]))
     mask_priority = (df["AP_SD_URGENCY_ID"] == 5)
-    df = df.loc[mask_status & mask_priority]
+    df = df.loc[mask_status & mask_priority].reset_index(drop=True)
 
-    if not df.empty:
-        df_operations = df_operations.loc[df_operations["AP_AM_RFC_NUMBER"].isin(df["AP_SD_RFC_NUMBER"])]
-        df_operations = df_operations.groupby("AP_AM_RFC_NUMBER").apply(get_operations_contacted_x_times)
-        df = df.merge(df_operations, left_on="AP_SD_RFC_NUMBER", right_on = "AP_AM_RFC_NUMBER", how = "left", suffixes=(False, False))
-
-    if not df.empty:
-        df = df.loc[df["contacted_by_mail_x_times"] == True]
-        df.drop(columns=["contacted_by_mail_x_times"], inplace = True)
+    bdays_between_first_and_last_contact = _count_business_days(_to_wall_time(df["C_FIRST_CONTACT"]),
+                                                                 _to_wall_time(df["C_LAST_CONTACT"]))
+    mask_contacted = (df["C_NO_OF_CONTACTS"] >= no_of_min_contacts).to_numpy() & (bdays_between_first_and_last_contact >= 7)
+    df = df.loc[mask_contacted]
 
     assert isinstance(df, pd.DataFrame)
     return df
@@ -96,27 +93,25 @@ def get_av_security_tickets(df):
     """
     assert isinstance(df, pd.DataFrame)
 
-    mask_ci = (df["AP_SD_CI_ID"].isin([9926, 8696]))
-    description_regex = "(anti)?virus|^vol.?$|pirat(é|e)|malware|(mc)?afee"
-    mask_description = (df["AP_SD_COMMENT"].str.contains(description_regex,
-                                                       regex=True,
-                                                       flags=re.IGNORECASE,
-                                                       na=False))
-
-    df_securite = df.loc[mask_ci | mask_description]
+    df_securite = df.loc[df["C_FLAG_SECURITY"]]
 
     assert isinstance(df_securite, pd.DataFrame)
     return df_securite
 
 
+def _get_vip_mask(df, vip_list):
+    mask_requestor = (df["REQUESTOR_LAST_NAME"].isin(vip_list))
+    mask_beneficiary = (df["AP_SD_RECIPIENT_LAST_NAME"].isin(vip_list))
+
+    return mask_requestor | mask_beneficiary
+
+
 def get_vip_tickets(df, vip_list):
     """ PURE FUNCTION
     """
     assert isinstance(df, pd.DataFrame)
 
-    mask_requestor = (df["REQUESTOR_LAST_NAME"].isin(vip_list))
-    mask_beneficiary = (df["AP_SD_RECIPIENT_LAST_NAME"].isin(vip_list))
-    df_vip = df.loc[mask_requestor | mask_beneficiary]
+    df_vip = df.loc[_get_vip_mask(df, vip_list)]
 
     assert isinstance(df_vip, pd.DataFrame)
     return df_vip
@@ -140,242 +135,117 @@ def get_industrial_tickets(df):
     """
     assert isinstance(df, pd.DataFrame)
 
-    industrial_ci = ["POSTES INDUSTRIELS_ENV", "Mustang_Mobilité_ENV"]
-    mask_ci = (df["AP_SD_CI_NAME"].isin(industrial_ci))
-    description_regex = "scada|tablette|conduite"
-    mask_description = (df["AP_SD_COMMENT"].str.contains(description_regex,
-                                                       regex=True,
-                                                       flags=re.IGNORECASE,
-                                                       na=False))
-
-    df_industrial = df.loc[mask_ci | mask_description]
+    df_industrial = df.loc[df["C_FLAG_INDUSTRIAL"]]
 
     assert isinstance(df_industrial, pd.DataFrame)
     return df_industrial
 
 
-def _assign_pts_per_day_since_creation(df):
-    """ 10/100/1000 pts base + 1/10/100/1000 pts/jour pour tickets en Normal/Sensible/Important/Majeur since creation date
-    """
-    assert isinstance(df, pd.DataFrame)
-    assert "C_TICKET_AGE" in df.columns
-    assert "C_TICKET_TYPE" in df.columns
-
-    df.loc[:,"C_POINTS"] = 0
-    df.loc[:,"C_POINTS_JUSTIFICATION"] = ""
-
-    mask_normal_urgency = (df["AP_SD_URGENCY_ID"] == 5)
-    mask_sensible_urgency = (df["AP_SD_URGENCY_ID"] == 3)
-    mask_important_urgency = (df["AP_SD_URGENCY_ID"] == 2)
-    mask_majeur_urgency = (df["AP_SD_URGENCY_ID"] == 1)
-
-    mask_incident = (df["C_TICKET_TYPE"] == 0)
-    mask_request = (df["C_TICKET_TYPE"] == 1)
-
-    df.loc[mask_normal_urgency & mask_incident, "C_POINTS"] = 1
-    df.loc[mask_normal_urgency & mask_request, "C_POINTS"] += df["C_TICKET_AGE"].dt.days * 1
-    df.loc[mask_normal_urgency & mask_incident, "C_POINTS"] += df["C_TICKET_AGE"].dt.days * 3
-    df.loc[mask_normal_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+1 pt/jour pour Demande-Normal depuis creation"
-    df.loc[mask_normal_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+3 pt/jour pour Incident-Normal depuis creation"
-
-    df.loc[mask_sensible_urgency & mask_request, "C_POINTS"] = 3
-    df.loc[mask_sensible_urgency & mask_incident, "C_POINTS"] = 10
-    df.loc[mask_sensible_urgency & mask_request, "C_POINTS"] += df["C_TICKET_AGE"].dt.days * 3
-    df.loc[mask_sensible_urgency & mask_incident, "C_POINTS"] += df["C_TICKET_AGE"].dt.days * 10
-    df.loc[mask_sensible_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "3 base + 3 pt/jour pour Demande-Sensible depuis creation"
-    df.loc[mask_sensible_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "10 base + 10 pt/jour pour Incident-Sensible depuis creation"
-
-    df.loc[mask_important_urgency & mask_request, "C_POINTS"] = 30
-    df.loc[mask_important_urgency & mask_incident, "C_POINTS"] = 100
-    df.loc[mask_important_urgency & mask_request, "C_POINTS"] += df["C_TICKET_AGE"].dt.days * 30
-    df.loc[mask_important_urgency & mask_incident, "C_POINTS"] += df["C_TICKET_AGE"].dt.days * 100
-    df.loc[mask_important_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "30 base + 30 pt/jour pour Demande-Important depuis creation"
-    df.loc[mask_important_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "100 base + 100 pt/jour pour Incident-Important depuis creation"
-
-    df.loc[mask_majeur_urgency & mask_request, "C_POINTS"] = 300
-    df.loc[mask_majeur_urgency & mask_incident, "C_POINTS"] = 1000
-    df.loc[mask_majeur_urgency & mask_request, "C_POINTS"] += df["C_TICKET_AGE"].dt.days * 300
-    df.loc[mask_majeur_urgency & mask_incident, "C_POINTS"] += df["C_TICKET_AGE"].dt.days * 1000
-    df.loc[mask_majeur_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "300 base + 300 pt/jour pour Demande-Majeur depuis creation"
-    df.loc[mask_majeur_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "1000 base + 1000 pt/jour pour Incident-Majeur depuis creation"
-
-    assert isinstance(df, pd.DataFrame)
-    return df
-
-
-def _assign_pts_per_day_since_last_action(df):
-    """ 10/100/1000 pts base + 1/10/100/1000 pts/jour pour tickets en Normal/Sensible/Important/Majeur since last action
-    """
-    assert isinstance(df, pd.DataFrame)
-    assert "C_TICKET_TYPE" in df.columns
-    assert "C_LAST_ACTION_DATE" in df.columns
-
-    df.loc[:,"C_POINTS"] = 0
-    df.loc[:,"C_POINTS_JUSTIFICATION"] = ""
-
-    mask_normal_urgency = (df["AP_SD_URGENCY_ID"] == 5)
-    mask_sensible_urgency = (df["AP_SD_URGENCY_ID"] == 3)
-    mask_important_urgency = (df["AP_SD_URGENCY_ID"] == 2)
-    mask_majeur_urgency = (df["AP_SD_URGENCY_ID"] == 1)
-
-    mask_incident = (df["C_TICKET_TYPE"] == 0)
-    mask_request = (df["C_TICKET_TYPE"] == 1)
-
-    df.loc[mask_normal_urgency & mask_request, "C_POINTS"] = df["C_LAST_ACTION_DATE"].dt.days
-    df.loc[mask_normal_urgency & mask_incident, "C_POINTS"] = df["C_LAST_ACTION_DATE"].dt.days * 3
-    df.loc[mask_normal_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+1 pt/jour pour Demande-Normal depuis dernière action"
-    df.loc[mask_normal_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+3 pt/jour pour Incident-Normal depuis dernière action"
-
-    df.loc[mask_sensible_urgency & mask_request, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 3
-    df.loc[mask_sensible_urgency & mask_incident, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 10
-    df.loc[mask_sensible_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+3 pt/jour pour Demande-Sensible depuis dernière action"
-    df.loc[mask_sensible_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+10 pt/jour pour Incident-Sensible depuis dernière action"
-
-    df.loc[mask_important_urgency & mask_request, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 30
-    df.loc[mask_important_urgency & mask_incident, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 100
-    df.loc[mask_important_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+30 pt/jour pour Demande-Important depuis dernière action"
-    df.loc[mask_important_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+100 pt/jour pour Incident-Important depuis dernière action"
-
-    df.loc[mask_majeur_urgency & mask_request, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 300
-    df.loc[mask_majeur_urgency & mask_incident, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 1000
-    df.loc[mask_majeur_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+300 pt/jour pour Demande-Majeur depuis dernière action"
-    df.loc[mask_majeur_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+1000 pt/jour pour Incident-Majeur depuis dernière action"
-
-    assert isinstance(df, pd.DataFrame)
-    return df
-
-
-def _assign_pts_per_day_not_suspended(df):
-    """ 10 pts/day for not suspended
-    """
-    assert isinstance(df, pd.DataFrame)
-    assert "C_TICKET_TYPE" in df.columns
-    assert "C_LAST_ACTION_DATE" in df.columns
-
-    df.loc[:,"C_POINTS"] = 0
-    df.loc[:,"C_POINTS_JUSTIFICATION"] = ""
-
-    df = df.loc[~df["AP_SD_STATUS_ID"].isin([5,20,39])]
-
-    mask_normal_urgency = (df["AP_SD_URGENCY_ID"] == 5)
-    mask_sensible_urgency = (df["AP_SD_URGENCY_ID"] == 3)
-    mask_important_urgency = (df["AP_SD_URGENCY_ID"] == 2)
-    mask_majeur_urgency = (df["AP_SD_URGENCY_ID"] == 1)
+######################################
+# TICKET SCORING
+######################################
 
-    mask_incident = (df["C_TICKET_TYPE"] == 0)
-    mask_request = (df["C_TICKET_TYPE"] == 1)
+# The score of a ticket is the sum of six rules, their points come from the rule
+# table of scoring_rules. The points of the first three rules depend on the
+# (urgency, ticket type) cell of the ticket, tickets outside the table get no
+# points from them.
 
-    df.loc[mask_normal_urgency & mask_request, "C_POINTS"] = df["C_LAST_ACTION_DATE"].dt.days * 10
-    df.loc[mask_normal_urgency & mask_incident, "C_POINTS"] = df["C_LAST_ACTION_DATE"].dt.days * 25
-    df.loc[mask_normal_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+10 pt/jour pour Demande-Normal non suspendu"
-    df.loc[mask_normal_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+25 pt/jour pour Incident-Normal non suspendu"
+# bits of C_POINTS_FLAGS
+POINTS_FLAG_NOT_SUSPENDED = 1
+POINTS_FLAG_SECURITY = 2
+POINTS_FLAG_VIP = 4
+POINTS_FLAG_INDUSTRIAL = 8
 
-    df.loc[mask_sensible_urgency & mask_request, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 25
-    df.loc[mask_sensible_urgency & mask_incident, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 50
-    df.loc[mask_sensible_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+25 pt/jour pour Demande-Sensible non suspendu"
-    df.loc[mask_sensible_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+50 pt/jour pour Incident-Sensible non suspendu"
-
-    df.loc[mask_important_urgency & mask_request, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 50
-    df.loc[mask_important_urgency & mask_incident, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 100
-    df.loc[mask_important_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+50 pt/jour pour Demande-Important non suspendu"
-    df.loc[mask_important_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+100 pt/jour pour Incident-Important non suspendu"
-
-    df.loc[mask_majeur_urgency & mask_request, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 300
-    df.loc[mask_majeur_urgency & mask_incident, "C_POINTS"] += df["C_LAST_ACTION_DATE"].dt.days * 1000
-    df.loc[mask_majeur_urgency & mask_request, "C_POINTS_JUSTIFICATION"] = "+300 pt/jour pour Demande-Majeur non suspendu"
-    df.loc[mask_majeur_urgency & mask_incident, "C_POINTS_JUSTIFICATION"] = "+1000 pt/jour pour Incident-Majeur non suspendu"
-
-    assert isinstance(df, pd.DataFrame)
-    return df
 
+def calculate_ticket_flow(df, df_operations):
+    ''' Scores the tickets, all the rules are evaluated in one pass over the columns
+
+    Rules (points from scoring_rules.json):
+        * base + pts/day since creation per (urgency, ticket type)
+        * pts/day since the last action per (urgency, ticket type)
+        * pts/day since the last action per (urgency, ticket type) if not suspended
+        * fixed pts for AV / security tickets
+        * base + pts/day since the last action for VIP tickets
+        * fixed pts for industrial workstations
+
+    A rule depending on a missing date gives no points.
+
+    Returns:
+        df: with the score C_POINTS, and C_POINTS_CELL / C_POINTS_FLAGS to rebuild
+            the justification of the rules at dispatch (see get_points_justification)
+    '''
+    from apollo.main import site_settings
 
-def _assign_pts_per_day_vip_tickets(df):
     assert isinstance(df, pd.DataFrame)
+    assert isinstance(df_operations, pd.DataFrame)
+    assert "C_TICKET_AGE" in df.columns
     assert "C_LAST_ACTION_DATE" in df.columns
+    assert "C_TICKET_TYPE" in df.columns
+    assert "C_FLAG_SECURITY" in df.columns
+
+    df = df.copy()
+    rules = scoring_rules.get_scoring_rules()
+
+    cell = rules.get_cell(df)
+    in_tables = (cell >= 0)
+    lookup = np.where(in_tables, cell, 0)
+
+    days_since_creation = df["C_TICKET_AGE"].dt.days.to_numpy(dtype=float)
+    days_since_last_action = df["C_LAST_ACTION_DATE"].dt.days.to_numpy(dtype=float)
+
+    mask_not_suspended = ~df["AP_SD_STATUS_ID"].isin(rules.suspended_status_ids).to_numpy()
+    mask_security = df["C_FLAG_SECURITY"].to_numpy()
+    mask_vip = _get_vip_mask(df, vip_list=site_settings.VIP_LIST).to_numpy()
+    mask_industrial = df["C_FLAG_INDUSTRIAL"].to_numpy()
+
+    points = [
+        np.where(in_tables, rules.creation_base[lookup] + rules.creation_per_day[lookup] * days_since_creation, 0),
+        np.where(in_tables, rules.last_action_per_day[lookup] * days_since_last_action, 0),
+        np.where(in_tables & mask_not_suspended, rules.not_suspended_per_day[lookup] * days_since_last_action, 0),
+        np.where(mask_security, rules.security_points, 0),
+        np.where(mask_vip, rules.vip_base + rules.vip_per_day * days_since_last_action, 0),
+        np.where(mask_industrial, rules.industrial_points, 0)
+    ]
 
-    df.loc[:, ("C_POINTS")] = 500
-    df.loc[:, ("C_POINTS")] += df["C_LAST_ACTION_DATE"].dt.days * 100
-
-    df.loc[:, ("C_POINTS_JUSTIFICATION")] = "1000 base + 100 pts/day ticket VIP depuis dernière action "
-
-    assert isinstance(df, pd.DataFrame)
-    return df
-
-
-def _assign_points_industrial_ticket(df):
-    assert isinstance(df, pd.DataFrame)
-
-    df.loc[:, ("C_POINTS")] = 500
-    df.loc[:, ("C_POINTS_JUSTIFICATION")] = "500 points pour poste industriel"
+    df["C_POINTS"] = np.nansum(points, axis=0).astype(int)
+    df["C_POINTS_CELL"] = cell.astype(np.int8)
+    df["C_POINTS_FLAGS"] = (mask_not_suspended * POINTS_FLAG_NOT_SUSPENDED
+                            | mask_security * POINTS_FLAG_SECURITY
+                            | mask_vip * POINTS_FLAG_VIP
+                            | mask_industrial * POINTS_FLAG_INDUSTRIAL).astype(np.int8)
 
     assert isinstance(df, pd.DataFrame)
     return df
 
 
-def calculate_ticket_flow(df, df_operations):
-    from apollo.main import site_settings
+def get_points_justification(df):
+    ''' Builds the justification text of the scores, meant for the rows sent to the client only
 
+    Returns:
+        series: " // rule 1 // rule 2 // ... // rule 6", an empty rule when it does not apply
+    '''
     assert isinstance(df, pd.DataFrame)
-    assert isinstance(df_operations, pd.DataFrame)
-
-    def _append_points(df1, df2):
-        assert "C_POINTS" in df1.columns
-        assert "C_POINTS_JUSTIFICATION" in df1.columns
-        assert "C_POINTS" in df2.columns
-        assert "C_POINTS_JUSTIFICATION" in df2.columns
-
-        df2 = df2.loc[:, ["AP_SD_RFC_NUMBER", "C_POINTS", "C_POINTS_JUSTIFICATION"]]
-        df1 = df1.join(df2.set_index("AP_SD_RFC_NUMBER"),
-                       on="AP_SD_RFC_NUMBER",
-                       how="left",
-                       rsuffix="_df2")
-
-        df1["C_POINTS_df2"].fillna(0, inplace=True)
-        df1.loc[:, ("C_POINTS")] += df1["C_POINTS_df2"]
+    assert "C_POINTS_CELL" in df.columns
+    assert "C_POINTS_FLAGS" in df.columns
 
-        df1["C_POINTS_JUSTIFICATION_df2"].fillna("", inplace=True)
-        df1.loc[:, ("C_POINTS_JUSTIFICATION")] = df1["C_POINTS_JUSTIFICATION"].str.cat(df1["C_POINTS_JUSTIFICATION_df2"], sep=" // ")
-        del df1["C_POINTS_df2"]
-        del df1["C_POINTS_JUSTIFICATION_df2"]
+    rules = scoring_rules.get_scoring_rules()
+    cell = df["C_POINTS_CELL"].to_numpy()
+    flags = df["C_POINTS_FLAGS"].to_numpy()
+    not_suspended_cell = np.where(flags & POINTS_FLAG_NOT_SUSPENDED, cell, -1)
 
-        return df1
-
-    df_points = df.copy()
-    df_points["C_POINTS"] = 0
-    df_points["C_POINTS_JUSTIFICATION"] = ""
-
-    # 10/100/1000 pts base + 10/100/1000 pts/jour pour tickets en Sensible/Important/Majeur since creation date
-    points_per_day = _assign_pts_per_day_since_creation(df)
-    df_points = _append_points(df_points, points_per_day)
-
-    # 10/100/1000 pts base + 10/100/1000 pts/jour pour tickets en Sensible/Important/Majeur since last action
-    points_since_last_action = _assign_pts_per_day_since_last_action(df)
-    df_points = _append_points(df_points, points_since_last_action)
-
-    # 10pts/day for not suspended
-    points_not_suspended = _assign_pts_per_day_not_suspended(df)
-    df_points = _append_points(df_points, points_not_suspended)
-
-    # 1000 points AV / Security tickets
-    points_security = get_av_security_tickets(df)
-    assert "C_LAST_ACTION_DATE" in points_security
-    assert "C_TICKET_AGE" in points_security
-    points_security.loc[:, ("C_POINTS")] = 1000
-    points_security.loc[:, ("C_POINTS_JUSTIFICATION")] = "+1000 pts ticket sécurité "
-    df_points = _append_points(df_points, points_security)
-
-    # 1000 points VIP tickets
-    points_vip_tickets = _assign_pts_per_day_vip_tickets(get_vip_tickets(df=df,vip_list = site_settings.VIP_LIST))
-    df_points = _append_points(df_points, points_vip_tickets)
-
-    # 500 for poste industriel
-    points_poste_industriel = _assign_points_industrial_ticket(get_industrial_tickets(df = df))
-    df_points = _append_points(df_points, points_poste_industriel)
+    rules = [
+        rules.creation_justifications[cell],
+        rules.last_action_justifications[cell],
+        rules.not_suspended_justifications[not_suspended_cell],
+        np.where(flags & POINTS_FLAG_SECURITY, rules.security_justification, ""),
+        np.where(flags & POINTS_FLAG_VIP, rules.vip_justification, ""),
+        np.where(flags & POINTS_FLAG_INDUSTRIAL, rules.industrial_justification, "")
+    ]
 
-    df_points["C_POINTS"] = df_points["C_POINTS"].astype(int)
+    result = pd.Series([" // " + " // ".join(x) for x in zip(*rules)], index=df.index, dtype=object)
 
-    assert isinstance(df_points, pd.DataFrame)
-    return df_points
+    assert isinstance(result, pd.Series)
+    return result
 
 
 def get_not_suspended_incidents(df):
@@ -433,44 +303,26 @@ def get_ticket_flow(df, inter_type = None, suspended = None):
         return df
 
 
-def get_suspended_gt_x(df, df_operations, inter_type_filter):
+def get_suspended_gt_x(df, inter_type_filter):
     assert isinstance(df, pd.DataFrame)
-    assert isinstance(df_operations, pd.DataFrame)
     assert "AP_INTERVENTION_TYPE" in df.columns
-
-    def get_delta_since_suspended(df_ops):
-        suspension_date = df_ops.loc[df_ops["AP_AM_ACTION_TYPE_ID"] == 5, "AP_AM_START_DATE"].max()
-        if inter_type_filter == "hotline":
-            if (suspension_date + 1*BDay()) < pd.Timestamp.now(tz = 'Europe/Paris'):
-                return pd.Series(data=[True], index=["suspended_gt_x"])
-            else:
-                return pd.Series(data=[False], index=["suspended_gt_x"])
-
-        else:
-            if (suspension_date + 5*BDay()) < pd.Timestamp.now(tz = 'Europe/Paris'):
-                return pd.Series(data=[True], index=["suspended_gt_x"])
-            else:
-                return pd.Series(data=[False], index=["suspended_gt_x"])
+    assert "C_LAST_SUSPENSION_DATE" in df.columns
 
     df = df.loc[df["AP_SD_STATUS_ID"].isin([5,20])]
     if inter_type_filter == "hotline":
         df = df.loc[df["AP_INTERVENTION_TYPE"].isin([2])]
     else:
         df = df.loc[df["AP_INTERVENTION_TYPE"].isin([3,4,5,6,7,8,9,10,11,12,13,14,15,16])]
-    
+    df = df.reset_index(drop=True)
 
-    if not df.empty:
-        df_operations = df_operations.loc[df_operations["AP_AM_RFC_NUMBER"].isin(df["AP_SD_RFC_NUMBER"])]
-        df_operations = df_operations.groupby("AP_AM_RFC_NUMBER").apply(get_delta_since_suspended)
-        df = df.merge(df_operations, left_on="AP_SD_RFC_NUMBER", right_on = "AP_AM_RFC_NUMBER", how = "left", suffixes=(False, False))
-        df = df.loc[df["suspended_gt_x"] == True]
-        df.drop(columns=["suspended_gt_x"], inplace = True)
+    delay = 1 if inter_type_filter == "hotline" else 5
+    deadline = _add_business_days(_to_wall_time(df["C_LAST_SUSPENSION_DATE"]), delay)
+    now = data_schema.get_now().tz_localize(None).to_datetime64()
 
-        assert isinstance(df, pd.DataFrame)
-        return df
-    else:
-        assert isinstance(df, pd.DataFrame)
-        return df
+    df = df.loc[deadline < now]
+
+    assert isinstance(df, pd.DataFrame)
+    return df
 
 
 def get_tickets_software_install(df):
@@ -513,14 +365,7 @@ def get_digipass_tickets(df):
     """
     assert isinstance(df, pd.DataFrame)
 
-    digipass_tickets = ["DIGIPASS", "TELETRAVAIL_ENV", "Azure.Microsoft"]
-    mask_ci = (df["AP_SD_CI_NAME"].isin(digipass_tickets))
-
-    regex_digipass = "big.?ip|vpn"
-    mask_regex = (df["AP_SD_COMMENT"].str.contains(regex_digipass, flags=re.IGNORECASE, regex=True))
-
-
-    df_digipass = df.loc[mask_ci | mask_regex]
+    df_digipass = df.loc[df["C_FLAG_DIGIPASS"]]
 
     assert isinstance(df_digipass, pd.DataFrame)
     return df_digipass
@@ -566,60 +411,32 @@ def get_telephone_tickets(df):
     return df_telephone
 
 
-def get_under_observation_tickets(df, df_operations):
+def get_under_observation_tickets(df):
     """ PURE FUNCTION
     """
     assert isinstance(df, pd.DataFrame)
-    assert isinstance(df_operations, pd.DataFrame)
-
-    mask_action_type = (df_operations["AP_AM_ACTION_TYPE_ID"].isin([65, 108]))
-    mask_not_null = (~df_operations["AP_AM_DESCRIPTION"].isnull())
+    assert "C_UNDER_OBSERVATION" in df.columns
 
-    filter_actions = df_operations.loc[mask_action_type & mask_not_null]
-    mask_tagp_match = (filter_actions["AP_AM_DESCRIPTION"].str.contains("#tagp# sousobservation"))
-    filter_under_observation = filter_actions.loc[mask_tagp_match]["AP_AM_REQUEST_ID"].unique()
-
-    df = df.loc[df["AP_SD_REQUEST_ID"].isin(filter_under_observation)]
+    df = df.loc[df["C_UNDER_OBSERVATION"]]
 
     assert isinstance(df, pd.DataFrame)
     return df
 
 
-def get_rdv_date_state(df, df_operations):
+def get_rdv_date_state(df):
     """ PURE FUNCTION
+    Needs the C_RDV_SET / C_RDV_DATE columns added by feature_engineering.join_request_features.
     """
     assert isinstance(df, pd.DataFrame)
-    assert isinstance(df_operations, pd.DataFrame)
+    assert "C_RDV_DATE" in df.columns
 
-    mask_action_type = (df_operations["AP_AM_ACTION_TYPE_ID"].isin([65, 108]))
-    mask_not_null = (~df_operations["AP_AM_DESCRIPTION"].isnull())
-
-    filter_actions = df_operations.loc[mask_action_type & mask_not_null]
-    mask_tagp_match = (filter_actions["AP_AM_DESCRIPTION"].str.contains("#tagp# rdv:"))
-    filter_rdv_present = filter_actions.loc[mask_tagp_match, ("AP_AM_REQUEST_ID","AP_AM_DESCRIPTION")]
+    now = data_schema.get_now()
+    mask_nul_rdv = df["C_RDV_DATE"].isnull()
 
     df["C_RDV_STATE"] = "Pas de RDV"
-    if not filter_rdv_present.empty:
-        filter_rdv_present["C_RDV_DATE"] = filter_rdv_present["AP_AM_DESCRIPTION"].str.extract(r'((?<=:)[0-9]{2}.[0-9]{2}.[0-9]{4})', expand = False)
-        print(filter_rdv_present)
-        filter_rdv_present["C_RDV_DATE"] = pd.to_datetime(filter_rdv_present["C_RDV_DATE"], errors = "coerce", format = "%d/%m/%Y", utc = True)
-        filter_rdv_present["C_RDV_DATE"] = filter_rdv_present["C_RDV_DATE"].dt.tz_convert('Europe/Paris')
-        filter_rdv_present = filter_rdv_present.sort_values(["AP_AM_REQUEST_ID", "C_RDV_DATE"], ascending = False) \
-                                                .drop_duplicates(subset = "AP_AM_REQUEST_ID", keep = "first")
-
-        df = df.merge(filter_rdv_present, left_on="AP_SD_REQUEST_ID", right_on = "AP_AM_REQUEST_ID", how = "left", suffixes=(False, False))   
-     
-        mask_nul_rdv = df["C_RDV_DATE"].isnull()
-        mask_rdv_set = df["AP_SD_REQUEST_ID"].isin(filter_rdv_present["AP_AM_REQUEST_ID"])
-        df.loc[(mask_nul_rdv & mask_rdv_set), ("C_RDV_STATE")] = "RDV - date invalide"
-
-        mask_rdv_en_cours = (df["C_RDV_DATE"] >= (pd.Timestamp.now(tz = 'Europe/Paris')))
-        mask_rdv_en_retard = (df["C_RDV_DATE"] <= (pd.Timestamp.now(tz = 'Europe/Paris')))
-        df.loc[(~mask_nul_rdv & mask_rdv_en_cours), ("C_RDV_STATE")] = "RDV - en cours"
-        df.loc[(~mask_nul_rdv & mask_rdv_en_retard), ("C_RDV_STATE")] = "RDV - en retard"
-
-    else:
-        df["C_RDV_DATE"] = ""    
+    df.loc[(mask_nul_rdv & df["C_RDV_SET"]), ("C_RDV_STATE")] = "RDV - date invalide"
+    df.loc[(~mask_nul_rdv & (df["C_RDV_DATE"] > now)), ("C_RDV_STATE")] = "RDV - en cours"
+    df.loc[(~mask_nul_rdv & (df["C_RDV_DATE"] <= now)), ("C_RDV_STATE")] = "RDV - en retard"
 
     assert isinstance(df, pd.DataFrame)
     return df
@@ -662,7 +479,7 @@ def get_tickets_by_expiration_time_table(df):
 
     df = df.loc[~df["AP_SD_STATUS_ID"].isin([5,20,39,42])]
 
-    df = df.loc[df["AP_SD_MAX_RESOLUTION_DATE"] > pd.Timestamp.now(tz = 'Europe/Paris')]
+    df = df.loc[df["AP_SD_MAX_RESOLUTION_DATE"] > data_schema.get_now()]
     df = df.loc[:,("AP_SD_RFC_NUMBER", "AP_TYPE_FR", "AP_SD_RECIPIENT_LOCATION_RH", "AP_AM_DONE_BY_OPERATOR_NAME", "AP_SD_MAX_RESOLUTION_DATE")]
     df.sort_values(by="AP_SD_MAX_RESOLUTION_DATE", inplace = True)
     df.loc[:,"AP_SD_MAX_RESOLUTION_DATE"] = df["AP_SD_MAX_RESOLUTION_DATE"].dt.strftime("%d/%m/%y %H:%M")
@@ -848,8 +665,9 @@ def get_rdv_dates(df):
     print(df.columns)
     print(df.info())
     df["AP_SD_RECIPIENT_LOCATION_RH"] = df["AP_SD_RECIPIENT_LOCATION_RH"].astype(str)
-    df.loc[:,"TITLE"] = df["AP_SD_RFC_NUMBER"] + " - " + \
-                        df["AP_SD_RECIPIENT_LAST_NAME"] + ", " + \
+    # the Arrow backed strings cannot be concatenated before pandas 2
+    df.loc[:,"TITLE"] = df["AP_SD_RFC_NUMBER"].astype(object) + " - " + \
+                        df["AP_SD_RECIPIENT_LAST_NAME"].astype(object) + ", " + \
                         df["AP_SD_RECIPIENT_LOCATION_RH"] + " - " + \
                         df["AP_TYPE_FR"]
 
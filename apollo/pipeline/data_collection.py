@@ -1,22 +1,522 @@
+import asyncio
 import os
+import threading
 import time
-from datetime import datetime
 import uuid
-from typing import Callable, Tuple, Union
+from typing import Any, Callable, Dict, List, Tuple, Union
 
+import numpy as np
 import pandas as pd
 from fastapi.logger import logger as log
 from pymemcache.client.base import Client
 from sqlalchemy.engine.base import Engine
-import asyncio
+from sqlalchemy.sql import bindparam, text
+
+from apollo.pipeline.snapshot_store import (export_shared_snapshot, get_snapshot_store,
+                                            has_shared_snapshot, load_shared_snapshot)
 
 current_working_directory = os.getcwd()
 
-async def get_requests(engine: Callable[[], Engine], memcached_client: Client, lock) -> Tuple[pd.DataFrame, str]:
-    ''' Creates a connexion with SPOT SQL server and executes query
+###############################
+# SNAPSHOT CACHE KEYS
+###############################
+
+# Each dataset (SPOT_requests, SPOT_requests_operations) is stored as:
+#   * <dataset>_<uuid>: the dataframe of one published version, in the snapshot store
+#   * <dataset>_current: pointer to the published version {"uuid", "fence", "published_at", "rows"}
+#   * <dataset>_lease: fencing token of the process currently refreshing the dataset
+#   * <dataset>_fence: counter used to issue the fencing tokens
+# Everything but the dataframes lives in memcached.
+#
+# A version older than CACHE_EXPIRE is stale: one process takes the lease and
+# refreshes it while every reader keeps getting the previous version. The lease
+# expires on its own if the loader crashes, and a loader whose lease was taken over
+# cannot overwrite a version published with a newer token.
+
+REQUESTS_DATASET: str = "SPOT_requests"
+TASKS_DATASET: str = "SPOT_requests_operations"
+
+LEASE_TTL: int = 300
+# a released lease expires after this, instead of being deleted
+RELEASED_LEASE_TTL: int = 1
+STALE_SNAPSHOT_TTL: int = 24 * 60 * 60
+COLD_CACHE_POLL_INTERVAL: float = 0.5
+
+###############################
+
+
+def _acquire_lease(memcached_client: Client, dataset: str) -> Union[int, None]:
+    ''' Tries to become the single process refreshing the dataset
+
+    Returns:
+        the fencing token if the lease was acquired, None if another process holds it
+    '''
+    memcached_client.add("{}_fence".format(dataset), 0, noreply = False)
+    token: int = memcached_client.incr("{}_fence".format(dataset), 1)
+
+    if memcached_client.add("{}_lease".format(dataset), token, LEASE_TTL, noreply = False):
+        return token
+
+    return None
+
+
+def _release_lease(memcached_client: Client, dataset: str, token: int) -> None:
+    # a get then a delete could remove the lease of the next holder if ours expired in
+    # between: the lease is only shortened, and only while it still holds our token
+    lease, cas_token = memcached_client.gets("{}_lease".format(dataset))
+    if lease == token:
+        memcached_client.cas("{}_lease".format(dataset), token, cas_token, RELEASED_LEASE_TTL, noreply = False)
+
+
+def _publish(memcached_client: Client, dataset: str, token: int, result: pd.DataFrame) -> Union[str, None]:
+    ''' Stores a new version of the dataset and swaps the current pointer to it
+
+    Returns:
+        the uuid of the published version, None if a newer token already published
+    '''
+    data_uuid = str(uuid.uuid4())
+    get_snapshot_store().save(memcached_client, "{}_{}".format(dataset, data_uuid), result, STALE_SNAPSHOT_TTL)
+
+    pointer: Dict[str, Union[str, int, float]] = {
+        "uuid": data_uuid,
+        "fence": token,
+        "published_at": time.time(),
+        "rows": len(result.index)
+    }
+
+    while True:
+        current, cas_token = memcached_client.gets("{}_current".format(dataset))
+        if current is not None and current["fence"] > token:
+            log.info("{} - refresh with token {} superseded by token {}".format(dataset, token, current["fence"]))
+            return None
+
+        if cas_token is None:
+            stored = memcached_client.add("{}_current".format(dataset), pointer, noreply = False)
+        else:
+            stored = memcached_client.cas("{}_current".format(dataset), pointer, cas_token, noreply = False)
+
+        if stored:
+            log.info("{} saved to cache - uuid {}".format(dataset, data_uuid))
+            return data_uuid
+
+
+def _refresh(memcached_client: Client, dataset: str, loader: Callable[[Client], pd.DataFrame], token: int) -> Union[Tuple[pd.DataFrame, str], None]:
+    try:
+        result: pd.DataFrame = loader(memcached_client)
+        data_uuid = _publish(memcached_client, dataset, token, result)
+    finally:
+        _release_lease(memcached_client, dataset, token)
+
+    if data_uuid is None:
+        return None
+
+    return (result, data_uuid)
+
+
+def _refresh_in_background(memcached_client: Client, dataset: str, loader: Callable[[Client], pd.DataFrame], token: int) -> None:
+    # pymemcache clients are not thread safe, the refresh thread gets its own connexion
+    thread_client = Client(memcached_client.server, serde = memcached_client.serde)
+    try:
+        _refresh(thread_client, dataset, loader, token)
+    except Exception as error:
+        log.error("{} - background refresh failed: {}".format(dataset, error))
+    finally:
+        thread_client.close()
+
+
+def _read_current(memcached_client: Client, dataset: str, columns: Union[List[str], None] = None) -> Tuple[Union[pd.DataFrame, None], Union[Dict, None]]:
+    current: Union[Dict, None] = memcached_client.get("{}_current".format(dataset))
+    if current is None:
+        return (None, None)
+
+    key = "{}_{}".format(dataset, current["uuid"])
+    result: Union[pd.DataFrame, None] = load_shared_snapshot(key, columns)
+    if result is None:
+        result = get_snapshot_store().load(memcached_client, key, columns)
+
+    return (result, current)
+
+
+def get_published_version(memcached_client: Client, dataset: str) -> Union[Dict, None]:
+    ''' Returns the pointer of the published version of the dataset, None if nothing is published '''
+    return memcached_client.get("{}_current".format(dataset))
+
+
+def share_published_version(memcached_client: Client, dataset: str) -> None:
+    ''' Exports the published version of the dataset to shared memory for the local workers '''
+    current = get_published_version(memcached_client, dataset)
+    if current is None or has_shared_snapshot("{}_{}".format(dataset, current["uuid"])):
+        return
+
+    result = get_snapshot_store().load(memcached_client, "{}_{}".format(dataset, current["uuid"]))
+    if result is not None:
+        export_shared_snapshot(dataset, current["uuid"], result)
+
+
+def refresh_dataset(dataset: str, loader: Callable[[Client], pd.DataFrame], memcached_client: Client) -> Union[Dict, None]:
+    ''' Loads and publishes a new version of the dataset now, whatever the age of the current one
+
+    Returns:
+        the pointer of the new version, None if another process holds the lease
+        or published a newer version in the meantime
+    '''
+    token = _acquire_lease(memcached_client, dataset)
+    if token is None:
+        log.info("{} - refresh skipped, lease held by another process".format(dataset))
+        return None
+
+    if _refresh(memcached_client, dataset, loader, token) is None:
+        return None
+
+    return get_published_version(memcached_client, dataset)
+
+
+###############################
+# SNAPSHOT VERSIONS
+###############################
+
+# The flows run in the ProcessPoolExecutor workers. Before submitting one, the API
+# process awaits get_snapshot_versions: both datasets are checked (and loaded on a
+# cold cache) concurrently in threads, without blocking its event loop, and exported
+# to shared memory. The worker then only maps the versions it was given with
+# load_dataset_version, it never queries SPOT nor runs an event loop.
+
+TESTING_VERSION: str = "123"
+TESTING_EXPORTS: Dict[str, str] = {
+    REQUESTS_DATASET: "SD_REQUEST_testing.csv",
+    TASKS_DATASET: "AM_ACTION_testing.csv"
+}
+
+_thread_local = threading.local()
+
+
+def _get_thread_client(memcached_client_factory: Callable[[], Client]) -> Client:
+    # pymemcache clients are not thread safe, each thread of the default executor keeps its own
+    memcached_client: Union[Client, None] = getattr(_thread_local, "memcached_client", None)
+    if memcached_client is None:
+        memcached_client = memcached_client_factory()
+        _thread_local.memcached_client = memcached_client
+
+    return memcached_client
+
+
+def _ensure_published(dataset: str, loader: Callable[[Client], pd.DataFrame],
+                      memcached_client_factory: Callable[[], Client]) -> Union[str, None]:
+    ''' Returns the uuid of the published version, loading it on a cold cache
+
+    Returns None when another process holds the lease of a cold cache, to poll again.
+    '''
+    from apollo.main import site_settings
+
+    memcached_client = _get_thread_client(memcached_client_factory)
+    current = get_published_version(memcached_client, dataset)
+
+    if current is None:
+        token = _acquire_lease(memcached_client, dataset)
+        if token is None or _refresh(memcached_client, dataset, loader, token) is None:
+            return None
+        current = get_published_version(memcached_client, dataset)
+
+    elif time.time() - current["published_at"] > site_settings.CACHE_EXPIRE:
+        token = _acquire_lease(memcached_client, dataset)
+        if token is not None:
+            log.info("{} - stale, refreshing in background with token {}".format(dataset, token))
+            threading.Thread(target = _refresh_in_background,
+                            args = (memcached_client, dataset, loader, token),
+                            daemon = True).start()
+
+    share_published_version(memcached_client, dataset)
+    return current["uuid"]
+
+
+async def get_published_uuid(dataset: str, loader: Callable[[Client], pd.DataFrame],
+                             memcached_client_factory: Callable[[], Client]) -> str:
+    loop = asyncio.get_event_loop()
+
+    while True:
+        data_uuid = await loop.run_in_executor(None, _ensure_published, dataset, loader, memcached_client_factory)
+        if data_uuid is not None:
+            return data_uuid
+
+        await asyncio.sleep(COLD_CACHE_POLL_INTERVAL)
+
+
+async def get_snapshot_versions(engine: Callable[[], Engine], memcached_client_factory: Callable[[], Client]) -> Dict[str, str]:
+    ''' Returns the uuids of the SD_REQUEST / AM_ACTION versions to serve, for load_dataset_version
 
     Args:
         engine: the function which returns the sqlalchemy connexion
+        memcached_client_factory: creates the memcached clients of the threads
+
+    Returns:
+        {dataset: uuid}
+    '''
+    from apollo.main import site_settings
+
+    if site_settings.TESTING:
+        return {REQUESTS_DATASET: TESTING_VERSION, TASKS_DATASET: TESTING_VERSION}
+
+    requests_uuid, tasks_uuid = await asyncio.gather(
+        get_published_uuid(REQUESTS_DATASET, lambda client: _load_requests(engine, client), memcached_client_factory),
+        get_published_uuid(TASKS_DATASET, lambda client: _load_tasks(engine, client), memcached_client_factory))
+
+    return {REQUESTS_DATASET: requests_uuid, TASKS_DATASET: tasks_uuid}
+
+
+def load_dataset_version(memcached_client: Client, dataset: str, data_uuid: Union[str, None],
+                         columns: Union[List[str], None] = None) -> Tuple[pd.DataFrame, str]:
+    ''' Loads a version of the dataset, from shared memory when it was exported
+
+    Args:
+        memcached_client: the memcached client holding the published versions
+        dataset: REQUESTS_DATASET or TASKS_DATASET
+        data_uuid: the version returned by get_snapshot_versions, None for the current one
+        columns: the SPOT columns to load, all of them if None
+
+    Returns:
+        (dataframe, uuid of the version). The current version is returned if the
+        requested one was pruned in the meantime.
+    '''
+    from apollo.main import site_settings
+
+    if site_settings.TESTING:
+        log.info("using local {} testing solution".format(dataset))
+        result: pd.DataFrame = pd.read_csv(os.path.join(current_working_directory, "db", TESTING_EXPORTS[dataset]), sep = ";")
+        return (result, TESTING_VERSION)
+
+    if data_uuid is not None:
+        key = "{}_{}".format(dataset, data_uuid)
+        result = load_shared_snapshot(key, columns)
+        if result is None:
+            result = get_snapshot_store().load(memcached_client, key, columns)
+        if result is not None:
+            return (result, data_uuid)
+
+    result, current = _read_current(memcached_client, dataset, columns)
+    if result is None:
+        raise RuntimeError("{} - no published version".format(dataset))
+
+    return (result, current["uuid"])
+
+
+###############################
+# CHUNKED TYPED READS
+###############################
+
+# The SPOT results are fetched from the cursor SPOT_CHUNK_SIZE rows at a time and each
+# chunk is converted to its final dtypes before the next one is fetched, so only the
+# Python objects of one chunk are alive at a time:
+#   * "datetime": datetime64, the SPOT dates are naive UTC
+#   * "Int64": nullable integer, for the ids which can be NULL
+#   * "category": the names and types repeated on every row
+# The categorical columns of the chunks are given the same categories before being
+# concatenated, pd.concat would fall back to object columns otherwise.
+
+DEFAULT_CHUNK_SIZE: int = 20000
+
+
+def _apply_dtypes(df: pd.DataFrame, dtypes: Dict[str, str]) -> pd.DataFrame:
+    for column, dtype in dtypes.items():
+        if column not in df.columns:
+            continue
+
+        if dtype == "datetime":
+            df[column] = pd.to_datetime(df[column], errors = "coerce")
+        else:
+            df[column] = df[column].astype(dtype)
+
+    return df
+
+
+def _concat_typed(frames: List[pd.DataFrame]) -> pd.DataFrame:
+    ''' Concatenates the frames, keeping the columns categorical in all of them as categories '''
+    if len(frames) == 1:
+        return frames[0]
+
+    for column in frames[0].columns:
+        if not all(column in x.columns and isinstance(x[column].dtype, pd.CategoricalDtype) for x in frames):
+            continue
+
+        categories = pd.Index(np.concatenate([x[column].cat.categories.astype(object) for x in frames])).unique()
+        for x in frames:
+            x[column] = x[column].cat.set_categories(categories)
+
+    return pd.concat(frames, ignore_index = True)
+
+
+def _read_sql_typed(query: Any, connection, dtypes: Dict[str, str], params: Union[Dict[str, Any], None] = None) -> pd.DataFrame:
+    ''' pd.read_sql, fetching the rows by chunks converted to dtypes as they arrive '''
+    from apollo.main import site_settings
+
+    chunk_size: int = getattr(site_settings, "SPOT_CHUNK_SIZE", DEFAULT_CHUNK_SIZE)
+
+    chunks: List[pd.DataFrame] = [
+        _apply_dtypes(chunk, dtypes)
+        for chunk in pd.read_sql(query, con = connection.execution_options(stream_results = True),
+                                 params = params, chunksize = chunk_size)
+    ]
+    # read_sql already yields one empty chunk when there are no rows, never query SPOT again
+    if not chunks:
+        return _apply_dtypes(pd.DataFrame(columns = list(dtypes)), dtypes)
+
+    return _concat_typed(chunks)
+
+###############################
+
+
+###############################
+# INCREMENTAL SYNC
+###############################
+
+# above this number of requests entering the open set, a full reload is cheaper
+MAX_NEW_REQUESTS_INCREMENTAL: int = 1000
+
+
+def _load_incremental(connection, previous: pd.DataFrame, table: str, key: str,
+                      select_sql: str, filter_sql: str, open_ids_sql: str,
+                      dtypes: Union[Dict[str, str], None] = None) -> Union[pd.DataFrame, None]:
+    ''' Fetches the rows updated since the previous pull and upserts them into it
+
+    Only the rows whose LAST_UPDATE is past the watermark of the previous pull are fetched,
+    plus every row of the requests which entered the open set since. Requests which left
+    the open set are dropped. Deleted rows are only removed by a full reload.
+
+    Args:
+        connection: the SPOT connexion
+        previous: the previous pull of the dataset
+        table: the SPOT table holding LAST_UPDATE and REQUEST_ID (SD_REQUEST or AM_ACTION)
+        key: the unique id of the rows of the dataset
+        select_sql, filter_sql: the SELECT ... FROM and WHERE parts of the full query
+        open_ids_sql: the query returning the REQUEST_ID of the open set
+        dtypes: the dtypes of the fetched rows, see _read_sql_typed
+
+    Returns:
+        the merged dataframe, None if a full reload is needed
+    '''
+    watermark = pd.to_datetime(previous["LAST_UPDATE"], errors = "coerce").max()
+    if pd.isnull(watermark):
+        return None
+
+    open_ids = pd.read_sql(open_ids_sql, con = connection)["REQUEST_ID"]
+    new_ids = [int(x) for x in set(open_ids) - set(previous["REQUEST_ID"])]
+    if len(new_ids) > MAX_NEW_REQUESTS_INCREMENTAL:
+        return None
+
+    delta_sql = select_sql + """
+            WHERE (""" + filter_sql + """) AND
+                ({0}.LAST_UPDATE >= :watermark""".format(table)
+    params: Dict[str, Any] = {"watermark": watermark.to_pydatetime()}
+
+    if new_ids:
+        delta_sql += " OR {0}.REQUEST_ID IN :new_ids)".format(table)
+        query = text(delta_sql).bindparams(bindparam("new_ids", expanding = True))
+        params["new_ids"] = new_ids
+    else:
+        delta_sql += ")"
+        query = text(delta_sql)
+
+    delta: pd.DataFrame = _read_sql_typed(query, connection, dtypes or {}, params = params)
+
+    result = previous.loc[previous["REQUEST_ID"].isin(open_ids)].copy()
+    result = _concat_typed([result, delta])
+    result = result.drop_duplicates(subset = key, keep = "last").reset_index(drop = True)
+
+    log.info("{} - incremental sync: {} rows fetched, {} new requests, {} rows in total".format(
+        table, len(delta.index), len(new_ids), len(result.index)))
+
+    return result
+
+
+REQUESTS_SELECT_SQL: str = '''SELECT TOP (1000) [SD_REQUEST].[REQUEST_ID]
+                ,[SD_REQUEST].[PARENT_REQUEST_ID]
+                ,[SD_REQUEST].[RFC_NUMBER]
+                ,[SD_REQUEST].[CREATION_DATE_UT]
+                ,[SD_REQUEST].[SUBMIT_DATE_UT]
+                ,[SD_REQUEST].[END_DATE_UT]
+                ,[SD_REQUEST].[MAX_RESOLUTION_DATE_UT]
+                ,[SD_REQUEST].[LAST_UPDATE]
+                ,[SD_REQUEST].[SUBMITTED_BY]
+                ,[SUBMITTED_BY_NAME].[LAST_NAME] AS SUBMITTED_BY_LAST_NAME
+                ,[SD_REQUEST].[REQUESTOR_ID]
+                ,[REQUESTOR_NAME].[LAST_NAME] AS REQUESTOR_LAST_NAME
+                ,[REQUESTOR_LOCATION].[AVAILABLE_FIELD_6] AS REQUESTOR_LOCATION_RH
+                ,[SD_REQUEST].[LOCATION_ID]
+                ,[SD_REQUEST].[REQUESTOR_PHONE]
+                ,[SD_REQUEST].[RECIPIENT_ID]
+                ,[RECIPIENT_NAME].[LAST_NAME] AS RECIPIENT_LAST_NAME
+                ,[RECIPIENT_LOCATION].[AVAILABLE_FIELD_6] AS RECIPIENT_LOCATION_RH
+                ,[SD_REQUEST].[SD_CATALOG_ID]
+                ,[SD_CATALOG].[TITLE_FR] AS CATALOG_NAME
+                ,[SD_REQUEST].[STATUS_ID]
+                ,[SD_STATUS].[STATUS_FR]
+                ,[SD_REQUEST].[COMMENT]
+                ,[SD_REQUEST].[DESCRIPTION]
+                ,[SD_REQUEST].[URGENCY_ID]
+                ,[SD_URGENCY].[URGENCY_FR]
+                ,[SD_REQUEST].[CI_ID]
+                ,[AM_ASSET].[NETWORK_IDENTIFIER] AS CI_NAME
+                ,[SD_REQUEST].[OWNER_ID]
+                ,[OWNER_NAME].[LAST_NAME] AS OWNER_LAST_NAME
+                ,[SD_REQUEST].[OWNING_GROUP_ID]
+                ,[AM_GROUP].[GROUP_FR] AS OWNING_GROUP_NAME
+                ,[SD_REQUEST].[DEPARTMENT_ID]
+                ,[SD_REQUEST].[REQUESTOR_FEEDBACK]
+                ,[SD_REQUEST].[ASSET_ID]
+                ,[MATERIAL_NETWORK_NAME].[ASSET_TAG]
+                ,[SD_REQUEST].[FIRST_CALL_RESOLUTION]
+                ,[SD_REQUEST].[SEVERITY_ID]
+                ,[SD_REQUEST].[TIME_USED_TO_SOLVE_REQUEST]
+                ,[SD_REQUEST].[REQUEST_ORIGIN_ID]
+                ,[SD_REQUEST].[DELAY]
+                ,[SD_REQUEST].[LAST_GROUP_ID]
+                ,[SD_REQUEST].[LAST_DONE_BY_ID]
+                ,[SD_REQUEST].[SLA_ID]
+                ,[SD_REQUEST].[IMPACT_ID]
+                ,[SD_REQUEST].[E_INFRA_COMMENT]
+                ,[SD_REQUEST].[IS_MAJOR_INCIDENT]
+                ,[SD_REQUEST].[E_TYPE_SUPPORT]
+            FROM [EVO_DATA50004].[50004].[SD_REQUEST]
+            inner join [EVO_DATA50004].[50004].AM_EMPLOYEE SUBMITTED_BY_NAME on SD_REQUEST.SUBMITTED_BY = SUBMITTED_BY_NAME.EMPLOYEE_ID
+            inner join [EVO_DATA50004].[50004].AM_EMPLOYEE REQUESTOR_NAME on SD_REQUEST.REQUESTOR_ID = REQUESTOR_NAME.EMPLOYEE_ID
+            inner join [EVO_DATA50004].[50004].AM_EMPLOYEE RECIPIENT_NAME on SD_REQUEST.RECIPIENT_ID = RECIPIENT_NAME.EMPLOYEE_ID
+            left join [EVO_DATA50004].[50004].AM_EMPLOYEE OWNER_NAME on SD_REQUEST.OWNER_ID = OWNER_NAME.EMPLOYEE_ID
+            left join [EVO_DATA50004].[50004].AM_EMPLOYEE REQUESTOR_LOCATION on SD_REQUEST.REQUESTOR_ID = REQUESTOR_LOCATION.EMPLOYEE_ID
+            left join [EVO_DATA50004].[50004].AM_EMPLOYEE RECIPIENT_LOCATION on SD_REQUEST.RECIPIENT_ID = RECIPIENT_LOCATION.EMPLOYEE_ID
+            inner join [EVO_DATA50004].[50004].SD_CATALOG on SD_REQUEST.SD_CATALOG_ID = SD_CATALOG.SD_CATALOG_ID
+            inner join [EVO_DATA50004].[50004].SD_STATUS on SD_REQUEST.STATUS_ID = SD_STATUS.STATUS_ID
+            inner join [EVO_DATA50004].[50004].SD_URGENCY on SD_REQUEST.URGENCY_ID = SD_URGENCY.URGENCY_ID
+            left join [EVO_DATA50004].[50004].AM_ASSET on SD_REQUEST.CI_ID = AM_ASSET.ASSET_ID
+            left join [EVO_DATA50004].[50004].AM_ASSET MATERIAL_NETWORK_NAME on SD_REQUEST.ASSET_ID = MATERIAL_NETWORK_NAME.ASSET_ID
+            left join [EVO_DATA50004].[50004].AM_GROUP on SD_REQUEST.OWNING_GROUP_ID = AM_GROUP.GROUP_ID'''
+
+# requests handled by the Hotline or new arrivals not closed yet
+REQUESTS_FILTER_SQL: str = '''(SD_REQUEST.REQUEST_ID in (SELECT TOP (1000) [AM_ACTION].[REQUEST_ID]
+                                            FROM [EVO_DATA50004].[50004].[AM_ACTION]
+                                            WHERE AM_ACTION.END_DATE_UT IS NULL AND
+                                                    AM_ACTION.GROUP_ID = 5) AND
+                    SD_REQUEST.MAX_RESOLUTION_DATE_UT IS NOT NULL) OR
+                    (SD_REQUEST.REQUEST_ID IN (SELECT TOP (1000) [SD_REQUEST].[REQUEST_ID]
+                                                FROM [EVO_DATA50004].[50004].[SD_REQUEST]
+                                                WHERE  SD_REQUEST.SD_CATALOG_ID = 5535 AND
+                                                        SD_REQUEST.RFC_NUMBER IS NOT NULL AND
+                                                        SD_REQUEST.STATUS_ID NOT IN (2,7,8,11,15,18,21,25,26,27,28,30,33)))'''
+
+REQUESTS_SQL_QUERY: str = REQUESTS_SELECT_SQL + '''
+            WHERE ''' + REQUESTS_FILTER_SQL
+
+REQUESTS_OPEN_IDS_SQL_QUERY: str = '''SELECT [SD_REQUEST].[REQUEST_ID]
+            FROM [EVO_DATA50004].[50004].[SD_REQUEST]
+            WHERE ''' + REQUESTS_FILTER_SQL
+
+
+def _load_requests(engine: Callable[[], Engine], memcached_client: Client, full_reload: bool = False) -> pd.DataFrame:
+    ''' Creates a connexion with SPOT SQL server and executes query, incrementally
+    from the published version unless full_reload is set
+
+    Args:
+        engine: the function which returns the sqlalchemy connexion
+        memcached_client: the memcached client holding the published versions
+        full_reload: queries every ticket instead of the changes since the published version
 
     Returns:
         df_tickets: dataframe with the results
@@ -97,141 +597,142 @@ async def get_requests(engine: Callable[[], Engine], memcached_client: Client, l
             * E_TYPE_SUPPORT: external field added to classify tickets. Only works for incidents, not configured
                 for requests
     '''
-
     from apollo.main import site_settings
 
-    requests_sql_query: str = '''SELECT TOP (1000) [SD_REQUEST].[REQUEST_ID]
-                ,[SD_REQUEST].[PARENT_REQUEST_ID]
-                ,[SD_REQUEST].[RFC_NUMBER]
-                ,[SD_REQUEST].[CREATION_DATE_UT]
-                ,[SD_REQUEST].[SUBMIT_DATE_UT]
-                ,[SD_REQUEST].[END_DATE_UT]
-                ,[SD_REQUEST].[MAX_RESOLUTION_DATE_UT]
-                ,[SD_REQUEST].[LAST_UPDATE]
-                ,[SD_REQUEST].[SUBMITTED_BY]
-                ,[SUBMITTED_BY_NAME].[LAST_NAME] AS SUBMITTED_BY_LAST_NAME
-                ,[SD_REQUEST].[REQUESTOR_ID]
-                ,[REQUESTOR_NAME].[LAST_NAME] AS REQUESTOR_LAST_NAME
-                ,[REQUESTOR_LOCATION].[AVAILABLE_FIELD_6] AS REQUESTOR_LOCATION_RH
-                ,[SD_REQUEST].[LOCATION_ID]
-                ,[SD_REQUEST].[REQUESTOR_PHONE]
-                ,[SD_REQUEST].[RECIPIENT_ID]
-                ,[RECIPIENT_NAME].[LAST_NAME] AS RECIPIENT_LAST_NAME
-                ,[RECIPIENT_LOCATION].[AVAILABLE_FIELD_6] AS RECIPIENT_LOCATION_RH
-                ,[SD_REQUEST].[SD_CATALOG_ID]
-                ,[SD_CATALOG].[TITLE_FR] AS CATALOG_NAME
-                ,[SD_REQUEST].[STATUS_ID]
-                ,[SD_STATUS].[STATUS_FR]
-                ,[SD_REQUEST].[COMMENT]
-                ,[SD_REQUEST].[DESCRIPTION]
-                ,[SD_REQUEST].[URGENCY_ID]
-                ,[SD_URGENCY].[URGENCY_FR]
-                ,[SD_REQUEST].[CI_ID]
-                ,[AM_ASSET].[NETWORK_IDENTIFIER] AS CI_NAME
-                ,[SD_REQUEST].[OWNER_ID]
-                ,[OWNER_NAME].[LAST_NAME] AS OWNER_LAST_NAME
-                ,[SD_REQUEST].[OWNING_GROUP_ID]
-                ,[AM_GROUP].[GROUP_FR] AS OWNING_GROUP_NAME
-                ,[SD_REQUEST].[DEPARTMENT_ID]
-                ,[SD_REQUEST].[REQUESTOR_FEEDBACK]
-                ,[SD_REQUEST].[ASSET_ID]
-                ,[MATERIAL_NETWORK_NAME].[ASSET_TAG]
-                ,[SD_REQUEST].[FIRST_CALL_RESOLUTION]
-                ,[SD_REQUEST].[SEVERITY_ID]
-                ,[SD_REQUEST].[TIME_USED_TO_SOLVE_REQUEST]
-                ,[SD_REQUEST].[REQUEST_ORIGIN_ID]
-                ,[SD_REQUEST].[DELAY]
-                ,[SD_REQUEST].[LAST_GROUP_ID]
-                ,[SD_REQUEST].[LAST_DONE_BY_ID]
-                ,[SD_REQUEST].[SLA_ID]
-                ,[SD_REQUEST].[IMPACT_ID]
-                ,[SD_REQUEST].[E_INFRA_COMMENT]
-                ,[SD_REQUEST].[IS_MAJOR_INCIDENT]
-                ,[SD_REQUEST].[E_TYPE_SUPPORT]
-            FROM [EVO_DATA50004].[50004].[SD_REQUEST]
-            inner join [EVO_DATA50004].[50004].AM_EMPLOYEE SUBMITTED_BY_NAME on SD_REQUEST.SUBMITTED_BY = SUBMITTED_BY_NAME.EMPLOYEE_ID
-            inner join [EVO_DATA50004].[50004].AM_EMPLOYEE REQUESTOR_NAME on SD_REQUEST.REQUESTOR_ID = REQUESTOR_NAME.EMPLOYEE_ID
-            inner join [EVO_DATA50004].[50004].AM_EMPLOYEE RECIPIENT_NAME on SD_REQUEST.RECIPIENT_ID = RECIPIENT_NAME.EMPLOYEE_ID
-            left join [EVO_DATA50004].[50004].AM_EMPLOYEE OWNER_NAME on SD_REQUEST.OWNER_ID = OWNER_NAME.EMPLOYEE_ID
-            left join [EVO_DATA50004].[50004].AM_EMPLOYEE REQUESTOR_LOCATION on SD_REQUEST.REQUESTOR_ID = REQUESTOR_LOCATION.EMPLOYEE_ID
-            left join [EVO_DATA50004].[50004].AM_EMPLOYEE RECIPIENT_LOCATION on SD_REQUEST.RECIPIENT_ID = RECIPIENT_LOCATION.EMPLOYEE_ID
-            inner join [EVO_DATA50004].[50004].SD_CATALOG on SD_REQUEST.SD_CATALOG_ID = SD_CATALOG.SD_CATALOG_ID
-            inner join [EVO_DATA50004].[50004].SD_STATUS on SD_REQUEST.STATUS_ID = SD_STATUS.STATUS_ID
-            inner join [EVO_DATA50004].[50004].SD_URGENCY on SD_REQUEST.URGENCY_ID = SD_URGENCY.URGENCY_ID
-            left join [EVO_DATA50004].[50004].AM_ASSET on SD_REQUEST.CI_ID = AM_ASSET.ASSET_ID
-            left join [EVO_DATA50004].[50004].AM_ASSET MATERIAL_NETWORK_NAME on SD_REQUEST.ASSET_ID = MATERIAL_NETWORK_NAME.ASSET_ID
-            left join [EVO_DATA50004].[50004].AM_GROUP on SD_REQUEST.OWNING_GROUP_ID = AM_GROUP.GROUP_ID
-            WHERE (SD_REQUEST.REQUEST_ID in (SELECT TOP (1000) [AM_ACTION].[REQUEST_ID]
-                                            FROM [EVO_DATA50004].[50004].[AM_ACTION]
-                                            WHERE AM_ACTION.END_DATE_UT IS NULL AND
-                                                    AM_ACTION.GROUP_ID = 5) AND
-                    SD_REQUEST.MAX_RESOLUTION_DATE_UT IS NOT NULL) OR
-                    (SD_REQUEST.REQUEST_ID IN (SELECT TOP (1000) [SD_REQUEST].[REQUEST_ID]
-                                                FROM [EVO_DATA50004].[50004].[SD_REQUEST]
-                                                WHERE  SD_REQUEST.SD_CATALOG_ID = 5535 AND
-                                                        SD_REQUEST.RFC_NUMBER IS NOT NULL AND
-                                                        SD_REQUEST.STATUS_ID NOT IN (2,7,8,11,15,18,21,25,26,27,28,30,33)))'''
-    
-    if site_settings.TESTING:
-        log.info("using local SD_REQUEST testing solution")
-        tickets_local_export = os.path.join(current_working_directory,"db", "SD_REQUEST_testing.csv")
-        result: pd.DataFrame = pd.read_csv(tickets_local_export, sep = ";")
-        
-        return (result, "123")
-
-    async with lock:
-        await asyncio.sleep(0)
-        log.info("Lock time: {}".format(datetime.now()))
-        cache_checker: Union[str, None] = memcached_client.get('SPOT_requests_fetch_status')
-        while cache_checker == "loading":
-            time.sleep(1)
-            cache_checker = memcached_client.get('SPOT_requests_fetch_status')
-
-        cached_result: pd.DataFrame = memcached_client.get('SPOT_requests')
-        if cached_result is not None:
-            log.info("SQL REQ SD_REQUEST - Read from Cache")
-            cached_uuid: str = memcached_client.get("SPOT_requests_uuid")
-
-            return (cached_result, cached_uuid)
-                
-        else:
-            memcached_client.set('SPOT_requests_fetch_status', "loading", site_settings.CACHE_EXPIRE)
-            data_uuid = str(uuid.uuid4())
-
-            if site_settings.DEBUG:
-                log.info("using local SD_REQUEST debug solution")
-                tickets_local_export = os.path.join(current_working_directory,"db", "SD_REQUEST.csv")
-                result: pd.DataFrame = pd.read_csv(tickets_local_export, sep = ";")
-                
-                memcached_client.set('SPOT_requests_fetch_status', "done", site_settings.CACHE_EXPIRE)
-                memcached_client.set('SPOT_requests', result, site_settings.CACHE_EXPIRE)
-                memcached_client.set('SPOT_requests_uuid', data_uuid, site_settings.CACHE_EXPIRE)
-                
-                return (result, data_uuid)
-
-
-            with engine().connect() as connection:
-                result: pd.DataFrame = pd.read_sql(requests_sql_query,
-                                con = connection)
+    if site_settings.DEBUG:
+        log.info("using local SD_REQUEST debug solution")
+        tickets_local_export = os.path.join(current_working_directory,"db", "SD_REQUEST.csv")
+        return pd.read_csv(tickets_local_export, sep = ";")
+
+    previous: Union[pd.DataFrame, None] = None
+    if not full_reload:
+        previous, _ = _read_current(memcached_client, REQUESTS_DATASET)
+
+    with engine().connect() as connection:
+        if previous is not None:
+            result = _load_incremental(connection, previous, "SD_REQUEST", "REQUEST_ID",
+                                    REQUESTS_SELECT_SQL, REQUESTS_FILTER_SQL, REQUESTS_OPEN_IDS_SQL_QUERY)
+            if result is not None:
+                log.info("SQL Server incremental request made: SD_REQUEST")
+                return result
 
-                log.info("SQL Server request made: SD_REQUEST")
+        result: pd.DataFrame = pd.read_sql(REQUESTS_SQL_QUERY,
+                        con = connection)
 
-                memcached_client.set('SPOT_requests_fetch_status', "done", site_settings.CACHE_EXPIRE)
-                memcached_client.set('SPOT_requests', result, site_settings.CACHE_EXPIRE)
-                memcached_client.set('SPOT_requests_uuid', data_uuid, site_settings.CACHE_EXPIRE)
-                
-                log.info("SD_REQUEST saved to cache - uuid {}".format(data_uuid))
+        log.info("SQL Server request made: SD_REQUEST")
+        return result
 
-                return (result, data_uuid)
-            
 
+def refresh_requests(engine: Callable[[], Engine], memcached_client: Client, full_reload: bool = False) -> Union[Dict, None]:
+    return refresh_dataset(REQUESTS_DATASET, lambda client: _load_requests(engine, client, full_reload), memcached_client)
 
 
-async def get_tasks(engine: Callable[[], Engine], memcached_client: Client, lock) -> Tuple[pd.DataFrame, Union[str, None]]:
-    ''' Creates a connexion with SPOT SQL server and executes query
+# the AM_ACTION columns the ticket pipeline reads
+TASKS_PIPELINE_COLUMNS: List[str] = ["ACTION_ID", "REQUEST_ID", "RFC_NUMBER", "ACTION_LABEL_FR", "ACTION_TYPE_ID",
+                                    "START_DATE_UT", "END_DATE_UT", "CREATION_DATE_UT", "LAST_UPDATE",
+                                    "DESCRIPTION", "DONE_BY_NAME", "GROUP_FR"]
+
+TASKS_SELECT_SQL: str = '''SELECT TOP (100000) [AM_ACTION].[ACTION_ID]
+                                    ,[AM_ACTION].[REQUEST_ID]
+                                    ,[SD_REQUEST].[RFC_NUMBER]
+                                    ,[AM_ACTION].[ACTION_NUMBER]
+                                    ,[AM_ACTION].[ASSET_ID]
+                                    ,[AM_ACTION].[PARENT_ACTION_ID]
+                                    ,[AM_ACTION].[VALIDATOR_ID]
+                                    ,[AM_ACTION].[ACTION_LABEL_FR]
+                                    ,[AM_ACTION].[ACTION_TYPE_ID]
+                                    ,[AM_ACTION_TYPE].[NAME_FR] AS ACTION_TYPE
+                                    ,[AM_ACTION].[START_DATE_UT]
+                                    ,[AM_ACTION].[END_DATE_UT]
+                                    ,[AM_ACTION].[EXPECTED_START_DATE_UT]
+                                    ,[AM_ACTION].[CREATION_DATE_UT]
+                                    ,[AM_ACTION].[EXPECTED_END_DATE_UT]
+                                    ,[AM_ACTION].[LAST_UPDATE]
+                                    ,[AM_ACTION].[DESCRIPTION]
+                                    ,[AM_ACTION].[PROCESS_STEP_ID]
+                                    ,[AM_ACTION].[LOCATION_ID]
+                                    ,[AM_ACTION].[DONE_BY_ID]
+                                    ,[AM_EMPLOYEE].[LAST_NAME] AS DONE_BY_NAME
+                                    ,[AM_ACTION].[GROUP_ID]
+                                    ,[AM_GROUP].[GROUP_FR]
+                                    ,[AM_ACTION].[CONTACT_ID]
+                                    ,[AM_ACTION].[ELAPSED_TIME]
+                                    ,[AM_ACTION].[STATUS_ID_ON_CREATE]
+                                    ,[AM_ACTION].[STATUS_ID_ON_TERMINATE]
+                                    ,[AM_ACTION].[TIME_USED_TO_COMPLETE_ACTION]
+                                    ,[AM_ACTION].[ORIGIN_ACTION_ID]
+                                    ,[AM_ACTION].[WORKFLOW_VALUE]
+                                    ,[AM_ACTION].[WORKFLOW_ID]
+                                    ,[AM_ACTION].[EXIT_VALUE]
+                                    ,[AM_ACTION].[PREVIOUS_SIBLING_ID]
+                                    ,[AM_ACTION].[HISTORY_ID]
+                                FROM [EVO_DATA50004].[50004].[AM_ACTION]
+                                left join [EVO_DATA50004].[50004].AM_ACTION_TYPE on AM_ACTION.ACTION_TYPE_ID = AM_ACTION_TYPE.ACTION_TYPE_ID
+                                left join [EVO_DATA50004].[50004].AM_GROUP on AM_ACTION.GROUP_ID = AM_GROUP.GROUP_ID
+                                left join [EVO_DATA50004].[50004].AM_EMPLOYEE on AM_ACTION.DONE_BY_ID = AM_EMPLOYEE.EMPLOYEE_ID
+                                left join [EVO_DATA50004].[50004].SD_REQUEST on AM_ACTION.REQUEST_ID = SD_REQUEST.REQUEST_ID'''
+
+# actions of the requests handled by the Hotline or of the new arrivals not closed yet,
+# {request_id} is the request id column the filter applies to
+TASKS_OPEN_FILTER_SQL: str = '''(({request_id} IN (SELECT TOP (1000) [AM_ACTION].[REQUEST_ID]
+                                                                FROM [EVO_DATA50004].[50004].[AM_ACTION]
+                                                                WHERE AM_ACTION.END_DATE_UT IS NULL AND
+                                                                        AM_ACTION.GROUP_ID = 5
+                                                                ORDER BY AM_ACTION.REQUEST_ID)) OR
+                                        ({request_id} IN (SELECT TOP (1000) [SD_REQUEST].[REQUEST_ID]
+                                                                    FROM [EVO_DATA50004].[50004].[SD_REQUEST]
+                                                                    WHERE  SD_REQUEST.SD_CATALOG_ID = 5535 AND
+                                                                            SD_REQUEST.RFC_NUMBER IS NOT NULL AND
+                                                                            SD_REQUEST.STATUS_ID NOT IN (2,7,8,11,15,18,21,25,26,27,28,30,33))))'''
+
+TASKS_FILTER_SQL: str = '''AM_ACTION.ACTION_TYPE_ID NOT IN (23,107,82) AND
+                                        ''' + TASKS_OPEN_FILTER_SQL.format(request_id = "AM_ACTION.REQUEST_ID")
+
+TASKS_SQL_QUERY: str = TASKS_SELECT_SQL + '''
+                                WHERE ''' + TASKS_FILTER_SQL
+
+TASKS_OPEN_IDS_SQL_QUERY: str = '''SELECT [SD_REQUEST].[REQUEST_ID]
+                                FROM [EVO_DATA50004].[50004].[SD_REQUEST]
+                                WHERE ''' + TASKS_OPEN_FILTER_SQL.format(request_id = "SD_REQUEST.REQUEST_ID")
+
+
+TASKS_DTYPES: Dict[str, str] = {
+    "ACTION_ID": "Int64",
+    "REQUEST_ID": "Int64",
+    "ASSET_ID": "Int64",
+    "PARENT_ACTION_ID": "Int64",
+    "VALIDATOR_ID": "Int64",
+    "ACTION_TYPE_ID": "Int64",
+    "PROCESS_STEP_ID": "Int64",
+    "LOCATION_ID": "Int64",
+    "DONE_BY_ID": "Int64",
+    "GROUP_ID": "Int64",
+    "CONTACT_ID": "Int64",
+    "ORIGIN_ACTION_ID": "Int64",
+    "WORKFLOW_ID": "Int64",
+    "PREVIOUS_SIBLING_ID": "Int64",
+    "HISTORY_ID": "Int64",
+    "ACTION_LABEL_FR": "category",
+    "ACTION_TYPE": "category",
+    "DONE_BY_NAME": "category",
+    "GROUP_FR": "category",
+    "START_DATE_UT": "datetime",
+    "END_DATE_UT": "datetime",
+    "EXPECTED_START_DATE_UT": "datetime",
+    "CREATION_DATE_UT": "datetime",
+    "EXPECTED_END_DATE_UT": "datetime",
+    "LAST_UPDATE": "datetime"
+}
+
+
+def _load_tasks(engine: Callable[[], Engine], memcached_client: Client, full_reload: bool = False) -> pd.DataFrame:
+    ''' Creates a connexion with SPOT SQL server and executes query, incrementally
+    from the published version unless full_reload is set
 
     Args:
         engine: the function which returns the sqlalchemy connexion
+        memcached_client: the memcached client holding the published versions
+        full_reload: queries every ticket instead of the changes since the published version
 
     Returns:
         df_tickets_operations: dataframe with the results
@@ -431,108 +932,34 @@ async def get_tasks(engine: Callable[[], Engine], memcached_client: Client, lock
             * PREVIOUS_SIBLING_ID: ???
             * HISTORY_ID: ???
     '''
-
     from apollo.main import site_settings
-    requests_tasks_sql_query: str = '''SELECT TOP (100000) [AM_ACTION].[ACTION_ID]
-                                    ,[AM_ACTION].[REQUEST_ID]
-                                    ,[SD_REQUEST].[RFC_NUMBER]
-                                    ,[AM_ACTION].[ACTION_NUMBER]
-                                    ,[AM_ACTION].[ASSET_ID]
-                                    ,[AM_ACTION].[PARENT_ACTION_ID]
-                                    ,[AM_ACTION].[VALIDATOR_ID]
-                                    ,[AM_ACTION].[ACTION_LABEL_FR]
-                                    ,[AM_ACTION].[ACTION_TYPE_ID]
-                                    ,[AM_ACTION_TYPE].[NAME_FR] AS ACTION_TYPE
-                                    ,[AM_ACTION].[START_DATE_UT]
-                                    ,[AM_ACTION].[END_DATE_UT]
-                                    ,[AM_ACTION].[EXPECTED_START_DATE_UT]
-                                    ,[AM_ACTION].[CREATION_DATE_UT]
-                                    ,[AM_ACTION].[EXPECTED_END_DATE_UT]
-                                    ,[AM_ACTION].[LAST_UPDATE]
-                                    ,[AM_ACTION].[DESCRIPTION]
-                                    ,[AM_ACTION].[PROCESS_STEP_ID]
-                                    ,[AM_ACTION].[LOCATION_ID]
-                                    ,[AM_ACTION].[DONE_BY_ID]
-                                    ,[AM_EMPLOYEE].[LAST_NAME] AS DONE_BY_NAME
-                                    ,[AM_ACTION].[GROUP_ID]
-                                    ,[AM_GROUP].[GROUP_FR]
-                                    ,[AM_ACTION].[CONTACT_ID]
-                                    ,[AM_ACTION].[ELAPSED_TIME]
-                                    ,[AM_ACTION].[STATUS_ID_ON_CREATE]
-                                    ,[AM_ACTION].[STATUS_ID_ON_TERMINATE]
-                                    ,[AM_ACTION].[TIME_USED_TO_COMPLETE_ACTION]
-                                    ,[AM_ACTION].[ORIGIN_ACTION_ID]
-                                    ,[AM_ACTION].[WORKFLOW_VALUE]
-                                    ,[AM_ACTION].[WORKFLOW_ID]
-                                    ,[AM_ACTION].[EXIT_VALUE]
-                                    ,[AM_ACTION].[PREVIOUS_SIBLING_ID]
-                                    ,[AM_ACTION].[HISTORY_ID]
-                                FROM [EVO_DATA50004].[50004].[AM_ACTION]
-                                left join [EVO_DATA50004].[50004].AM_ACTION_TYPE on AM_ACTION.ACTION_TYPE_ID = AM_ACTION_TYPE.ACTION_TYPE_ID
-                                left join [EVO_DATA50004].[50004].AM_GROUP on AM_ACTION.GROUP_ID = AM_GROUP.GROUP_ID
-                                left join [EVO_DATA50004].[50004].AM_EMPLOYEE on AM_ACTION.DONE_BY_ID = AM_EMPLOYEE.EMPLOYEE_ID
-                                left join [EVO_DATA50004].[50004].SD_REQUEST on AM_ACTION.REQUEST_ID = SD_REQUEST.REQUEST_ID
-                                WHERE AM_ACTION.ACTION_TYPE_ID NOT IN (23,107,82) AND
-                                        ((AM_ACTION.REQUEST_ID IN (SELECT TOP (1000) [AM_ACTION].[REQUEST_ID]
-                                                                FROM [EVO_DATA50004].[50004].[AM_ACTION]
-                                                                WHERE AM_ACTION.END_DATE_UT IS NULL AND
-                                                                        AM_ACTION.GROUP_ID = 5
-                                                                ORDER BY AM_ACTION.REQUEST_ID)) OR
-                                        (AM_ACTION.REQUEST_ID IN (SELECT TOP (1000) [SD_REQUEST].[REQUEST_ID]
-                                                                    FROM [EVO_DATA50004].[50004].[SD_REQUEST]
-                                                                    WHERE  SD_REQUEST.SD_CATALOG_ID = 5535 AND
-                                                                            SD_REQUEST.RFC_NUMBER IS NOT NULL AND
-                                                                            SD_REQUEST.STATUS_ID NOT IN (2,7,8,11,15,18,21,25,26,27,28,30,33))))'''
 
-    if site_settings.TESTING:
-        log.info("using local AM_ACTION testing solution")
-        tickets_local_export = os.path.join(current_working_directory,"db", "AM_ACTION_testing.csv")
-        result: pd.DataFrame = pd.read_csv(tickets_local_export, sep = ";")
-        
-        return (result, "123")
-
-    async with lock:
-        await asyncio.sleep(0)
-        log.info("Lock time: {}".format(datetime.now()))
-        cache_checker: Union[str, None] = memcached_client.get('SPOT_requests_operations_fetch_status')
-        while cache_checker == "loading":
-            time.sleep(1)
-            cache_checker = memcached_client.get('SPOT_requests_operations_fetch_status')
-
-        cached_result: pd.DataFrame = memcached_client.get('SPOT_requests_operations')
-        if cached_result is not None:
-            log.info("SQL AM_ACTION - Read from Cache")
-            cached_uuid: str = memcached_client.get("SPOT_requests_operations_uuid")
-
-            return (cached_result, cached_uuid)
-            
-        else:
-            memcached_client.set('SPOT_requests_operations_fetch_status', "loading", site_settings.CACHE_EXPIRE)
-            data_uuid = str(uuid.uuid4())
-
-            if site_settings.DEBUG:
-                log.info("using local AM_ACTION debug solution")
-                tickets_local_export = os.path.join(current_working_directory,"db", "AM_ACTION.csv")
-                result: pd.DataFrame = pd.read_csv(tickets_local_export, sep = ";")
-                
-                memcached_client.set('SPOT_requests_operations_fetch_status', "done", site_settings.CACHE_EXPIRE)
-                memcached_client.set('SPOT_requests_operations', result, site_settings.CACHE_EXPIRE)
-                memcached_client.set('SPOT_requests_operations_uuid', data_uuid, site_settings.CACHE_EXPIRE)
-                
-                return (result, data_uuid)
-
-            with engine().connect() as connection:
-                result: pd.DataFrame = pd.read_sql(requests_tasks_sql_query,
-                                con = connection)
+    if site_settings.DEBUG:
+        log.info("using local AM_ACTION debug solution")
+        tickets_local_export = os.path.join(current_working_directory,"db", "AM_ACTION.csv")
+        return pd.read_csv(tickets_local_export, sep = ";")
 
-                log.info("SQL Server request made: AM_action")
+    previous: Union[pd.DataFrame, None] = None
+    if not full_reload:
+        previous, _ = _read_current(memcached_client, TASKS_DATASET)
 
-                memcached_client.set('SPOT_requests_operations_fetch_status', "done", site_settings.CACHE_EXPIRE)
-                memcached_client.set('SPOT_requests_operations', result, site_settings.CACHE_EXPIRE)
-                memcached_client.set('SPOT_requests_operations_uuid', data_uuid, site_settings.CACHE_EXPIRE)
-                
-                log.info("SD_REQUEST saved to cache - uuid {}".format(data_uuid))
-                return (result, data_uuid)
+    with engine().connect() as connection:
+        if previous is not None:
+            result = _load_incremental(connection, previous, "AM_ACTION", "ACTION_ID",
+                                    TASKS_SELECT_SQL, TASKS_FILTER_SQL, TASKS_OPEN_IDS_SQL_QUERY,
+                                    dtypes = TASKS_DTYPES)
+            if result is not None:
+                log.info("SQL Server incremental request made: AM_action")
+                return result
+
+        result: pd.DataFrame = _read_sql_typed(TASKS_SQL_QUERY, connection, TASKS_DTYPES)
+
+        log.info("SQL Server request made: AM_action")
+        return result
+
+
+def refresh_tasks(engine: Callable[[], Engine], memcached_client: Client, full_reload: bool = False) -> Union[Dict, None]:
+    return refresh_dataset(TASKS_DATASET, lambda client: _load_tasks(engine, client, full_reload), memcached_client)
 
 
 
@@ -580,4 +1007,4 @@ def get_employee_mouvement_data(engine, memcache):
 
             log.info("SQL Server request made: SD_QUESTION_employee_mouvement")
             # memcache.set('SPOT_employee_mouvement', result, site_settings.CACHE_EXPIRE)              
-            return result
\ No newline at end of file
+            return result
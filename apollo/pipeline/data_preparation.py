@@ -1,12 +1,20 @@
 import re
+import typing
 import unicodedata
-from typing import Dict, List, Union
+from typing import Any, Dict, List, Union
 
 import numpy as np
 import pandas as pd
 
+from apollo.pipeline import data_analysis, data_schema
+
 # pd.set_option('mode.chained_assignment', "raise")
 
+# HTML tags then greetings removed from the comments. Two passes: the character following
+# the greeting is the first one of the text once the tags are removed.
+COMMENT_TAGS_REGEX = re.compile("<[^<]+?>")
+COMMENT_GREETING_REGEX = re.compile("bonjour.?", flags = re.IGNORECASE)
+
 def normalize_names(name):
     return ''.join([
         c for c in unicodedata.normalize('NFD', name)
@@ -89,60 +97,36 @@ def clean_ticket_data(df: pd.DataFrame) -> pd.DataFrame:
 
     # df = df.loc[:("AP_SD_RFC_NUMBER", "AP_SD_STATUS_FR","AP_SD_PARENT_REQUEST_ID", "AP_SD_MAX_RESOLUTION_DATE", "AP_SD_RECIPIENT_LAST_NAME", "AP_SD_CATALOG_NAME", "AP_SD_URGENCY", "AP_SD_SUPPORT_TYPE", "location",
     #             "AP_SD_MATERIAL_NAME", "AP_SD_CI_NAME", "AP_SD_COMMENT")]
-    df.loc[:,"AP_SD_RFC_NUMBER"] = df["AP_SD_RFC_NUMBER"].astype(str)
-    df.loc[:,"AP_SD_STATUS_FR"] = df["AP_SD_STATUS_FR"].astype("category")
-    df.loc[:,"AP_SD_PARENT_REQUEST_ID"] = df["AP_SD_PARENT_REQUEST_ID"].astype("category")
-
-    df.loc[:,"AP_SD_CREATION_DATE_UT"] = pd.to_datetime(df["AP_SD_CREATION_DATE_UT"],
-                        format = "%Y-%m-%d %H:%M:%S.%f", 
-                        errors = "coerce",
-                        utc = True)
-    df.loc[:,"AP_SD_CREATION_DATE_UT"] = df["AP_SD_CREATION_DATE_UT"].dt.tz_convert('Europe/Paris')
-
-    df.loc[:,"AP_SD_SUBMIT_DATE_UT"] = pd.to_datetime(df["AP_SD_SUBMIT_DATE_UT"],
-                        format = "%Y-%m-%d %H:%M:%S.%f", 
-                        errors = "coerce",
-                        utc = True)
-    df.loc[:,"AP_SD_SUBMIT_DATE_UT"] = df["AP_SD_SUBMIT_DATE_UT"].dt.tz_convert('Europe/Paris')
-
-    df.loc[:,"AP_SD_END_DATE_UT"] = pd.to_datetime(df["AP_SD_END_DATE_UT"],
-                        format = "%Y-%m-%d %H:%M:%S.%f",
-                        errors = "coerce",
-                        utc = True)
-    df.loc[:,"AP_SD_END_DATE_UT"] = df["AP_SD_END_DATE_UT"].dt.tz_convert('Europe/Paris')
-
-    df.loc[:,"AP_SD_MAX_RESOLUTION_DATE"] = pd.to_datetime(df["AP_SD_MAX_RESOLUTION_DATE"],
-                        format = "%Y-%m-%d %H:%M:%S.%f",
-                        errors = "coerce",
-                        utc = True)
-    df.loc[:,"AP_SD_MAX_RESOLUTION_DATE"] = df["AP_SD_MAX_RESOLUTION_DATE"].dt.tz_convert('Europe/Paris')
-
-    df.loc[:,"AP_SD_RECIPIENT_LAST_NAME"] = df["AP_SD_RECIPIENT_LAST_NAME"].astype(str)
-    df.loc[:,"AP_SD_RECIPIENT_LAST_NAME"].fillna("N/A", inplace=True)
-    df.loc[:,"AP_SD_RECIPIENT_LAST_NAME"] = df["AP_SD_RECIPIENT_LAST_NAME"].map(normalize_names)
-    df.loc[:,"AP_SD_CATALOG_NAME"] = df["AP_SD_CATALOG_NAME"].astype("category")
-    df.loc[:,"AP_SD_URGENCY"] = df["AP_SD_URGENCY"].astype("category")
+    df["AP_SD_STATUS_FR"] = df["AP_SD_STATUS_FR"].astype("category")
+    df["AP_SD_PARENT_REQUEST_ID"] = df["AP_SD_PARENT_REQUEST_ID"].astype("category")
+
+    df = data_schema.normalize_dates(df, ["AP_SD_CREATION_DATE_UT", "AP_SD_SUBMIT_DATE_UT", "AP_SD_END_DATE_UT",
+                                          "AP_SD_MAX_RESOLUTION_DATE", "LAST_UPDATE"])
+
+    df["AP_SD_RECIPIENT_LAST_NAME"] = df["AP_SD_RECIPIENT_LAST_NAME"].fillna("N/A").astype(str).map(normalize_names)
+    df["AP_SD_CATALOG_NAME"] = df["AP_SD_CATALOG_NAME"].astype("category")
+    df["AP_SD_URGENCY"] = df["AP_SD_URGENCY"].astype("category")
     if "4-Normal" not in df["AP_SD_URGENCY"].cat.categories:
-        df.loc[:,"AP_SD_URGENCY"] = df["AP_SD_URGENCY"].cat.add_categories("4-Normal")
-    df.loc[:,"AP_SD_URGENCY"].fillna("4-Normal", inplace=True)
-    df.loc[:,"AP_SD_SUPPORT_TYPE"] = df["AP_SD_SUPPORT_TYPE"].astype("category")
-    df.loc[:,"AP_SD_RECIPIENT_LOCATION_RH"].fillna("Pas de location", inplace = True)
-    df.loc[:,"AP_SD_RECIPIENT_LOCATION_RH"] = df["AP_SD_RECIPIENT_LOCATION_RH"].astype("category")
-    df.loc[:,"AP_SD_MATERIAL_NAME"] = df["AP_SD_MATERIAL_NAME"].astype(str)
-    df.loc[:,"AP_SD_CI_NAME"] = df["AP_SD_CI_NAME"].astype("category")
-    df.loc[:,"AP_SD_COMMENT"] = df["AP_SD_COMMENT"].astype(str)
-    df.loc[:,"AP_SD_COMMENT"] = df["AP_SD_COMMENT"].str.replace("<[^<]+?>","")
-    df.loc[:,"AP_SD_COMMENT"] = df["AP_SD_COMMENT"].str.replace("bonjour.?","", flags = re.IGNORECASE)
+        df["AP_SD_URGENCY"] = df["AP_SD_URGENCY"].cat.add_categories("4-Normal")
+    df["AP_SD_URGENCY"] = df["AP_SD_URGENCY"].fillna("4-Normal")
+    df["AP_SD_SUPPORT_TYPE"] = df["AP_SD_SUPPORT_TYPE"].astype("category")
+    df["AP_SD_RECIPIENT_LOCATION_RH"] = df["AP_SD_RECIPIENT_LOCATION_RH"].fillna("Pas de location").astype("category")
+    df["AP_SD_CI_NAME"] = df["AP_SD_CI_NAME"].astype("category")
+    # a missing comment is an empty one, not the string "nan"
+    df["AP_SD_COMMENT"] = df["AP_SD_COMMENT"].fillna("").astype(str).str.replace(COMMENT_TAGS_REGEX, "", regex = True)
+    df["AP_SD_COMMENT"] = df["AP_SD_COMMENT"].str.replace(COMMENT_GREETING_REGEX, "", regex = True)
 
     # TODO add check to see if cat column is in df column list
     categorical_cols = ["AP_SD_STATUS_FR", "AP_SD_PARENT_REQUEST_ID", "AP_SD_CATALOG_NAME", "AP_SD_URGENCY", "AP_SD_SUPPORT_TYPE"]
     for x in categorical_cols:
         if "-" not in df[x].cat.categories:
-            df.loc[:,x] = df[x].cat.add_categories("-")
+            df[x] = df[x].cat.add_categories("-")
 
     # if "Pas de location" not in df["AP_SD_RECIPIENT_LOCATION_RH"]:
     #     df["AP_SD_RECIPIENT_LOCATION_RH"] = df["AP_SD_RECIPIENT_LOCATION_RH"].cat.add_categories("Pas de location")
 
+    df = data_schema.apply_schema(df, data_schema.REQUESTS_SCHEMA)
+
     assert isinstance(df, pd.DataFrame)
     return df
 
@@ -204,41 +188,21 @@ def clean_ticket_tasks_data(df, date_format = None):
 
     df.replace(r'^\s*$', np.nan, regex=True, inplace=True)
     df.dropna(subset=["AP_AM_START_DATE", "AP_AM_DONE_BY_OPERATOR_NAME", "AP_AM_OPERATION_TYPE_NAME"], how="all", inplace=True)
-    df.loc[:,"AP_AM_RFC_NUMBER"] = df["AP_AM_RFC_NUMBER"].astype(str)
-    df.loc[:,"AP_AM_ACTION_TYPE_ID"] = df["AP_AM_ACTION_TYPE_ID"].astype("category")
-    df.loc[df["AP_AM_DONE_BY_OPERATOR_NAME"].isnull(),"AP_AM_DONE_BY_OPERATOR_NAME"] =  df.loc[df["AP_AM_DONE_BY_OPERATOR_NAME"].isnull(),"AP_AM_GROUP_FR"]
-    df.loc[:,"AP_AM_DONE_BY_OPERATOR_NAME"] = df["AP_AM_DONE_BY_OPERATOR_NAME"].astype("category")
+    df["AP_AM_ACTION_TYPE_ID"] = df["AP_AM_ACTION_TYPE_ID"].astype("category")
+    # the names can already be categorical (typed SPOT reads), the group is not one of their categories
+    done_by = df["AP_AM_DONE_BY_OPERATOR_NAME"].astype(object)
+    df["AP_AM_DONE_BY_OPERATOR_NAME"] = done_by.where(done_by.notnull(), df["AP_AM_GROUP_FR"].astype(object)).astype("category")
     
-    df.loc[:,"AP_AM_START_DATE"] = pd.to_datetime(df["AP_AM_START_DATE"],
-                        format = (lambda x: x if x else "%Y-%m-%d %H:%M:%S.%f")(date_format),
-                        errors = "coerce",
-                        utc = True)
-    df.loc[:,"AP_AM_START_DATE"] = df["AP_AM_START_DATE"].dt.tz_convert('Europe/Paris')
-
-    df.loc[:,"AP_AM_END_DATE_UT"] = pd.to_datetime(df["AP_AM_END_DATE_UT"],
-                        format = (lambda x: x if x else "%Y-%m-%d %H:%M:%S.%f")(date_format),
-                        errors = "coerce",
-                        utc = True)
-    df.loc[:,"AP_AM_END_DATE_UT"] = df["AP_AM_END_DATE_UT"].dt.tz_convert('Europe/Paris')
-
-    df.loc[:,"AP_AM_CREATION_DATE_UT"] = pd.to_datetime(df["AP_AM_CREATION_DATE_UT"],
-                        format = (lambda x: x if x else "%Y-%m-%d %H:%M:%S.%f")(date_format),
-                        errors = "coerce",
-                        utc = True)
-    df.loc[:,"AP_AM_CREATION_DATE_UT"] = df["AP_AM_CREATION_DATE_UT"].dt.tz_convert('Europe/Paris')
-
-    df.loc[:,"AP_AM_LAST_UPDATE"] = pd.to_datetime(df["AP_AM_LAST_UPDATE"],
-                        format = (lambda x: x if x else "%Y-%m-%d %H:%M:%S.%f")(date_format),
-                        errors = "coerce",
-                        utc = True)
-    df.loc[:,"AP_AM_LAST_UPDATE"] = df["AP_AM_LAST_UPDATE"].dt.tz_convert('Europe/Paris')
-
-    df.loc[:,"AP_AM_OPERATION_TYPE_NAME"] = df["AP_AM_OPERATION_TYPE_NAME"].astype("category")
+    # the typed SPOT reads already hold datetime64 (naive UTC), only the CSV exports are parsed
+    df = data_schema.normalize_dates(df, ["AP_AM_START_DATE", "AP_AM_END_DATE_UT", "AP_AM_CREATION_DATE_UT", "AP_AM_LAST_UPDATE",
+                                          "AP_AM_EXPECTED_START_DATE_UT", "AP_AM_EXPECTED_END_DATE_UT"], date_format)
+
+    df["AP_AM_OPERATION_TYPE_NAME"] = df["AP_AM_OPERATION_TYPE_NAME"].astype("category")
 
     categorical_cols = ["AP_AM_OPERATION_TYPE_NAME"]
     for x in categorical_cols:
         if "-" not in df[x].cat.categories:
-            df.loc[:,x] = df[x].cat.add_categories("-")
+            df[x] = df[x].cat.add_categories("-")
 
     categorical_cols = ["AP_AM_DONE_BY_OPERATOR_NAME"]
 
@@ -246,6 +210,8 @@ def clean_ticket_tasks_data(df, date_format = None):
     #     if "Hotline" not in df[x].cat.categories:
     #         df[x] = df[x].cat.add_categories("Hotline")
 
+    df = data_schema.apply_schema(df, data_schema.TASKS_SCHEMA)
+
     assert isinstance(df, pd.DataFrame)
     return df
 
@@ -273,60 +239,189 @@ def correct_spot_bugs_request_operations(df):
 #     return df
 
 
-def format_df_before_dispatch(df) -> List[Dict[str, Union[str, int]]]:
+###############################
+# DATATABLES
+###############################
+
+# The datatables are encoded to JSON in the worker, straight from the columns of the
+# frame (pandas' C encoder, no list of dicts is built) and returned to the API process
+# as bytes, which sends them as they are. Instead of FastAPI validating every row
+# against DatatableItemResponseModel, format_datatable checks the columns against the
+# fields of the model and converts each column to the type of its field.
+#
+# The datatables are served by page (offset / limit), sorted on one field and filtered
+# on any number of them, see parse_datatable_page. Only the rows of the page are
+# formatted and encoded.
+
+# {field of DatatableItemResponseModel: column of the tickets}
+DATATABLE_COLUMNS: Dict[str, str] = {
+    "SPOT": "AP_SD_RFC_NUMBER",
+    "Statut": "AP_SD_STATUS_FR",
+    "Beneficiaire": "AP_SD_RECIPIENT_LAST_NAME",
+    "Location": "AP_SD_RECIPIENT_LOCATION_RH",
+    "Priorite": "AP_SD_URGENCY",
+    "CI": "AP_SD_CI_NAME",
+    "Description": "AP_SD_COMMENT",
+    "C_RDV_DATE": "C_RDV_DATE",
+    "C_RDV_STATE": "C_RDV_STATE",
+    "AP_AM_DONE_BY_OPERATOR_NAME": "AP_AM_DONE_BY_OPERATOR_NAME",
+    "Score": "C_POINTS",
+    "C_POINTS_JUSTIFICATION": "C_POINTS_JUSTIFICATION",
+    "AP_INTERVENTION_TYPE": "AP_INTERVENTION_TYPE",
+    "Inter_Type": "AP_TYPE_FR",
+    "C_TICKET_TYPE": "C_TICKET_TYPE",
+    "C_TICKET_TYPE_STRING_FR": "C_TICKET_TYPE_STRING_FR",
+    "AP_SD_REQUEST_ID": "AP_SD_REQUEST_ID"
+}
+
+# the justification is only built for the rows sent, the RDV date is sent as a timestamp
+DATATABLE_NOT_SORTABLE: List[str] = ["C_POINTS_JUSTIFICATION"]
+DATATABLE_NOT_FILTERABLE: List[str] = ["C_POINTS_JUSTIFICATION", "C_RDV_DATE"]
+
+LOCATION_TRANSLATOR: Dict[str, str] = {
+    "CNR DIR REGION BELLEY": "DHR Belley",
+    "CNR AMGT BELLEY-BREG CORD": "DHR Bregnier-Cordon",
+    "CNR AMGT GENISSIAT": "DHR Genissiat",
+    "CNR AMGT SAULT BRENAZ-LOY": "DHR Sault Brenaz",
+    "CNR AMGT SEYSSEL-CHAUTAGN": "DHR Seyssel",
+    "CNR SIEGE SOCIAL": "DM Siege",
+    "CNR DELEGATION DE PARIS": "DM Paris",
+    "CNR LABORATOIRE GERLAND": "DM CACOH",
+    "CNR PORT EDOUARD HERRIOT": "DM PLEH",
+    "CNR USINE PIERRE BENITE": "DM Pierre Benite",
+    "CNR DIR REGION VIENNE": "DRS Vienne",
+    "CNR JEAN BART": "DRS Jean Bart",
+    "Bureau MAINTENANCE": "DRS Jean Bart",
+    "CNR USINE DE GERVANS": "DRS Gervans",
+    "CNR USINE DE SABLONS": "DRS Sablons",
+    "CNR USINE DE VAUGRIS": "DRS Vaugris",
+    "CNR DIR REGION VALENCE": "DRI Valence",
+    "CNR USINE BOURG LES VALENCE": "DRI Bourg-les-Valences",
+    "CNR USINE DE LOGIS NEUF": "DRI Logis-Neuf",
+    "CNR USINE DE CHATEAUNEUF": "DRI CH9",
+    "CNR USINE DE BEAUCHASTEL": "DRI Beauchastel",
+    "CNR DIR REGION AVIGNON": "DRM Avignon",
+    "CNR USINE D AVIGNON": "DRM Usine Avignon",
+    "CNR USINE DE BEAUCAIRE": "DRM Beaucaire",
+    "CNR USINE DE BOLLENE": "DRM Bollene",
+    "CNR USINE DE CADEROUSSE": "DRM Caderousse",
+    "CNR USINE DE BARCARIN": "DRM Barcarin"
+}
+NO_LOCATION: str = "Pas de location"
+
+_datatable_types: Union[Dict[str, type], None] = None
+
+
+def get_datatable_types() -> Dict[str, type]:
+    ''' Returns {field: type} of DatatableItemResponseModel, in the order of the model '''
+    global _datatable_types
+
+    if _datatable_types is None:
+        from apollo import schemas
+
+        # the hints of BaseModel itself (__slots__, ...) are not fields of the model
+        hints = typing.get_type_hints(schemas.DatatableItemResponseModel)
+        _datatable_types = {field: hints[field] for field in schemas.DatatableItemResponseModel.__annotations__}
+
+    return _datatable_types
+
+
+def parse_datatable_page(offset: int = 0, limit: Union[int, None] = None, sort: Union[str, None] = None,
+                         filters: Union[List[str], None] = None) -> Dict[str, Any]:
+    ''' Checks the paging parameters of a datatable request
+
+    Args:
+        offset: number of rows skipped
+        limit: number of rows of the page, all the remaining rows if None
+        sort: field to sort on, "-field" for the descending order. The rows keep the
+            order of the rule if None
+        filters: "field:text", the rows whose field contains text (case insensitive)
+            or is equal to it for the numbers
+
+    Returns:
+        {"offset": int, "limit": int or None, "sort": (column, ascending) or None,
+         "filters": [(column, text)]}, as expected by data_snapshot.get_datatable_page
+
+    Raises:
+        ValueError: unknown, not sortable or not filterable field
+    '''
+    if offset < 0 or (limit is not None and limit < 0):
+        raise ValueError("offset and limit must be positive")
+
+    page: Dict[str, Any] = {"offset": offset, "limit": limit, "sort": None, "filters": []}
+
+    if sort:
+        field = sort[1:] if sort.startswith("-") else sort
+        if field not in DATATABLE_COLUMNS or field in DATATABLE_NOT_SORTABLE:
+            raise ValueError("Cannot sort on {}".format(field))
+        page["sort"] = (DATATABLE_COLUMNS[field], not sort.startswith("-"))
+
+    for x in filters or []:
+        field, _, text = x.partition(":")
+        if field not in DATATABLE_COLUMNS or field in DATATABLE_NOT_FILTERABLE:
+            raise ValueError("Cannot filter on {}".format(field))
+        page["filters"].append((DATATABLE_COLUMNS[field], text))
+
+    return page
+
+
+def get_datatable_values(df: pd.DataFrame, column: str) -> pd.Series:
+    ''' Returns the values of a datatable column as sent to the client, to sort and filter on
+
+    The labels are returned as text, the dates and numbers as they are.
+    '''
+    values = df[column]
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        values = values.astype(object)
+
+    if column == "AP_SD_RECIPIENT_LOCATION_RH":
+        values = values.replace(LOCATION_TRANSLATOR).fillna(NO_LOCATION)
+
+    assert isinstance(values, pd.Series)
+    return values
+
+
+def match_datatable_filter(df: pd.DataFrame, column: str, text: str) -> np.ndarray:
+    ''' Returns the mask of the rows matching a filter returned by parse_datatable_page '''
+    values = get_datatable_values(df, column)
+
+    if pd.api.types.is_numeric_dtype(values.dtype):
+        try:
+            return (values == int(text)).to_numpy(dtype = bool)
+        except ValueError:
+            return np.zeros(len(values.index), dtype = bool)
+
+    return values.astype(object).fillna("").astype(str).str.contains(text, case = False, regex = False).to_numpy(dtype = bool)
+
+
+def format_df_before_dispatch(df) -> bytes:
+    ''' Returns the datatable of the tickets, encoded to JSON '''
+    return encode_datatable(format_datatable(df))
+
+
+def encode_datatable(df: pd.DataFrame) -> bytes:
+    ''' Encodes a frame returned by format_datatable to a JSON list of rows '''
     assert isinstance(df, pd.DataFrame)
 
-    df = df.loc[:,("AP_SD_RFC_NUMBER",
-        "AP_SD_STATUS_FR",
-        "AP_SD_RECIPIENT_LAST_NAME",
-        "AP_SD_RECIPIENT_LOCATION_RH",
-        "AP_SD_URGENCY",
-        "AP_SD_CI_NAME",
-        "AP_SD_COMMENT",
-        "C_RDV_DATE",
-        "C_RDV_STATE",
-        "AP_AM_DONE_BY_OPERATOR_NAME",
-        "C_POINTS",
-        "C_POINTS_JUSTIFICATION",
-        "AP_INTERVENTION_TYPE",
-        "AP_TYPE_FR",
-        "C_TICKET_TYPE",
-        "C_TICKET_TYPE_STRING_FR",
-        "AP_SD_REQUEST_ID")]
+    return df.to_json(orient = "records", force_ascii = False).encode("utf-8")
 
-    location_translator = {
-        "CNR DIR REGION BELLEY": "DHR Belley",
-        "CNR AMGT BELLEY-BREG CORD": "DHR Bregnier-Cordon",
-        "CNR AMGT GENISSIAT": "DHR Genissiat",
-        "CNR AMGT SAULT BRENAZ-LOY": "DHR Sault Brenaz",
-        "CNR AMGT SEYSSEL-CHAUTAGN": "DHR Seyssel",
-        "CNR SIEGE SOCIAL": "DM Siege",
-        "CNR DELEGATION DE PARIS": "DM Paris",
-        "CNR LABORATOIRE GERLAND": "DM CACOH",
-        "CNR PORT EDOUARD HERRIOT": "DM PLEH",
-        "CNR USINE PIERRE BENITE": "DM Pierre Benite",
-        "CNR DIR REGION VIENNE": "DRS Vienne",
-        "CNR JEAN BART": "DRS Jean Bart",
-        "Bureau MAINTENANCE": "DRS Jean Bart",
-        "CNR USINE DE GERVANS": "DRS Gervans",
-        "CNR USINE DE SABLONS": "DRS Sablons",
-        "CNR USINE DE VAUGRIS": "DRS Vaugris",
-        "CNR DIR REGION VALENCE": "DRI Valence",
-        "CNR USINE BOURG LES VALENCE": "DRI Bourg-les-Valences",
-        "CNR USINE DE LOGIS NEUF": "DRI Logis-Neuf",
-        "CNR USINE DE CHATEAUNEUF": "DRI CH9",
-        "CNR USINE DE BEAUCHASTEL": "DRI Beauchastel",
-        "CNR DIR REGION AVIGNON": "DRM Avignon",
-        "CNR USINE D AVIGNON": "DRM Usine Avignon",
-        "CNR USINE DE BEAUCAIRE": "DRM Beaucaire",
-        "CNR USINE DE BOLLENE": "DRM Bollene",
-        "CNR USINE DE CADEROUSSE": "DRM Caderousse",
-        "CNR USINE DE BARCARIN": "DRM Barcarin"
-    }
+
+def format_datatable(df) -> pd.DataFrame:
+    ''' Selects, translates and renames the columns of the tickets for the datatables
+
+    Returns:
+        df (dataframe): one column per field of DatatableItemResponseModel, with the
+            type of the field
+    '''
+    assert isinstance(df, pd.DataFrame)
+
+    df = df.assign(C_POINTS_JUSTIFICATION = data_analysis.get_points_justification(df))
+    df = df.loc[:, list(DATATABLE_COLUMNS.values())]
 
     if "AP_SD_RECIPIENT_LOCATION_RH" in df.columns:
-        df.replace(location_translator, inplace = True)
-        df.loc[df["AP_SD_RECIPIENT_LOCATION_RH"].isnull(), ("AP_SD_RECIPIENT_LOCATION_RH")] = "Pas de location"
+        df.replace(LOCATION_TRANSLATOR, inplace = True)
+        df.loc[df["AP_SD_RECIPIENT_LOCATION_RH"].isnull(), ("AP_SD_RECIPIENT_LOCATION_RH")] = NO_LOCATION
 
     categorical_cols = ["AP_SD_STATUS_FR", "AP_SD_PARENT_REQUEST_ID", "AP_SD_CATALOG_NAME",
         "AP_SD_RECIPIENT_LOCATION_RH", "AP_SD_CI_NAME", "AP_SD_URGENCY", "AP_SD_SUPPORT_TYPE"]
@@ -348,32 +443,31 @@ def format_df_before_dispatch(df) -> List[Dict[str, Union[str, int]]]:
         if col in df.columns:
             df[col] = df[col].astype(str)
 
-    df.loc[:,"C_POINTS"] = df["C_POINTS"].astype(str)
-    df.loc[:,"AP_TYPE_FR"] = df["AP_TYPE_FR"].astype(str)
-
-    df.rename(columns={
-        "AP_SD_RFC_NUMBER": "SPOT",
-        "AP_SD_STATUS_FR": "Statut",
-        "AP_SD_RECIPIENT_LAST_NAME": "Beneficiaire",
-        "AP_SD_RECIPIENT_LOCATION_RH": "Location",
-        "AP_SD_URGENCY": "Priorite",
-        "AP_SD_CI_NAME": "CI",
-        "AP_SD_COMMENT": "Description",
-        "C_RDV_DATE": "C_RDV_DATE",
-        "C_RDV_STATE": "C_RDV_STATE",
-        "AP_SD_DONE_BY_OPERATOR_NAME": "Operateur",
-        "C_POINTS": "Score",
-        "AP_TYPE_FR": "Inter_Type"
-    },
-    inplace=True)
-
-    result: List[Dict[str, Union[str, int]]] = df.to_dict(orient="records")
-    return result
+    df["AP_TYPE_FR"] = df["AP_TYPE_FR"].astype(str)
+
+    df.rename(columns = {column: field for field, column in DATATABLE_COLUMNS.items()}, inplace = True)
+
+    datatable_types = get_datatable_types()
+    if list(df.columns) != list(datatable_types):
+        raise ValueError("The datatable columns {} do not match DatatableItemResponseModel".format(list(df.columns)))
+
+    for column, field_type in datatable_types.items():
+        if isinstance(df[column].dtype, pd.StringDtype):
+            # the missing free texts stay NA in the snapshot, astype(str) would send them as "<NA>"
+            df[column] = df[column].fillna("")
+
+        if field_type is int:
+            df[column] = df[column].astype("int64")
+        elif not pd.api.types.is_object_dtype(df[column].dtype):
+            df[column] = df[column].astype(str)
+
+    assert isinstance(df, pd.DataFrame)
+    return df
 
 
 def get_suspended_mail_not_recontacted_table(df) -> Dict[str, List[Dict[str, Union[str, int]]]]:
     assert isinstance(df, pd.DataFrame)
-    df.sort_values(by = "AP_SD_MAX_RESOLUTION_DATE", inplace = True)
+    df = df.sort_values(by = "AP_SD_MAX_RESOLUTION_DATE")
     df = df.loc[:,("AP_SD_RFC_NUMBER", "AP_TYPE_FR", "AP_SD_RECIPIENT_LOCATION_RH", "AP_AM_DONE_BY_OPERATOR_NAME")]
     df = df.head(25)
 
@@ -0,0 +1,173 @@
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Callable, Dict, Union
+
+from fastapi.logger import logger as log
+from pymemcache.client.base import Client
+from sqlalchemy.engine.base import Engine
+
+from apollo.pipeline import data_collection
+
+###############################
+# SPOT PREFETCH SCHEDULER
+###############################
+
+# seconds before CACHE_EXPIRE at which the published versions are refreshed
+PREFETCH_MARGIN: int = 60
+# seconds to wait before retrying after a failed refresh
+RETRY_DELAY: int = 30
+# every FULL_RELOAD_EVERY runs the datasets are reloaded in full instead of incrementally,
+# this drops the rows deleted in SPOT and resets the LAST_UPDATE watermarks
+FULL_RELOAD_EVERY: int = 12
+
+
+class SpotPrefetchScheduler:
+    ''' Keeps the SD_REQUEST / AM_ACTION versions published in memcached warm
+
+    Runs in the event loop of the API process. Each run queries SPOT in the default
+    thread pool, publishes both datasets under new uuids, exports them to shared
+    memory for the workers of this process and sleeps until shortly before the
+    oldest one goes stale. The refresh goes through the same lease as the readers,
+    so several API processes never query SPOT at the same time.
+
+    Runs only fetch the rows updated since the previous version, except every
+    full_reload_every runs where the datasets are reloaded in full.
+    '''
+
+    def __init__(self, engine: Callable[[], Engine], memcached_client_factory: Callable[[], Client],
+                 cache_expire: int, margin: int = PREFETCH_MARGIN, full_reload_every: int = FULL_RELOAD_EVERY):
+        self.engine = engine
+        self.memcached_client_factory = memcached_client_factory
+        self.cache_expire = cache_expire
+        self.margin = min(margin, cache_expire // 2)
+        self.full_reload_every = full_reload_every
+
+        self.last_run: Union[datetime, None] = None
+        self.last_duration: Union[float, None] = None
+        self.last_error: Union[str, None] = None
+        self.last_full_reload: Union[datetime, None] = None
+        self.runs: int = 0
+        self.next_run: Union[datetime, None] = None
+        self.rows: Dict[str, Union[int, None]] = {
+            data_collection.REQUESTS_DATASET: None,
+            data_collection.TASKS_DATASET: None
+        }
+
+        self._task: Union[asyncio.Task, None] = None
+
+    def _refresh(self, refresh_func: Callable[[Callable[[], Engine], Client, bool], Union[Dict, None]],
+                 full_reload: bool) -> Union[Dict, None]:
+        # runs in a worker thread, pymemcache clients are not thread safe
+        memcached_client = self.memcached_client_factory()
+        try:
+            return refresh_func(self.engine, memcached_client, full_reload)
+        finally:
+            memcached_client.close()
+
+    def _share(self) -> None:
+        # the API process exports the published versions for its ProcessPoolExecutor workers
+        memcached_client = self.memcached_client_factory()
+        try:
+            for dataset in (data_collection.REQUESTS_DATASET, data_collection.TASKS_DATASET):
+                data_collection.share_published_version(memcached_client, dataset)
+        except Exception as error:
+            log.error("SPOT snapshot export to shared memory failed: {}".format(error))
+        finally:
+            memcached_client.close()
+
+    def _seconds_until_next_run(self) -> float:
+        memcached_client = self.memcached_client_factory()
+        try:
+            published_at = []
+            for dataset in (data_collection.REQUESTS_DATASET, data_collection.TASKS_DATASET):
+                current = data_collection.get_published_version(memcached_client, dataset)
+                if current is None:
+                    return 0
+                published_at.append(current["published_at"])
+        finally:
+            memcached_client.close()
+
+        return max(0, min(published_at) + self.cache_expire - self.margin - time.time())
+
+    async def run_once(self, full_reload: Union[bool, None] = None) -> None:
+        ''' Refreshes and publishes both datasets now
+
+        Args:
+            full_reload: reload the datasets in full, by default only every
+                full_reload_every runs
+        '''
+        if full_reload is None:
+            full_reload = self.full_reload_every <= 1 or self.runs % self.full_reload_every == 0
+
+        loop = asyncio.get_event_loop()
+        start = time.perf_counter()
+        self.last_run = datetime.now()
+        self.runs += 1
+
+        try:
+            requests, tasks = await asyncio.gather(
+                loop.run_in_executor(None, self._refresh, data_collection.refresh_requests, full_reload),
+                loop.run_in_executor(None, self._refresh, data_collection.refresh_tasks, full_reload))
+
+            for dataset, current in ((data_collection.REQUESTS_DATASET, requests), (data_collection.TASKS_DATASET, tasks)):
+                if current is not None:
+                    self.rows[dataset] = current["rows"]
+
+            self.last_error = None
+            await loop.run_in_executor(None, self._share)
+            if full_reload:
+                self.last_full_reload = self.last_run
+
+        except Exception as error:
+            self.last_error = str(error)
+            log.error("SPOT prefetch failed: {}".format(error))
+            raise
+
+        finally:
+            self.last_duration = time.perf_counter() - start
+            log.info("SPOT prefetch ({}) done in {:.1f}s - rows {}".format(
+                "full" if full_reload else "incremental", self.last_duration, self.rows))
+
+    async def _run(self) -> None:
+        loop = asyncio.get_event_loop()
+
+        while True:
+            try:
+                await loop.run_in_executor(None, self._share)
+                delay = await loop.run_in_executor(None, self._seconds_until_next_run)
+                if self.last_run is not None:
+                    # another process may hold the lease, do not spin while it publishes
+                    delay = max(delay, RETRY_DELAY)
+                self.next_run = datetime.fromtimestamp(time.time() + delay)
+                await asyncio.sleep(delay)
+                await self.run_once()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                self.next_run = datetime.fromtimestamp(time.time() + RETRY_DELAY)
+                await asyncio.sleep(RETRY_DELAY)
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.get_event_loop().create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def status(self) -> Dict[str, Any]:
+        return {
+            "running": self._task is not None and not self._task.done(),
+            "last_run": self.last_run,
+            "last_duration": self.last_duration,
+            "last_error": self.last_error,
+            "last_full_reload": self.last_full_reload,
+            "next_run": self.next_run,
+            "rows": self.rows
+        }
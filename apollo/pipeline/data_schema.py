@@ -0,0 +1,255 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Union
+
+import numpy as np
+import pandas as pd
+
+###############################
+# SNAPSHOT SCHEMA
+###############################
+
+# Dtypes of the cleaned SD_REQUEST / AM_ACTION frames. The cleaning functions apply
+# them and build_enriched_snapshot validates them, a frame which does not match is
+# not served. Kinds:
+#   * "int": ids, downcast to the smallest integer dtype holding them (nullable if NULLs)
+#   * "category": the labels repeated on every row (status, urgency, catalog, group, operator)
+#   * "datetime": DATETIME_DTYPE, the only datetime dtype of the snapshot
+#   * "string": free text, Arrow backed when pyarrow is installed, missing values stay NA
+# The columns missing from the frame (local CSV exports) are skipped, the ones not
+# listed are left as they are.
+
+INT: str = "int"
+CATEGORY: str = "category"
+DATETIME: str = "datetime"
+STRING: str = "string"
+
+DATE_FORMAT: str = "%Y-%m-%d %H:%M:%S.%f"
+DATETIME_DTYPE = pd.DatetimeTZDtype("ns", "Europe/Paris")
+
+try:
+    import pyarrow  # noqa: F401
+    STRING_DTYPE = pd.StringDtype("pyarrow")
+except ImportError:
+    STRING_DTYPE = pd.StringDtype("python")
+
+
+REQUESTS_SCHEMA: Dict[str, str] = {
+    "AP_SD_REQUEST_ID": INT,
+    "SUBMITTED_BY": INT,
+    "REQUESTOR_ID": INT,
+    "AP_SD_LOCATION_ID": INT,
+    "AP_SD_RECIPIENT_ID": INT,
+    "AP_SD_CATALOG_ID": INT,
+    "AP_SD_STATUS_ID": INT,
+    "AP_SD_URGENCY_ID": INT,
+    "AP_SD_CI_ID": INT,
+    "AP_SD_OWNER_ID": INT,
+    "AP_SD_OWNING_GROUP_ID": INT,
+    "AP_SD_DEPARTMENT_ID": INT,
+    "AP_SD_ASSET_ID": INT,
+    "AP_SD_SEVERITY_ID": INT,
+    "AP_SD_REQUEST_ORIGIN_ID": INT,
+    "AP_SD_LAST_GROUP_ID": INT,
+    "AP_SD_LAST_DONE_BY_ID": INT,
+    "AP_SD_SLA_ID": INT,
+    "AP_SD_IMPACT_ID": INT,
+    "AP_SD_PARENT_REQUEST_ID": CATEGORY,
+    "AP_SD_STATUS_FR": CATEGORY,
+    "AP_SD_CATALOG_NAME": CATEGORY,
+    "AP_SD_URGENCY": CATEGORY,
+    "AP_SD_SUPPORT_TYPE": CATEGORY,
+    "AP_SD_RECIPIENT_LOCATION_RH": CATEGORY,
+    "AP_SD_REQUESTOR_LOCATION_RH": CATEGORY,
+    "AP_SD_CI_NAME": CATEGORY,
+    "SUBMITTED_BY_LAST_NAME": CATEGORY,
+    "REQUESTOR_LAST_NAME": CATEGORY,
+    "OWNER_LAST_NAME": CATEGORY,
+    "OWNING_GROUP_NAME": CATEGORY,
+    "AP_SD_CREATION_DATE_UT": DATETIME,
+    "AP_SD_SUBMIT_DATE_UT": DATETIME,
+    "AP_SD_END_DATE_UT": DATETIME,
+    "AP_SD_MAX_RESOLUTION_DATE": DATETIME,
+    "LAST_UPDATE": DATETIME,
+    "AP_SD_RFC_NUMBER": STRING,
+    "AP_SD_RECIPIENT_LAST_NAME": STRING,
+    "AP_SD_COMMENT": STRING,
+    "AP_SD_DESCRIPTION": STRING,
+    "AP_SD_MATERIAL_NAME": STRING,
+    "AP_SD_REQUESTOR_PHONE": STRING,
+    "AP_SD_REQUESTOR_FEEDBACK": STRING,
+    "AP_SD_E_INFRA_COMMENT": STRING
+}
+
+TASKS_SCHEMA: Dict[str, str] = {
+    "AP_AM_ACTION_ID": INT,
+    "AP_AM_REQUEST_ID": INT,
+    "AP_AM_ASSET_ID": INT,
+    "AP_AM_PARENT_ACTION_ID": INT,
+    "AP_AM_VALIDATOR_ID": INT,
+    "AP_AM_PROCESS_STEP_ID": INT,
+    "AP_AM_LOCATION_ID": INT,
+    "AP_AM_DONE_BY_ID": INT,
+    "AP_AM_GROUP_ID": INT,
+    "AP_AM_CONTACT_ID": INT,
+    "AP_AM_STATUS_ID_ON_CREATE": INT,
+    "AP_AM_STATUS_ID_ON_TERMINATE": INT,
+    "AP_AM_ORIGIN_ACTION_ID": INT,
+    "AP_AM_WORKFLOW_ID": INT,
+    "AP_AM_PREVIOUS_SIBLING_ID": INT,
+    "AP_AM_HISTORY_ID": INT,
+    "AP_AM_ACTION_TYPE_ID": CATEGORY,
+    "AP_AM_ACTION_TYPE": CATEGORY,
+    "AP_AM_OPERATION_TYPE_NAME": CATEGORY,
+    "AP_AM_DONE_BY_OPERATOR_NAME": CATEGORY,
+    "AP_AM_GROUP_FR": CATEGORY,
+    "AP_AM_START_DATE": DATETIME,
+    "AP_AM_END_DATE_UT": DATETIME,
+    "AP_AM_EXPECTED_START_DATE_UT": DATETIME,
+    "AP_AM_CREATION_DATE_UT": DATETIME,
+    "AP_AM_EXPECTED_END_DATE_UT": DATETIME,
+    "AP_AM_LAST_UPDATE": DATETIME,
+    "AP_AM_RFC_NUMBER": STRING,
+    "AP_AM_DESCRIPTION": STRING
+}
+
+
+def _integer_dtype(values: pd.Series) -> str:
+    ''' Returns the smallest integer dtype holding the values, nullable if some are missing '''
+    dtype = "int64"
+    if values.notnull().any():
+        for candidate in ("int8", "int16", "int32"):
+            info = np.iinfo(candidate)
+            if values.min() >= info.min and values.max() <= info.max:
+                dtype = candidate
+                break
+
+    return dtype.capitalize() if values.isnull().any() else dtype
+
+
+def _is_kind(series: pd.Series, kind: str) -> bool:
+    if kind == INT:
+        return pd.api.types.is_integer_dtype(series.dtype)
+    if kind == CATEGORY:
+        return isinstance(series.dtype, pd.CategoricalDtype)
+    if kind == DATETIME:
+        return series.dtype == DATETIME_DTYPE
+    if kind == STRING:
+        return series.dtype == STRING_DTYPE
+
+    raise ValueError("Unknown schema kind: {}".format(kind))
+
+
+def apply_schema(df: pd.DataFrame, schema: Dict[str, str]) -> pd.DataFrame:
+    ''' Converts the columns of the frame to the dtypes of the schema
+
+    Args:
+        df: the cleaned frame, modified in place
+        schema: REQUESTS_SCHEMA or TASKS_SCHEMA
+
+    Returns:
+        df: the frame with the schema dtypes
+    '''
+    assert isinstance(df, pd.DataFrame)
+
+    for column, kind in schema.items():
+        # the integer columns are downcast even when they already are integers
+        if column not in df.columns or (kind != INT and _is_kind(df[column], kind)):
+            continue
+
+        if kind == INT:
+            values = pd.to_numeric(df[column], errors = "coerce")
+            dtype = _integer_dtype(values)
+            if df[column].dtype != dtype:
+                df[column] = values.astype(dtype)
+        elif kind == CATEGORY:
+            df[column] = df[column].astype("category")
+        elif kind == DATETIME:
+            if not isinstance(df[column].dtype, pd.DatetimeTZDtype):
+                df[column] = pd.to_datetime(df[column], format = DATE_FORMAT, errors = "coerce", utc = True)
+            df[column] = df[column].dt.tz_convert(DATETIME_DTYPE.tz).astype(DATETIME_DTYPE)
+        elif kind == STRING:
+            df[column] = df[column].astype(STRING_DTYPE)
+
+    assert isinstance(df, pd.DataFrame)
+    return df
+
+
+def validate_schema(df: pd.DataFrame, schema: Dict[str, str], name: str) -> None:
+    ''' Raises ValueError listing the columns of the frame which do not have the dtype of the schema '''
+    assert isinstance(df, pd.DataFrame)
+
+    errors: List[str] = ["{} is {}, expected {}".format(column, df[column].dtype, kind)
+                         for column, kind in schema.items()
+                         if column in df.columns and not _is_kind(df[column], kind)]
+
+    if errors:
+        raise ValueError("{} does not match its schema: {}".format(name, ", ".join(errors)))
+
+
+###############################
+# DATES
+###############################
+
+# The date columns of a frame are parsed together, in one pd.to_datetime call sharing
+# its cache of the values already seen. A tz-aware column holds the UTC int64 values,
+# Europe/Paris is only its display timezone: tz_convert does not touch the values.
+#
+# A pipeline run (one flow, one snapshot build) compares the dates to a single
+# reference "now", set by reference_time and read with get_now.
+
+_reference_time: Union[pd.Timestamp, None] = None
+
+
+def normalize_dates(df: pd.DataFrame, columns: List[str], date_format: Union[str, None] = None) -> pd.DataFrame:
+    ''' Converts the date columns to Europe/Paris datetimes, parsing the text ones in one pass
+
+    Args:
+        df: the frame, modified in place
+        columns: the date columns, the ones missing from the frame are skipped
+        date_format: format of the text dates, DATE_FORMAT by default. The datetime
+            columns (typed SPOT reads, naive UTC) are not parsed.
+    '''
+    assert isinstance(df, pd.DataFrame)
+
+    columns = [x for x in columns if x in df.columns]
+    text_columns = [x for x in columns if not pd.api.types.is_datetime64_any_dtype(df[x].dtype)]
+
+    if text_columns:
+        parsed = pd.to_datetime(pd.concat([df[x].astype(object) for x in text_columns], ignore_index = True),
+                                format = date_format if date_format else DATE_FORMAT,
+                                errors = "coerce",
+                                utc = True).array
+        for i, x in enumerate(text_columns):
+            df[x] = pd.Series(parsed[i * len(df.index):(i + 1) * len(df.index)], index = df.index)
+
+    for x in columns:
+        if df[x].dt.tz is None:
+            df[x] = df[x].dt.tz_localize("UTC")
+        df[x] = df[x].dt.tz_convert(DATETIME_DTYPE.tz)
+
+    assert isinstance(df, pd.DataFrame)
+    return df
+
+
+def get_now() -> pd.Timestamp:
+    ''' Returns the reference time of the pipeline run, the current time outside of one '''
+    if _reference_time is not None:
+        return _reference_time
+
+    return pd.Timestamp.now(tz = DATETIME_DTYPE.tz)
+
+
+@contextmanager
+def reference_time(now: Union[pd.Timestamp, None] = None) -> Iterator[pd.Timestamp]:
+    ''' Sets the reference time of the pipeline run, an enclosing run keeps its own '''
+    global _reference_time
+
+    if _reference_time is not None:
+        yield _reference_time
+        return
+
+    _reference_time = now if now is not None else pd.Timestamp.now(tz = DATETIME_DTYPE.tz)
+    try:
+        yield _reference_time
+    finally:
+        _reference_time = None
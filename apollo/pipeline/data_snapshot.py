@@ -0,0 +1,215 @@
+from typing import Any, Dict, Tuple, Union
+
+import numpy as np
+import pandas as pd
+from apollo import crud
+from apollo.pipeline import data_analysis, data_preparation, data_schema, feature_engineering, scoring_rules
+
+###############################
+# ENRICHED SNAPSHOT
+###############################
+
+# The enriched frames are built once per data version (the SPOT_requests_uuid /
+# SPOT_requests_operations_uuid pair and the version of the scoring rules) and kept
+# in the worker process until a new version is published. Only the latest version is kept.
+# The intervention classification can change in between (PATCH /api/request-classification),
+# its columns are then merged again on the cached tickets.
+_snapshot_cache: Dict[Tuple[str, str, str], Tuple[pd.DataFrame, pd.DataFrame, str]] = {}
+# {(column, ascending): AP_SD_REQUEST_ID sorted on the column} of the cached tickets
+_sorted_request_ids: Dict[Tuple[str, bool], pd.Index] = {}
+# the technician index of the cached tickets, see get_technician_index
+_technician_index: Union[feature_engineering.TechnicianIndex, None] = None
+
+
+def build_enriched_snapshot(e1: pd.DataFrame, e2: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    ''' Runs the full preparation, enrichment and scoring pipeline on the raw SPOT frames
+
+    Args:
+        e1: raw SD_REQUEST frame, as returned by data_collection.load_dataset_version
+        e2: raw AM_ACTION frame, as returned by data_collection.load_dataset_version
+
+    Returns:
+        df: the cleaned tickets with type, category flags, dates, classification, the per request
+            features of the actions (technician, RDV, contacts, ...) and points.
+            No technician filter is applied.
+        df_operations: the cleaned actions
+    '''
+    assert isinstance(e1, pd.DataFrame)
+    assert isinstance(e2, pd.DataFrame)
+
+    with data_schema.reference_time():
+        df, df_operations = _build_enriched_snapshot(e1, e2)
+
+    assert isinstance(df, pd.DataFrame)
+    assert isinstance(df_operations, pd.DataFrame)
+    return (df, df_operations)
+
+
+def _build_enriched_snapshot(e1: pd.DataFrame, e2: pd.DataFrame) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    df = data_preparation.clean_ticket_data(e1)
+    df = data_preparation.correct_spot_bugs_request(df)
+    df_operations = data_preparation.clean_ticket_tasks_data(e2)
+    df_operations = data_preparation.correct_spot_bugs_request_operations(
+        df_operations)
+
+    data_schema.validate_schema(df, data_schema.REQUESTS_SCHEMA, "SD_REQUEST")
+    data_schema.validate_schema(df_operations, data_schema.TASKS_SCHEMA, "AM_ACTION")
+
+    # the actions are only gone through once, the flows read the joined features
+    features = feature_engineering.get_request_features(df_operations)
+
+    df = feature_engineering.get_ticket_type(df)
+    df = feature_engineering.get_ticket_text_classification(df)
+    df = feature_engineering.get_start_date(df, df_operations)
+    df = feature_engineering.join_request_features(df, features)
+    df = feature_engineering.get_ticket_age(df)
+    df = feature_engineering.get_ticket_classification(df)
+
+    df = data_analysis.get_rdv_date_state(df)
+    df = data_analysis.calculate_ticket_flow(df, df_operations)
+
+    return (df, df_operations)
+
+
+def get_cached_snapshot(df_uuid: str, df_operations_uuid: str) -> Union[Tuple[pd.DataFrame, pd.DataFrame], None]:
+    ''' Returns the enriched frames of the data version if they are cached, None otherwise
+
+    The frames are not copied, they are shared by the flows of the worker: the flows
+    never write to them, tests/test_data_workflows.py checks it for every flow.
+    '''
+    global _technician_index
+
+    key = (df_uuid, df_operations_uuid, scoring_rules.get_scoring_rules().version)
+    if key not in _snapshot_cache:
+        return None
+
+    df, df_operations, classification_version = _snapshot_cache[key]
+
+    classification = crud.get_intervention_classification()
+    if classification.version != classification_version:
+        df = df.drop(columns = feature_engineering.CLASSIFICATION_COLUMNS)
+        df = feature_engineering.get_ticket_classification(df)
+        _snapshot_cache[key] = (df, df_operations, classification.version)
+        _sorted_request_ids.clear()
+        _technician_index = None
+
+    return (df, df_operations)
+
+
+def get_enriched_snapshot(e1: pd.DataFrame, df_uuid: str, e2: pd.DataFrame, df_operations_uuid: str) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    ''' Returns the enriched frames for the given data version, building them on first use
+
+    See get_cached_snapshot for the frames returned.
+    '''
+    global _technician_index
+
+    key = (df_uuid, df_operations_uuid, scoring_rules.get_scoring_rules().version)
+
+    if key not in _snapshot_cache:
+        df, df_operations = build_enriched_snapshot(e1, e2)
+        _snapshot_cache.clear()
+        _sorted_request_ids.clear()
+        _technician_index = None
+        _snapshot_cache[key] = (df, df_operations, crud.get_intervention_classification().version)
+
+    return get_cached_snapshot(df_uuid, df_operations_uuid)
+
+
+def get_technician_index() -> Union[feature_engineering.TechnicianIndex, None]:
+    ''' Returns the technician index of the cached tickets, for the frames returned by get_enriched_snapshot
+
+    None if no snapshot is cached.
+    '''
+    global _technician_index
+
+    if _technician_index is None and _snapshot_cache:
+        df = next(iter(_snapshot_cache.values()))[0]
+        _technician_index = feature_engineering.TechnicianIndex(df["AP_AM_DONE_BY_OPERATOR_NAME"])
+
+    return _technician_index
+
+
+###############################
+# DATATABLE PAGES
+###############################
+
+# The datatables are sorted with an index built once per cached snapshot and column:
+# the request ids of the snapshot in the order of the column. The rows of a rule are
+# put in that order by looking up their request id, without sorting them again.
+
+def _sort_positions(values: pd.Series, ascending: bool = True) -> np.ndarray:
+    # stable in both orders (equal values keep their order), the missing values last
+    return values.reset_index(drop = True).sort_values(ascending = ascending, kind = "mergesort",
+                                                       na_position = "last").index.to_numpy()
+
+
+def get_sorted_request_ids(column: str, ascending: bool = True) -> Union[pd.Index, None]:
+    ''' Returns the request ids of the cached tickets sorted on the column
+
+    None if no snapshot is cached or if the request ids are not unique.
+    '''
+    if (column, ascending) not in _sorted_request_ids:
+        if not _snapshot_cache:
+            return None
+
+        df = next(iter(_snapshot_cache.values()))[0]
+        request_ids = pd.Index(df["AP_SD_REQUEST_ID"])
+        if not request_ids.is_unique:
+            return None
+
+        order = _sort_positions(data_preparation.get_datatable_values(df, column), ascending)
+        _sorted_request_ids[(column, ascending)] = request_ids[order]
+
+    return _sorted_request_ids[(column, ascending)]
+
+
+def sort_datatable(df: pd.DataFrame, column: str, ascending: bool = True) -> np.ndarray:
+    ''' Returns the positions of the rows of the tickets in the order of the column '''
+    assert isinstance(df, pd.DataFrame)
+
+    request_ids = get_sorted_request_ids(column, ascending)
+    if request_ids is not None:
+        ranks = request_ids.get_indexer(df["AP_SD_REQUEST_ID"])
+
+        if (ranks >= 0).all():
+            rows = np.full(len(request_ids), -1, dtype = np.int64)
+            rows[ranks] = np.arange(len(ranks))
+            rows = rows[rows >= 0]
+
+            # a request present twice in the rows falls back to the sort below
+            if len(rows) == len(ranks):
+                return rows
+
+    return _sort_positions(data_preparation.get_datatable_values(df, column), ascending)
+
+
+def get_datatable_page(df: pd.DataFrame, page: Union[Dict[str, Any], None] = None) -> Tuple[pd.DataFrame, int]:
+    ''' Filters, sorts and slices the tickets of a datatable
+
+    Args:
+        df: the tickets returned by a rule
+        page: returned by data_preparation.parse_datatable_page, all the rows if None
+
+    Returns:
+        (the rows of the page, number of rows before the page is sliced)
+    '''
+    assert isinstance(df, pd.DataFrame)
+
+    if page is None:
+        return (df, len(df.index))
+
+    for column, text in page["filters"]:
+        df = df.loc[data_preparation.match_datatable_filter(df, column, text)]
+    total = len(df.index)
+
+    start = page["offset"]
+    stop = None if page["limit"] is None else start + page["limit"]
+
+    if page["sort"] is not None:
+        column, ascending = page["sort"]
+        df = df.iloc[sort_datatable(df, column, ascending)[start:stop]]
+    else:
+        df = df.iloc[start:stop]
+
+    assert isinstance(df, pd.DataFrame)
+    return (df, total)
@@ -1,26 +1,105 @@
-import asyncio
-from typing import Any, Dict, Union
+from typing import Any, Callable, Dict, Tuple, Union
 
 import pandas as pd
 from apollo.main import site_settings
-from apollo.database import create_spot_engine
-from apollo.pipeline import (data_analysis, data_collection, data_preparation,
-                             data_visualisation, feature_engineering)
+from apollo.database import get_spot_engine
+from apollo.pipeline import (data_analysis, data_collection, data_preparation, data_schema,
+                             data_snapshot, data_visualisation, feature_engineering)
 from pymemcache import serde
 from pymemcache.client.base import Client
 
-lock = asyncio.Lock()
-event_loop = asyncio.get_event_loop()
-
 
 ###############################
 # MEMCACHE CLIENT
 ###############################
 
-memcached_client = Client(
-    (site_settings.MEMCACHE_CLIENT, 11211), serde=serde.pickle_serde)
+def create_memcached_client() -> Client:
+    return Client(
+        (site_settings.MEMCACHE_CLIENT, 11211), serde=serde.pickle_serde)
+
+memcached_client = create_memcached_client()
+
+###############################
+
 
 ###############################
+# SNAPSHOT
+###############################
+
+# the SPOT versions the API process resolved for the flow being run, see run_flow
+_snapshot_versions: Union[Dict[str, str], None] = None
+
+
+def run_flow(snapshot_versions: Union[Dict[str, str], None], func: Callable, *param) -> Any:
+    ''' Entry point of the executor workers, runs the flow on the given SPOT versions
+
+    Args:
+        snapshot_versions: returned by data_collection.get_snapshot_versions,
+            None to use the versions currently published
+        func: the flow_* function
+    '''
+    global _snapshot_versions
+
+    _snapshot_versions = snapshot_versions
+    try:
+        # the snapshot build and the rules of the flow compare the dates to the same now
+        with data_schema.reference_time():
+            return func(*param)
+    finally:
+        _snapshot_versions = None
+
+
+def get_snapshot(tech_filter: str = None) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    ''' Returns the enriched tickets and the actions for the SPOT data version of the flow
+
+    The pipeline only runs for a new pair of uuids, otherwise the frames built for
+    the version are reused without loading the SPOT frames again.
+    '''
+    versions: Dict[str, str] = _snapshot_versions or {}
+
+    df_uuid: Union[str, None] = versions.get(data_collection.REQUESTS_DATASET)
+    df_operations_uuid: Union[str, None] = versions.get(data_collection.TASKS_DATASET)
+
+    snapshot = None
+    if df_uuid is not None and df_operations_uuid is not None:
+        snapshot = data_snapshot.get_cached_snapshot(df_uuid, df_operations_uuid)
+
+    if snapshot is None:
+        snapshot = _load_snapshot(df_uuid, df_operations_uuid)
+
+    df, df_operations = snapshot
+    df = feature_engineering.filter_by_tech(df, tech_filter, data_snapshot.get_technician_index())
+
+    return (df, df_operations)
+
+
+def _load_snapshot(df_uuid: Union[str, None], df_operations_uuid: Union[str, None]) -> Tuple[pd.DataFrame, pd.DataFrame]:
+    ''' Loads the SPOT frames of the versions and returns their enriched frames, see get_snapshot '''
+    e1: pd.DataFrame
+    e1, df_uuid = data_collection.load_dataset_version(
+        memcached_client, data_collection.REQUESTS_DATASET, df_uuid)
+
+    e2: pd.DataFrame
+    e2, df_operations_uuid = data_collection.load_dataset_version(
+        memcached_client, data_collection.TASKS_DATASET, df_operations_uuid,
+        columns=data_collection.TASKS_PIPELINE_COLUMNS)
+
+    return data_snapshot.get_enriched_snapshot(e1, df_uuid, e2, df_operations_uuid)
+
+
+def get_datatable(df: pd.DataFrame, page: Union[Dict[str, Any], None] = None) -> Tuple[bytes, int]:
+    ''' Returns the page of the datatable encoded to JSON and the number of rows of the datatable
+
+    Args:
+        df: the tickets returned by the rule of the flow
+        page: returned by data_preparation.parse_datatable_page, all the rows if None
+    '''
+    df, total = data_snapshot.get_datatable_page(df, page)
+
+    return (data_preparation.format_df_before_dispatch(df), total)
+
+###############################
+
 
 ######################################
 # EMPLOYEE MOUVEMENT CALENDAR
@@ -28,7 +107,7 @@ memcached_client = Client(
 
 def flow_get_employee_mouvement_calendar():
     df = data_collection.get_employee_mouvement_data(
-        engine=create_spot_engine, memcache=memcached_client)
+        engine=get_spot_engine, memcache=memcached_client)
     df = feature_engineering.get_employee_movement_question_info(df)
 
     result = data_analysis.get_employee_mouvement(df)
@@ -41,28 +120,7 @@ def flow_get_employee_mouvement_calendar():
 ######################################
 
 def flow_get_rdv_calendar():
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
+    df, df_operations = get_snapshot()
 
     result = data_analysis.get_rdv_dates(df)
 
@@ -73,68 +131,21 @@ def flow_get_rdv_calendar():
 # TICKETS UNDER OBSERVATION
 ######################################
 
-def flow_get_tickets_under_observation_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    # lock.release()
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+def flow_get_tickets_under_observation_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+    df = data_analysis.get_under_observation_tickets(df)
 
-    df = data_analysis.get_under_observation_tickets(df, df_operations)
-
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 
 def flow_get_tickets_under_observation_indicator(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
+    df, df_operations = get_snapshot(tech_filter)
 
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_under_observation_tickets(df, df_operations)
+    df = data_analysis.get_under_observation_tickets(df)
 
     result = data_analysis.get_df_len(df)
     return result
@@ -146,62 +157,18 @@ def flow_get_tickets_under_observation_indicator(tech_filter: str = None):
 # SUSPENDED MAIL NOT RECONTACTED
 ######################################
 
-def flow_get_software_installation_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+def flow_get_software_installation_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_tickets_software_install(df)
 
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_software_installation_indicator(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_tickets_software_install(df)
 
@@ -215,62 +182,18 @@ def flow_get_software_installation_indicator(tech_filter: str = None):
 # SUSPENDED MAIL NOT RECONTACTED
 ######################################
 
-def flow_get_new_arrivals_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+def flow_get_new_arrivals_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_new_arrival_tickets(df)
 
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_new_arrivals_indicator(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_new_arrival_tickets(df)
 
@@ -285,95 +208,28 @@ def flow_get_new_arrivals_indicator(tech_filter: str = None):
 ######################################
 
 def flow_get_suspended_mail_not_recontacted_table(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+    df, df_operations = get_snapshot(tech_filter)
 
-    df = data_analysis.get_suspended_mail_not_recontacted(df, df_operations)
+    df = data_analysis.get_suspended_mail_not_recontacted(df)
 
     result = data_preparation.get_suspended_mail_not_recontacted_table(df)
     return result
 
 
-def flow_get_suspended_mail_not_recontacted_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+def flow_get_suspended_mail_not_recontacted_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+    df = data_analysis.get_suspended_mail_not_recontacted(df)
 
-    df = data_analysis.get_suspended_mail_not_recontacted(df, df_operations)
-
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_suspended_mail_not_recontacted_indicator(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
+    df, df_operations = get_snapshot(tech_filter)
 
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_suspended_mail_not_recontacted(df, df_operations)
+    df = data_analysis.get_suspended_mail_not_recontacted(df)
 
     result = data_analysis.get_df_len(df)
     return result
@@ -385,66 +241,20 @@ def flow_get_suspended_mail_not_recontacted_indicator(tech_filter: str = None):
 # SUSPENDED GREATER THAN X TIME
 ######################################
 
-def flow_get_suspended_gt_x_datatable(inter_type_filter, tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
+def flow_get_suspended_gt_x_datatable(inter_type_filter, tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+    df = data_analysis.get_suspended_gt_x(df, inter_type_filter)
 
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
-
-    df = data_analysis.get_suspended_gt_x(df, df_operations, inter_type_filter)
-
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_suspended_gt_x_indicator(inter_type_filter, tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
+    df, df_operations = get_snapshot(tech_filter)
 
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_suspended_gt_x(df, df_operations, inter_type_filter)
+    df = data_analysis.get_suspended_gt_x(df, inter_type_filter)
 
     result = data_analysis.get_df_len(df)
     return result
@@ -456,67 +266,20 @@ def flow_get_suspended_gt_x_indicator(inter_type_filter, tech_filter: str = None
 # CONTACTED X NUMBER OF TIMES
 ######################################
 
-def flow_get_contacted_x_times_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+def flow_get_contacted_x_times_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
-    df = data_analysis.get_contacted_x_times(df, df_operations, 3)
+    df = data_analysis.get_contacted_x_times(df, 3)
 
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_contacted_x_times_indicator(tech_filter: str = None) -> int:
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
+    df, df_operations = get_snapshot(tech_filter)
 
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_contacted_x_times(df, df_operations, 3)
+    df = data_analysis.get_contacted_x_times(df, 3)
     result: int = data_analysis.get_df_len(df)
     return result
 
@@ -527,62 +290,18 @@ def flow_get_contacted_x_times_indicator(tech_filter: str = None) -> int:
 # NOT SUSPENDED REQUESTS
 ######################################
 
-def flow_get_not_suspended_incidents_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+def flow_get_not_suspended_incidents_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_not_suspended_incidents(df)
 
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_not_suspended_incidents_indicator(tech_filter: str = None) -> int:
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_not_suspended_incidents(df)
     result: int = data_analysis.get_df_len(df)
@@ -595,62 +314,18 @@ def flow_get_not_suspended_incidents_indicator(tech_filter: str = None) -> int:
 # INDUSTRIAL RELATED REQUESTS
 ######################################
 
-def flow_get_industrial_tickets_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+def flow_get_industrial_tickets_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_industrial_tickets(df)
 
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_industrial_tickets_indicator(tech_filter: str = None) -> int:
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_industrial_tickets(df)
     result = data_analysis.get_df_len(df)
@@ -663,62 +338,18 @@ def flow_get_industrial_tickets_indicator(tech_filter: str = None) -> int:
 # SECURITY RELATED REQUESTS
 ######################################
 
-def flow_get_security_tickets_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+def flow_get_security_tickets_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_av_security_tickets(df)
 
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_security_tickets_indicator(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_av_security_tickets(df)
     result = data_analysis.get_df_len(df)
@@ -732,66 +363,19 @@ def flow_get_security_tickets_indicator(tech_filter: str = None):
 ######################################
 
 def flow_get_vip_tickets_total_indicator(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_vip_tickets(df, vip_list=site_settings.VIP_LIST)
     result = data_analysis.get_df_len(df)
     return result
 
 
-def flow_get_vip_tickets_datatable(tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+def flow_get_vip_tickets_datatable(tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_vip_tickets(df, vip_list=site_settings.VIP_LIST)
 
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
@@ -802,76 +386,25 @@ def flow_get_vip_tickets_datatable(tech_filter: str = None):
 # GENERAL / HOTLINE / PROXI REQUESTS
 ######################################
 
-def flow_get_ticket_flow_datatable(inter_type: str = None, tech_filter: str = None):
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
-
-    df = data_analysis.get_rdv_date_state(df, df_operations)
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+def flow_get_ticket_flow_datatable(inter_type: str = None, tech_filter: str = None, page: Union[Dict[str, Any], None] = None):
+    df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_ticket_flow(df, inter_type=inter_type)
 
-    result = data_preparation.format_df_before_dispatch(df)
+    result = get_datatable(df, page)
 
     return result
 
 
 def flow_get_ticket_flow_indicator(inter_type=None, tech_filter=None, test_data = None):
-    e1: pd.DataFrame
-    df_uuid: str
-
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-
     if test_data:
         e1 = pd.DataFrame(test_data[0])
-        df_uuid = "123"
-
         e2 = pd.DataFrame(test_data[1])
-        df_operations_uuid = "123"
-    else:
-        e1, df_uuid = asyncio.run(data_collection.get_requests(
-                engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-        e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
-
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations, tech_filter)
 
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+        df, df_operations = data_snapshot.build_enriched_snapshot(e1, e2)
+        df = feature_engineering.filter_by_tech(df, tech_filter)
+    else:
+        df, df_operations = get_snapshot(tech_filter)
 
     df = data_analysis.get_ticket_flow(df, inter_type=inter_type)
     result = data_analysis.get_df_len(df)
@@ -879,90 +412,60 @@ def flow_get_ticket_flow_indicator(inter_type=None, tech_filter=None, test_data
 
 
 def flow_get_ticket_flow_score(inter_type: Union[str, None] = None, tech_filter=None) -> int:
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
+    df, df_operations = get_snapshot(tech_filter)
 
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
-
-    t1: pd.DataFrame = data_preparation.clean_ticket_data(e1)
-    t2: pd.DataFrame = data_preparation.correct_spot_bugs_request(t1)
-    t3: pd.DataFrame = data_preparation.clean_ticket_tasks_data(e2)
-    t4: pd.DataFrame = data_preparation.correct_spot_bugs_request_operations(
-        t3)
-
-    t5: pd.DataFrame = feature_engineering.get_ticket_type(t2)
-    t6: pd.DataFrame = feature_engineering.get_start_date(t5, t4)
-    t7: pd.DataFrame = feature_engineering.get_tickets_last_action_date(t6, t4)
-    t8: pd.DataFrame = feature_engineering.get_ticket_age(t7)
-    t9: pd.DataFrame = feature_engineering.get_ticket_classification(t8)
-    t10: pd.DataFrame = feature_engineering.get_ticket_tech_affectation(
-        t9, t4, tech_filter)
-
-    l1: pd.DataFrame = data_analysis.calculate_ticket_flow(t10, t4)
-
-    l2: pd.DataFrame = data_analysis.get_ticket_flow(l1, inter_type=inter_type)
-    result: int = data_analysis.get_total_score(l2)
+    df = data_analysis.get_ticket_flow(df, inter_type=inter_type)
+    result: int = data_analysis.get_total_score(df)
     return result
 
 
 def flow_get_tickets_by_expiration_table(intertype: str = None, tech_filter: str = None) -> Dict[Any, Any]:
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
+    df, df_operations = get_snapshot(tech_filter)
 
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
+    result: Dict[Any, Any] = data_analysis.get_tickets_by_expiration_time_table(df)
 
-    t1: pd.DataFrame = data_preparation.clean_ticket_data(e1)
-    t2: pd.DataFrame = data_preparation.correct_spot_bugs_request(t1)
-    t3: pd.DataFrame = data_preparation.clean_ticket_tasks_data(e2)
-    t4: pd.DataFrame = data_preparation.correct_spot_bugs_request_operations(
-        t3)
+    return result
 
-    t5: pd.DataFrame = feature_engineering.get_ticket_type(t2)
-    t6: pd.DataFrame = feature_engineering.get_ticket_classification(t5)
-    t7: pd.DataFrame = feature_engineering.get_ticket_tech_affectation(
-        t6, t4, tech_filter)
+def flow_get_technician_tickets_table() -> Dict[Any, Any]:
+    df, df_operations = get_snapshot()
 
-    r1: Dict[Any, Any] = data_analysis.get_tickets_by_expiration_time_table(t7)
+    result: Dict[Any, Any] = data_analysis.get_tickets_score_by_technician_table(df)
 
-    return r1
+    return result
 
-def flow_get_technician_tickets_table() -> Dict[Any, Any]:
-    e1: pd.DataFrame
-    df_uuid: str
-    e1, df_uuid = asyncio.run(data_collection.get_requests(
-            engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
 
-    e2: pd.DataFrame
-    df_operations_uuid: Union[str, None]
-    e2, df_operations_uuid = asyncio.run(data_collection.get_tasks(
-        engine=create_spot_engine, memcached_client=memcached_client, lock= lock))
+######################################
+# DASHBOARD
+######################################
 
-    df = data_preparation.clean_ticket_data(e1)
-    df = data_preparation.correct_spot_bugs_request(df)
-    df_operations = data_preparation.clean_ticket_tasks_data(e2)
-    df_operations = data_preparation.correct_spot_bugs_request_operations(
-        df_operations)
+def flow_get_dashboard(inter_type: Union[str, None] = None, tech_filter: Union[str, None] = None) -> Dict[str, Any]:
+    ''' Returns every indicator, score and small table of the dashboard from one snapshot
 
-    df = feature_engineering.get_ticket_type(df)
-    df = feature_engineering.get_start_date(df, df_operations)
-    df = feature_engineering.get_tickets_last_action_date(df, df_operations)
-    df = feature_engineering.get_ticket_age(df)
-    df = feature_engineering.get_ticket_classification(df)
-    df = feature_engineering.get_ticket_tech_affectation(
-        df, df_operations)
+    The rules only filter the tickets, they share the enriched frame. The technician
+    table is computed before the technician filter, like flow_get_technician_tickets_table.
+    '''
+    df_all, df_operations = get_snapshot()
+    df = feature_engineering.filter_by_tech(df_all, tech_filter, data_snapshot.get_technician_index())
 
-    df = data_analysis.calculate_ticket_flow(df, df_operations)
+    df_suspended_mail_not_recontacted = data_analysis.get_suspended_mail_not_recontacted(df)
+    df_ticket_flow = data_analysis.get_ticket_flow(df, inter_type=inter_type)
 
-    r1: Dict[Any, Any] = data_analysis.get_tickets_score_by_technician_table(df)
+    result: Dict[str, Any] = {
+        "suspended_mail_not_recontacted_indicator": data_analysis.get_df_len(df_suspended_mail_not_recontacted),
+        "under_observation_tickets_indicator": data_analysis.get_df_len(data_analysis.get_under_observation_tickets(df)),
+        "software_installation_indicator": data_analysis.get_df_len(data_analysis.get_tickets_software_install(df)),
+        "new_arrivals_indicator": data_analysis.get_df_len(data_analysis.get_new_arrival_tickets(df)),
+        "suspended_gt_x_indicator": data_analysis.get_df_len(data_analysis.get_suspended_gt_x(df, inter_type)),
+        "contacted_x_times_indicator": data_analysis.get_df_len(data_analysis.get_contacted_x_times(df, 3)),
+        "not_suspended_incidents_indicator": data_analysis.get_df_len(data_analysis.get_not_suspended_incidents(df)),
+        "industrial_tickets_total_indicator": data_analysis.get_df_len(data_analysis.get_industrial_tickets(df)),
+        "security_tickets_total_indicator": data_analysis.get_df_len(data_analysis.get_av_security_tickets(df)),
+        "vip_tickets_total_indicator": data_analysis.get_df_len(data_analysis.get_vip_tickets(df, vip_list=site_settings.VIP_LIST)),
+        "ticket_flow_indicator": data_analysis.get_df_len(df_ticket_flow),
+        "ticket_flow_score": data_analysis.get_total_score(df_ticket_flow),
+        "suspended_mail_not_recontacted_table": data_preparation.get_suspended_mail_not_recontacted_table(df_suspended_mail_not_recontacted),
+        "tickets_by_expiration_table": data_analysis.get_tickets_by_expiration_time_table(df),
+        "technician_total_tickets_table": data_analysis.get_tickets_score_by_technician_table(df_all)
+    }
 
-    return r1
+    return result
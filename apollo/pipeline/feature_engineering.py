@@ -1,105 +1,313 @@
 import re
+from bisect import bisect_left
 from datetime import timedelta
-from typing import Union
+from typing import Any, Dict, List, Union
 
+import numpy as np
 import pandas as pd
 from apollo.crud import get_requests_intervention_types
+from apollo.pipeline import data_preparation, data_schema
+
+
+######################################
+# REQUEST FEATURES
+######################################
+
+# The per request features derived from AM_ACTION. They are computed once per snapshot
+# by get_request_features and joined on the tickets, the dashboards read the columns
+# instead of going through the actions again.
+
+# **	20	Traitement Operation
+# **	21	Traitement Transition
+# **	32	Validation Operation
+# **	34	Clôture Service Desk
+# **	37	Clôture Transition
+# **	38	Validation Self Service avec Rating
+# **	50	Traitement Automatique
+# **	51	Affectation à un incident parent
+# **	52	Redirigé vers un niveau inférieur
+# **	54	Installation
+TECH_AFFECTATION_ACTION_TYPES = [20, 21, 32, 34, 37, 38, 50, 52, 54]
+
+# **	1	Validation Self Service
+# **	2	Logistique
+# **	22	Fin du Workflow
+# **	23	Etape conditionnelle
+# **	28	Clôture anticipée
+# **	42	Résolution par le parent
+# **	104	Validation Self Service avec Authentification
+# **	107	Historique des mouvements
+NOT_REALISATION_ACTION_TYPES = [1, 2, 22, 23, 39, 42, 104, 107, 111]
+
+# actions whose description can hold a #tagp# tag
+TAG_ACTION_TYPES = [65, 108]
+RDV_TAG = "#tagp# rdv:"
+RDV_DATE_REGEX = r'((?<=:)[0-9]{2}.[0-9]{2}.[0-9]{4})'
+UNDER_OBSERVATION_TAG = "#tagp# sousobservation"
+
+SUSPENSION_ACTION_TYPE = 5
+
+NOTIFICATION_TASK_REGEX = re.compile("Appel sortant utilisateur|Notification au demandeur|Relance vers l'utilisateur|Envoi de mail au demandeur",
+                                     flags=re.IGNORECASE)
+
+TECH_AFFECTATION_COLUMNS = ["AP_AM_ACTION_ID", "AP_AM_ACTION_TYPE_ID", "AP_AM_START_DATE", "AP_AM_DONE_BY_OPERATOR_NAME"]
+
+
+def get_request_features(df_operations: pd.DataFrame) -> pd.DataFrame:
+    ''' Derives the per request features from the actions
+
+    The actions are sorted once, latest first, and every feature is a groupby on
+    the sorted frame.
+
+    Args:
+        df_operations: the cleaned actions
+
+    Returns:
+        dataframe indexed by AP_AM_REQUEST_ID with the columns
+            * C_NO_OF_ACTIONS: number of actions
+            * C_LAST_ACTION_START: start of the first action not in NOT_REALISATION_ACTION_TYPES
+            * AP_AM_ACTION_ID, AP_AM_ACTION_TYPE_ID, AP_AM_START_DATE, AP_AM_DONE_BY_OPERATOR_NAME:
+              the last action in TECH_AFFECTATION_ACTION_TYPES, the technician of the ticket
+            * C_RDV_SET: an action is tagged with a RDV
+            * C_RDV_DATE: latest valid date of the RDV tags, NaT if none is valid
+            * C_UNDER_OBSERVATION: an action is tagged sous observation
+            * C_NO_OF_CONTACTS: number of local days with a user notification (several the same day count once)
+            * C_FIRST_CONTACT: last notification of the first day
+            * C_LAST_CONTACT: last notification
+            * C_LAST_SUSPENSION_DATE: start of the last suspension
+    '''
+    assert isinstance(df_operations, pd.DataFrame)
+
+    df_operations = df_operations.loc[:, ("AP_AM_ACTION_ID", "AP_AM_REQUEST_ID", "AP_AM_ACTION_TYPE_ID", "AP_AM_START_DATE",
+                                          "AP_AM_DONE_BY_OPERATOR_NAME", "AP_AM_OPERATION_TYPE_NAME", "AP_AM_DESCRIPTION")]
+    df_operations = df_operations.sort_values(by = ["AP_AM_START_DATE"], ascending = False, na_position = "first", kind = "stable")
+    action_type = df_operations["AP_AM_ACTION_TYPE_ID"]
+
+    grouped = df_operations.groupby("AP_AM_REQUEST_ID", sort = False)
+    features = pd.DataFrame({"C_NO_OF_ACTIONS": grouped.size()})
+
+    mask_realisation = ~action_type.isin(NOT_REALISATION_ACTION_TYPES)
+    features["C_LAST_ACTION_START"] = df_operations.loc[mask_realisation].groupby("AP_AM_REQUEST_ID", sort = False)["AP_AM_START_DATE"].min()
+
+    # first non null value of each column, in the latest first order
+    mask_tech_affectation = action_type.isin(TECH_AFFECTATION_ACTION_TYPES)
+    tech_affectation = df_operations.loc[mask_tech_affectation].groupby("AP_AM_REQUEST_ID", sort = False)[TECH_AFFECTATION_COLUMNS].first()
+    features = features.join(tech_affectation)
+
+    # RDV / observation tags
+    df_tags = df_operations.loc[action_type.isin(TAG_ACTION_TYPES) & df_operations["AP_AM_DESCRIPTION"].notnull(),
+                                ("AP_AM_REQUEST_ID", "AP_AM_DESCRIPTION")]
+    df_rdv = df_tags.loc[df_tags["AP_AM_DESCRIPTION"].str.contains(RDV_TAG, regex = False)]
+    rdv_date = pd.to_datetime(df_rdv["AP_AM_DESCRIPTION"].str.extract(RDV_DATE_REGEX, expand = False),
+                              errors = "coerce", format = "%d/%m/%Y", utc = True).dt.tz_convert('Europe/Paris')
+    under_observation = df_tags.loc[df_tags["AP_AM_DESCRIPTION"].str.contains(UNDER_OBSERVATION_TAG, regex = False), "AP_AM_REQUEST_ID"]
+
+    features["C_RDV_SET"] = features.index.isin(df_rdv["AP_AM_REQUEST_ID"])
+    features["C_RDV_DATE"] = rdv_date.groupby(df_rdv["AP_AM_REQUEST_ID"], sort = False).max()
+    features["C_UNDER_OBSERVATION"] = features.index.isin(under_observation)
+
+    # user notifications, only the last one of each local day is kept
+    mask_notification = df_operations["AP_AM_OPERATION_TYPE_NAME"].str.contains(NOTIFICATION_TASK_REGEX, na = False)
+    df_notifications = df_operations.loc[mask_notification, ("AP_AM_REQUEST_ID", "AP_AM_START_DATE")]
+    notification_day = df_notifications["AP_AM_START_DATE"].dt.tz_localize(None).dt.normalize().rename("C_NOTIFICATION_DAY")
+
+    last_of_day = df_notifications.groupby(["AP_AM_REQUEST_ID", notification_day], sort = False, dropna = False)["AP_AM_START_DATE"].max()
+    grouped_notifications = last_of_day.groupby(level = "AP_AM_REQUEST_ID", sort = False)
+    features["C_NO_OF_CONTACTS"] = grouped_notifications.size()
+    features["C_FIRST_CONTACT"] = grouped_notifications.min()
+    features["C_LAST_CONTACT"] = grouped_notifications.max()
+
+    mask_suspension = (action_type == SUSPENSION_ACTION_TYPE)
+    features["C_LAST_SUSPENSION_DATE"] = df_operations.loc[mask_suspension].groupby("AP_AM_REQUEST_ID", sort = False)["AP_AM_START_DATE"].max()
+
+    features["C_NO_OF_CONTACTS"] = features["C_NO_OF_CONTACTS"].fillna(0).astype(int)
 
+    assert isinstance(features, pd.DataFrame)
+    return features
 
-def get_ticket_tech_affectation(df: pd.DataFrame, df_operations: pd.DataFrame, tech_filter: str = None) -> pd.DataFrame:
+
+def join_request_features(df: pd.DataFrame, features: pd.DataFrame) -> pd.DataFrame:
+    ''' Joins the features of get_request_features on the tickets
+
+    Adds C_LAST_ACTION_DATE, the time elapsed since C_LAST_ACTION_START.
+    Tickets without actions get no technician, no dates and no contacts.
+    '''
     assert isinstance(df, pd.DataFrame)
-    assert isinstance(df_operations, pd.DataFrame)
+    assert isinstance(features, pd.DataFrame)
 
-    df_operations = df_operations.loc[:,("AP_AM_ACTION_ID", "AP_AM_REQUEST_ID", "AP_AM_ACTION_TYPE_ID", "AP_AM_START_DATE", "AP_AM_DONE_BY_OPERATOR_NAME")]
-    df_operations = df_operations[df_operations["AP_AM_REQUEST_ID"].isin(df["AP_SD_REQUEST_ID"])]
-
-    # **	20	Traitement Operation
-    # **	21	Traitement Transition
-    # **	32	Validation Operation
-    # **	34	Clôture Service Desk
-    # **	37	Clôture Transition
-    # **	38	Validation Self Service avec Rating
-    # **	50	Traitement Automatique
-    # **	51	Affectation à un incident parent
-    # **	52	Redirigé vers un niveau inférieur
-    # **	54	Installation
-    df_operations = df_operations.loc[df_operations["AP_AM_ACTION_TYPE_ID"].isin([20, 21, 32, 34, 37, 38, 50, 52, 54])]
-    df_operations = df_operations.sort_values(by = ["AP_AM_START_DATE"], ascending = False, na_position = "first")
-    df_operations = df_operations.groupby("AP_AM_REQUEST_ID").first()
-    
-    assert len(df_operations.index) == len(df.index)
+    df = df.merge(features, left_on = "AP_SD_REQUEST_ID", right_index = True, how = "left", suffixes=(False, False))
 
-    df = df.merge(df_operations, left_on = "AP_SD_REQUEST_ID", right_index = True, how = "left", suffixes=(False, False))
+    df["C_NO_OF_ACTIONS"] = df["C_NO_OF_ACTIONS"].fillna(0).astype(int)
+    df["C_NO_OF_CONTACTS"] = df["C_NO_OF_CONTACTS"].fillna(0).astype(int)
+    df["C_RDV_SET"] = df["C_RDV_SET"].fillna(False).astype(bool)
+    df["C_UNDER_OBSERVATION"] = df["C_UNDER_OBSERVATION"].fillna(False).astype(bool)
 
-    if tech_filter:
-        df = df.loc[df["AP_AM_DONE_BY_OPERATOR_NAME"].str.contains(tech_filter, regex = True, flags = re.IGNORECASE)]
+    # TODO: C_LAST_ACTION_DATE is ambiguous. it's actually time since last action
+    df["C_LAST_ACTION_DATE"] = (data_schema.get_now() - df["C_LAST_ACTION_START"]).dt.round("min")
 
     assert isinstance(df, pd.DataFrame)
     return df
 
+######################################
 
-def get_ticket_type(df):
+
+######################################
+# TEXT CLASSIFICATION
+######################################
+
+# A ticket is in a category when its CI is listed or its comment matches the
+# pattern of the category. The comment patterns are compiled into one matcher run
+# once per snapshot by get_ticket_text_classification, the filters and the scoring
+# read the C_FLAG_* columns.
+TICKET_CATEGORIES: Dict[str, Dict[str, Any]] = {
+    "C_FLAG_SECURITY": {
+        "ci_id": [9926, 8696],
+        "comment": "(anti)?virus|^vol.?$|pirat(é|e)|malware|(mc)?afee"
+    },
+    "C_FLAG_INDUSTRIAL": {
+        "ci_name": ["POSTES INDUSTRIELS_ENV", "Mustang_Mobilité_ENV"],
+        "comment": "scada|tablette|conduite"
+    },
+    "C_FLAG_DIGIPASS": {
+        "ci_name": ["DIGIPASS", "TELETRAVAIL_ENV", "Azure.Microsoft"],
+        "comment": "big.?ip|vpn"
+    }
+}
+
+
+def _compile_comment_classifier(categories: Dict[str, Dict[str, Any]]):
+    # one optional lookahead per category, all tried from the start of the comment:
+    # a single search finds the categories matching anywhere in the text, the
+    # group of a category is only set when its pattern matched
+    lookaheads = ["(?:(?=[\\s\\S]*?(?P<{}>{})))?".format(flag, category["comment"]) for flag, category in categories.items()]
+    return re.compile("".join(lookaheads), flags = re.IGNORECASE)
+
+
+COMMENT_CLASSIFIER_REGEX = _compile_comment_classifier(TICKET_CATEGORIES)
+
+
+def get_ticket_text_classification(df: pd.DataFrame) -> pd.DataFrame:
+    """ Adds a boolean column per TICKET_CATEGORIES entry
+    """
     assert isinstance(df, pd.DataFrame)
 
-    # 0 - incident
-    # 1 - request
-    df.loc[:,"C_TICKET_TYPE"] = 0
-    df.loc[:,"C_TICKET_TYPE_STRING_FR"] = "Incident"
-    df.loc[df["AP_SD_RFC_NUMBER"].str.startswith("D"), "C_TICKET_TYPE"] = 1
-    df.loc[df["AP_SD_RFC_NUMBER"].str.startswith("D"), "C_TICKET_TYPE_STRING_FR"] = "Demande"
+    mask_comment = df["AP_SD_COMMENT"].str.extract(COMMENT_CLASSIFIER_REGEX, expand = True).notnull()
+
+    for flag, category in TICKET_CATEGORIES.items():
+        if "ci_id" in category:
+            mask_ci = df["AP_SD_CI_ID"].isin(category["ci_id"])
+        else:
+            mask_ci = df["AP_SD_CI_NAME"].isin(category["ci_name"])
+
+        df[flag] = mask_ci | mask_comment[flag]
 
     assert isinstance(df, pd.DataFrame)
     return df
 
+######################################
 
-def get_start_date(df, df_operations):
-    """ Returns the df with a creation_date column
+
+######################################
+# TECHNICIAN FILTER
+######################################
+
+# tech_filter is looked up in an index of the technician names of the tickets, built
+# once per snapshot (data_snapshot.get_technician_index). The names are compared without
+# accents nor case, a name matches when one of its words starts with the filter:
+# "bern" matches "BERNARD Jean", "jean" and "bernard j" too. Several technicians are
+# separated by "|". The filter is never used as a regex.
+
+def normalize_technician_name(name: str) -> str:
+    return " ".join(data_preparation.normalize_names(name).casefold().split())
+
+
+class TechnicianIndex:
+    ''' The row positions of the tickets of each technician, looked up by name prefix
+
+    keys is sorted for the bisect lookup, it holds every word suffix of the normalized
+    names ("bernard jean", "jean"), key_names gives the technician of each key.
+    '''
+
+    def __init__(self, names: pd.Series):
+        codes, technicians = pd.factorize(names)
+
+        # the rows of technician i are positions[starts[i]:starts[i + 1]], in the order of the frame
+        self.positions: np.ndarray = np.argsort(codes, kind = "stable")
+        self.starts: np.ndarray = np.searchsorted(codes[self.positions], np.arange(len(technicians) + 1))
+
+        keys = []
+        for i, technician in enumerate(technicians):
+            words = normalize_technician_name(str(technician)).split()
+            keys.extend((" ".join(words[j:]), i) for j in range(len(words)))
+        keys.sort()
+
+        self.keys: List[str] = [x[0] for x in keys]
+        self.key_names: List[int] = [x[1] for x in keys]
+
+    def get_technicians(self, tech_filter: str) -> List[int]:
+        ''' Returns the technicians matching the filter '''
+        result = set()
+
+        for prefix in tech_filter.split("|"):
+            prefix = normalize_technician_name(prefix)
+            if not prefix:
+                continue
+
+            i = bisect_left(self.keys, prefix)
+            while i < len(self.keys) and self.keys[i].startswith(prefix):
+                result.add(self.key_names[i])
+                i += 1
+
+        return sorted(result)
+
+    def get_positions(self, tech_filter: str) -> np.ndarray:
+        ''' Returns the positions of the rows of the technicians matching the filter, in order '''
+        positions = [self.positions[self.starts[i]:self.starts[i + 1]] for i in self.get_technicians(tech_filter)]
+        if not positions:
+            return np.empty(0, dtype = np.int64)
+
+        return np.sort(np.concatenate(positions))
+
+
+def filter_by_tech(df: pd.DataFrame, tech_filter: str = None,
+                   technician_index: Union[TechnicianIndex, None] = None) -> pd.DataFrame:
+    """ Keeps the tickets last handled by the technicians matching tech_filter.
+    Needs the AP_AM_DONE_BY_OPERATOR_NAME column added by join_request_features.
+    technician_index must have been built on the rows of df, in the same order,
+    it is built here if None.
     """
-    df.loc[:,"C_START_DATE"] = df["AP_SD_SUBMIT_DATE_UT"]
-    
     assert isinstance(df, pd.DataFrame)
-    return df
 
+    if tech_filter:
+        if technician_index is None:
+            technician_index = TechnicianIndex(df["AP_AM_DONE_BY_OPERATOR_NAME"])
+        df = df.iloc[technician_index.get_positions(tech_filter)]
 
-def get_tickets_last_action_date(df, df_operations):
-    """ PURE FUNCTION
-    """
     assert isinstance(df, pd.DataFrame)
-    assert isinstance(df_operations, pd.DataFrame)
+    return df
 
-    df_operations = df_operations.loc[df_operations["AP_AM_RFC_NUMBER"].isin(df["AP_SD_RFC_NUMBER"])]
+######################################
 
-    # affectation_tasks = ["Fin de suspension", "Installation", "Analyse et qualification", "Realisation de la demande",	
-    #         "Realisation", "Installation, Parametrage et Permission", "Traitement de l\'incident",
-    #         "Realisation Preparation et installation","Realisation livraison digipass",
-    #         "Realisation Installation", "Traitement du refus solution", "Realisation Approvisionnement",
-    #         "Redirection", "Parametrage et installation Telephone", "Refus solution", "Realisation livraison telephone",
-    #         "Traitement du refus de la solution", "Installation AUTOCAD", "Validation de la solution"]
 
-    # **	1	Validation Self Service
-    # **	2	Logistique
-    # **	22	Fin du Workflow
-    # **	23	Etape conditionnelle
-    # **	28	Clôture anticipée
-    # **	42	Résolution par le parent
-    # **	104	Validation Self Service avec Authentification
-    # **	107	Historique des mouvements
+def get_ticket_type(df):
+    assert isinstance(df, pd.DataFrame)
 
-    # TODO: C_LAST_ACTION_DATE is ambiguous. it's actually time since last action
-    df_operations = df_operations.loc[:,("AP_AM_ACTION_ID", "AP_AM_REQUEST_ID", "AP_AM_ACTION_TYPE_ID", "AP_AM_START_DATE", "AP_AM_DONE_BY_OPERATOR_NAME")]
-    mask_not_realisation_demande = (df_operations["AP_AM_ACTION_TYPE_ID"].isin([1,2,22,23,39,42,104,107,111]))
-    df_operations = df_operations.loc[~mask_not_realisation_demande]
+    # 0 - incident
+    # 1 - request
+    df.loc[:,"C_TICKET_TYPE"] = 0
+    df.loc[:,"C_TICKET_TYPE_STRING_FR"] = "Incident"
+    df.loc[df["AP_SD_RFC_NUMBER"].str.startswith("D"), "C_TICKET_TYPE"] = 1
+    df.loc[df["AP_SD_RFC_NUMBER"].str.startswith("D"), "C_TICKET_TYPE_STRING_FR"] = "Demande"
 
-    df_operations = df_operations.sort_values(by = ["AP_AM_START_DATE"], ascending = True).groupby("AP_AM_REQUEST_ID").first()
-    df_operations["C_LAST_ACTION_DATE"] = (pd.Timestamp.now(tz = 'Europe/Paris') - df_operations["AP_AM_START_DATE"]).dt.round("min")
-    assert (df_operations["C_LAST_ACTION_DATE"] > timedelta(seconds=1)).any()
+    assert isinstance(df, pd.DataFrame)
+    return df
 
-    df_operations = df_operations.loc[:, ("C_LAST_ACTION_DATE")]
 
+def get_start_date(df, df_operations):
+    """ Returns the df with a creation_date column
+    """
+    df.loc[:,"C_START_DATE"] = df["AP_SD_SUBMIT_DATE_UT"]
     
-    assert len(df_operations.index) == len(df.index)
-    df = df.merge(df_operations, left_on = "AP_SD_REQUEST_ID", right_index = True, how = "left", suffixes=(False, False))
-
     assert isinstance(df, pd.DataFrame)
     return df
 
@@ -108,13 +316,20 @@ def get_ticket_age(df):
     assert isinstance(df, pd.DataFrame)
     assert "C_START_DATE" in df.columns
 
-    df.loc[:,"C_TICKET_AGE"] = (pd.Timestamp.now(tz = 'Europe/Paris') - df["C_START_DATE"]).dt.round("min")
+    df.loc[:,"C_TICKET_AGE"] = (data_schema.get_now() - df["C_START_DATE"]).dt.round("min")
 
     assert isinstance(df, pd.DataFrame)
     return df
 
 
+# columns added by get_ticket_classification
+CLASSIFICATION_COLUMNS = ["AP_REQUEST_ID", "AP_INTERVENTION_TYPE", "AP_TYPE_FR", "AP_Description_FR"]
+
+
 def get_ticket_classification(df):
+    """ Merges the intervention classification of the tickets, read from the in memory
+    map of crud (no SQL unless new requests have to be inserted)
+    """
     assert isinstance(df, pd.DataFrame)
 
     df_query = df.loc[:,("AP_SD_REQUEST_ID","AP_SD_RFC_NUMBER")]
@@ -152,7 +367,7 @@ def get_tickets_under_observation(df, df_operations):
 
     df_operations = df_operations.loc[df_operations["ACTION_TYPE_ID"] == 108]
     df_operations = df_operations.groupby("AP_AM_RFC_NUMBER").apply(find_tickets_with_tag).reset_index(drop=True)
-    df_operations["C_LAST_ACTION_DATE"] = (pd.Timestamp.now(tz = 'Europe/Paris') - df_operations["AP_AM_START_DATE"]).dt.round("min")
+    df_operations["C_LAST_ACTION_DATE"] = (data_schema.get_now() - df_operations["AP_AM_START_DATE"]).dt.round("min")
     assert (df_operations["C_LAST_ACTION_DATE"] > timedelta(seconds=1)).any()
 
     df_operations = df_operations.loc[:, ("AP_AM_RFC_NUMBER", "C_LAST_ACTION_DATE")]
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+from typing import Any, Dict, List, Union
+
+import numpy as np
+import pandas as pd
+from fastapi.logger import logger as log
+
+###############################
+# SCORING RULE TABLE
+###############################
+
+# The points of calculate_ticket_flow come from a JSON rule table, scoring_rules.json
+# next to this file by default (site_settings.SCORING_RULES_FILE to use another one).
+# The file is checked on every snapshot request and reloaded when it changes, the
+# enriched snapshots are keyed by the version of the rules so the tickets are scored
+# again without restarting the workers. An invalid file is logged and the previous
+# rules are kept.
+#
+# The points of the creation / last action / not suspended rules are given per
+# (urgency, ticket type) cell. Justifications are format strings receiving base,
+# per_day, urgency and ticket_type, a cell can override the one of its rule.
+
+DEFAULT_SCORING_RULES_FILE: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "scoring_rules.json")
+
+
+class ScoringRules:
+    ''' The rule table compiled to lookup arrays
+
+    The cell tables have one row per urgency and one column per ticket type. The
+    justification arrays are indexed by cell (urgency * no of ticket types + ticket type),
+    their last entry is the empty justification of the tickets outside the tables.
+    '''
+
+    def __init__(self, rules: Dict[str, Any], version: str):
+        self.version = version
+
+        self.urgency_ids: List[int] = [x["id"] for x in rules["urgencies"]]
+        self.ticket_type_ids: List[int] = [x["id"] for x in rules["ticket_types"]]
+        urgency_names: List[str] = [x["name"] for x in rules["urgencies"]]
+        ticket_type_names: List[str] = [x["name"] for x in rules["ticket_types"]]
+
+        self.creation_base, self.creation_per_day, self.creation_justifications = self._compile_cell_rule(
+            rules["creation"], urgency_names, ticket_type_names)
+        _, self.last_action_per_day, self.last_action_justifications = self._compile_cell_rule(
+            rules["last_action"], urgency_names, ticket_type_names)
+        _, self.not_suspended_per_day, self.not_suspended_justifications = self._compile_cell_rule(
+            rules["not_suspended"], urgency_names, ticket_type_names)
+        self.suspended_status_ids: List[int] = rules["not_suspended"]["suspended_status_ids"]
+
+        self.security_points: int = rules["security"]["base"]
+        self.security_justification: str = rules["security"]["justification"].format(**rules["security"])
+        self.vip_base: int = rules["vip"]["base"]
+        self.vip_per_day: int = rules["vip"]["per_day"]
+        self.vip_justification: str = rules["vip"]["justification"].format(**rules["vip"])
+        self.industrial_points: int = rules["industrial"]["base"]
+        self.industrial_justification: str = rules["industrial"]["justification"].format(**rules["industrial"])
+
+    @staticmethod
+    def _compile_cell_rule(rule: Dict[str, Any], urgency_names: List[str], ticket_type_names: List[str]):
+        base = np.zeros((len(urgency_names), len(ticket_type_names)), dtype=np.int64)
+        per_day = np.zeros((len(urgency_names), len(ticket_type_names)), dtype=np.int64)
+        justifications = []
+
+        for u, urgency in enumerate(urgency_names):
+            for t, ticket_type in enumerate(ticket_type_names):
+                cell = rule["points"][urgency][ticket_type]
+                base[u, t] = cell.get("base", 0)
+                per_day[u, t] = cell["per_day"]
+                justifications.append(cell.get("justification", rule["justification"]).format(
+                    base=base[u, t], per_day=per_day[u, t], urgency=urgency, ticket_type=ticket_type))
+
+        return (base.ravel(), per_day.ravel(), np.array(justifications + [""], dtype=object))
+
+    def get_cell(self, df: pd.DataFrame) -> np.ndarray:
+        ''' Returns the (urgency, ticket type) cell of each ticket, -1 outside of the tables '''
+        urgency = pd.Index(self.urgency_ids).get_indexer(df["AP_SD_URGENCY_ID"])
+        ticket_type = pd.Index(self.ticket_type_ids).get_indexer(df["C_TICKET_TYPE"])
+
+        return np.where((urgency >= 0) & (ticket_type >= 0), urgency * len(self.ticket_type_ids) + ticket_type, -1)
+
+
+_scoring_rules: Union[ScoringRules, None] = None
+_scoring_rules_mtime: Union[int, None] = None
+
+
+def get_scoring_rules_file() -> str:
+    from apollo.main import site_settings
+
+    return getattr(site_settings, "SCORING_RULES_FILE", DEFAULT_SCORING_RULES_FILE)
+
+
+def get_scoring_rules() -> ScoringRules:
+    ''' Returns the scoring rules, reloading the rule file if it changed since the last call '''
+    global _scoring_rules, _scoring_rules_mtime
+
+    path = get_scoring_rules_file()
+
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError as error:
+        if _scoring_rules is None:
+            raise
+        log.error("Scoring rules {} not readable, keeping version {}: {}".format(path, _scoring_rules.version, error))
+        return _scoring_rules
+
+    if mtime != _scoring_rules_mtime:
+        try:
+            with open(path, "rb") as rules_file:
+                content = rules_file.read()
+            version = hashlib.md5(content).hexdigest()
+
+            if _scoring_rules is None or version != _scoring_rules.version:
+                _scoring_rules = ScoringRules(json.loads(content.decode("utf-8")), version)
+                log.info("Scoring rules loaded from {} - version {}".format(path, version))
+
+        except (ValueError, KeyError, TypeError, IndexError) as error:
+            if _scoring_rules is None:
+                raise
+            log.error("Invalid scoring rules {}, keeping version {}: {}".format(path, _scoring_rules.version, error))
+
+        _scoring_rules_mtime = mtime
+
+    return _scoring_rules
@@ -0,0 +1,223 @@
+import glob
+import os
+import tempfile
+import time
+from typing import List, Tuple, Union
+
+import pandas as pd
+from fastapi.logger import logger as log
+from pymemcache.client.base import Client
+
+current_working_directory = os.getcwd()
+
+###############################
+# SNAPSHOT STORES
+###############################
+
+# The published versions of SPOT_requests / SPOT_requests_operations are written once
+# by the refreshing process and read by every worker. The store only holds the frames,
+# the <dataset>_current pointers, leases and fences stay in memcached.
+#
+# The backend is picked with site_settings.SNAPSHOT_BACKEND:
+#   * "arrow" (default): one Arrow IPC (Feather v2) file per version in SNAPSHOT_DIR,
+#     compressed per column with SNAPSHOT_COMPRESSION. Readers memory-map the file
+#     and only load the columns they ask for. SNAPSHOT_DIR must be shared by every
+#     API process.
+#   * "memcached": the pickled frame in memcached, as before. Large frames need
+#     memcached to run with a raised item size limit (-I).
+
+ARROW_BACKEND: str = "arrow"
+MEMCACHED_BACKEND: str = "memcached"
+
+DEFAULT_SNAPSHOT_DIR: str = os.path.join(current_working_directory, "db", "snapshots")
+DEFAULT_COMPRESSION: str = "zstd"
+DEFAULT_SHARED_MEMORY_DIR: Union[str, None] = os.path.join("/dev/shm", "apollo") if os.path.isdir("/dev/shm") else None
+
+
+def _version_files(directory: str, dataset: str) -> List[Tuple[str, str]]:
+    ''' Returns (path, uuid) of the version files of the dataset in the directory
+
+    SPOT_requests_* also matches the files of SPOT_requests_operations, the uuids
+    never hold a "_".
+    '''
+    result = []
+    for path in glob.glob(os.path.join(directory, "{}_*.arrow".format(dataset))):
+        data_uuid = os.path.basename(path)[len(dataset) + 1:-len(".arrow")]
+        if "_" not in data_uuid:
+            result.append((path, data_uuid))
+
+    return result
+
+
+class MemcachedSnapshotStore:
+    ''' Stores the frames pickled in memcached '''
+
+    def save(self, memcached_client: Client, key: str, df: pd.DataFrame, expire: int) -> None:
+        memcached_client.set(key, df, expire)
+
+    def load(self, memcached_client: Client, key: str, columns: Union[List[str], None] = None) -> Union[pd.DataFrame, None]:
+        result: Union[pd.DataFrame, None] = memcached_client.get(key)
+        if result is not None and columns is not None:
+            result = result.loc[:, [x for x in columns if x in result.columns]]
+
+        return result
+
+
+class ArrowSnapshotStore:
+    ''' Stores the frames as Arrow IPC files in a directory shared by the API processes '''
+
+    def __init__(self, directory: str = DEFAULT_SNAPSHOT_DIR, compression: Union[str, None] = DEFAULT_COMPRESSION):
+        self.directory = directory
+        self.compression = compression
+        os.makedirs(self.directory, exist_ok = True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, "{}.arrow".format(key))
+
+    def _prune(self, memcached_client: Client, dataset: str, expire: int) -> None:
+        # versions are never overwritten, the ones nobody can point to anymore are removed,
+        # never the published one: it is still served while its refresh keeps failing
+        current = memcached_client.get("{}_current".format(dataset))
+        current_uuid = current["uuid"] if current is not None else None
+
+        for path, data_uuid in _version_files(self.directory, dataset):
+            if data_uuid == current_uuid:
+                continue
+            try:
+                if time.time() - os.path.getmtime(path) > expire:
+                    os.remove(path)
+            except OSError:
+                pass
+
+    def save(self, memcached_client: Client, key: str, df: pd.DataFrame, expire: int) -> None:
+        from pyarrow import feather
+
+        path = self._path(key)
+        temp_path = "{}.{}.tmp".format(path, os.getpid())
+
+        # written aside then renamed, readers never see a partial file
+        feather.write_feather(df, temp_path, compression = self.compression)
+        os.replace(temp_path, path)
+
+        self._prune(memcached_client, key.rsplit("_", 1)[0], expire)
+
+    def load(self, memcached_client: Client, key: str, columns: Union[List[str], None] = None) -> Union[pd.DataFrame, None]:
+        import pyarrow as pa
+        from pyarrow import feather
+
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+
+        if columns is not None:
+            with pa.memory_map(path) as source:
+                schema_columns = pa.ipc.open_file(source).schema.names
+            columns = [x for x in columns if x in schema_columns]
+
+        table = feather.read_table(path, columns = columns, memory_map = True)
+        return table.to_pandas()
+
+
+_snapshot_store: Union[MemcachedSnapshotStore, ArrowSnapshotStore, None] = None
+
+
+def get_snapshot_store() -> Union[MemcachedSnapshotStore, ArrowSnapshotStore]:
+    ''' Returns the snapshot store configured in site_settings, created once per process '''
+    global _snapshot_store
+
+    if _snapshot_store is None:
+        from apollo.main import site_settings
+
+        backend: str = getattr(site_settings, "SNAPSHOT_BACKEND", ARROW_BACKEND)
+
+        if backend == MEMCACHED_BACKEND:
+            _snapshot_store = MemcachedSnapshotStore()
+        elif backend == ARROW_BACKEND:
+            _snapshot_store = ArrowSnapshotStore(
+                directory = getattr(site_settings, "SNAPSHOT_DIR", DEFAULT_SNAPSHOT_DIR),
+                compression = getattr(site_settings, "SNAPSHOT_COMPRESSION", DEFAULT_COMPRESSION))
+        else:
+            raise ValueError("Unknown SNAPSHOT_BACKEND: {}".format(backend))
+
+        log.info("Snapshot store: {}".format(backend))
+
+    return _snapshot_store
+
+
+###############################
+# SHARED MEMORY HANDOFF
+###############################
+
+# The version being served is also exported uncompressed to a RAM backed directory
+# (/dev/shm/apollo by default, SNAPSHOT_SHM_DIR to change it, None to disable).
+# The workers of the ProcessPoolExecutor memory-map it by uuid: the Arrow buffers
+# are shared through the page cache instead of being decompressed or unpickled in
+# every process. Only the latest version of each dataset is kept, the files of the
+# previous ones are unlinked, which is safe for the readers still mapping them.
+
+def _get_shared_memory_dir() -> Union[str, None]:
+    from apollo.main import site_settings
+
+    return getattr(site_settings, "SNAPSHOT_SHM_DIR", DEFAULT_SHARED_MEMORY_DIR)
+
+
+def _shared_memory_path(directory: str, key: str) -> str:
+    return os.path.join(directory, "{}.arrow".format(key))
+
+
+def has_shared_snapshot(key: str) -> bool:
+    directory = _get_shared_memory_dir()
+    return directory is not None and os.path.exists(_shared_memory_path(directory, key))
+
+
+def export_shared_snapshot(dataset: str, data_uuid: str, df: pd.DataFrame) -> None:
+    ''' Exports a version of the dataset to shared memory and drops the previous ones '''
+    import pyarrow as pa
+
+    directory = _get_shared_memory_dir()
+    if directory is None:
+        return
+
+    os.makedirs(directory, exist_ok = True)
+    key = "{}_{}".format(dataset, data_uuid)
+    path = _shared_memory_path(directory, key)
+
+    if not os.path.exists(path):
+        table = pa.Table.from_pandas(df, preserve_index = False)
+
+        file_descriptor, temp_path = tempfile.mkstemp(dir = directory, suffix = ".tmp")
+        os.close(file_descriptor)
+        with pa.OSFile(temp_path, "wb") as sink:
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+        os.replace(temp_path, path)
+
+        log.info("{} exported to shared memory".format(key))
+
+    for other_path, other_uuid in _version_files(directory, dataset):
+        if other_uuid != data_uuid:
+            try:
+                os.remove(other_path)
+            except OSError:
+                pass
+
+
+def load_shared_snapshot(key: str, columns: Union[List[str], None] = None) -> Union[pd.DataFrame, None]:
+    ''' Maps a version exported to shared memory, None if it was not exported '''
+    import pyarrow as pa
+
+    directory = _get_shared_memory_dir()
+    if directory is None:
+        return None
+
+    try:
+        source = pa.memory_map(_shared_memory_path(directory, key))
+    except OSError:
+        return None
+
+    table = pa.ipc.open_file(source).read_all()
+    if columns is not None:
+        table = table.select([x for x in columns if x in table.schema.names])
+
+    # split_blocks keeps one block per column instead of consolidating them in a copy
+    return table.to_pandas(split_blocks = True)
@@ -100,4 +100,23 @@ class TotalTicketsByTechItemModel(BaseModel):
 
 class TotalTicketsByTechResponseModel(BaseModel):
     columns: List[TotalTicketsByTechColumnsModel]
-    data: List[TotalTicketsByTechItemModel]
\ No newline at end of file
+    data: List[TotalTicketsByTechItemModel]
+
+# ===========================
+
+class DashboardResponseModel(BaseModel):
+    suspended_mail_not_recontacted_indicator: int
+    under_observation_tickets_indicator: int
+    software_installation_indicator: int
+    new_arrivals_indicator: int
+    suspended_gt_x_indicator: int
+    contacted_x_times_indicator: int
+    not_suspended_incidents_indicator: int
+    industrial_tickets_total_indicator: int
+    security_tickets_total_indicator: int
+    vip_tickets_total_indicator: int
+    ticket_flow_indicator: int
+    ticket_flow_score: int
+    suspended_mail_not_recontacted_table: SuspendedMailNotRecontactedResponseModel
+    tickets_by_expiration_table: TicketsByExpirationResponseModel
+    technician_total_tickets_table: TotalTicketsByTechResponseModel
@@ -0,0 +1,131 @@
+''' Concurrent read / write throughput of the Apollo SQLite database, default vs tuned setup
+
+Runs reader and writer processes against a scratch copy of the Apollo schema for a few
+seconds, the way the API process and the executor workers use it:
+    * readers: user lookup by username, classification of a request
+    * writers: intervention type update of a request (PATCH /api/request-classification)
+
+    default: rollback journal, synchronous=FULL
+    tuned:   apollo.database.DEFAULT_SQLITE_PRAGMAS and the classification index
+Both modes keep one connection per process, only the setup of the database differs.
+
+Usage, from the root of the repository with the settings of the API (apollo.database
+reads them on import):
+    python benchmarks/sqlite_concurrency.py [--readers 6] [--writers 2] [--seconds 5] [--rows 50000]
+'''
+import argparse
+import multiprocessing
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from apollo.database import DEFAULT_SQLITE_CACHED_STATEMENTS, DEFAULT_SQLITE_PRAGMAS
+
+DEFAULT_PRAGMAS = {
+    "journal_mode": "DELETE",
+    "synchronous": "FULL",
+    "foreign_keys": "ON"
+}
+
+SCHEMA = '''
+CREATE TABLE user (id INTEGER PRIMARY KEY, username VARCHAR(100) UNIQUE, fullname VARCHAR(100),
+                   password VARCHAR(100), email VARCHAR(100), disabled INTEGER);
+CREATE TABLE AP_SD_INTERVENTION_TYPE (id INTEGER PRIMARY KEY, AP_TYPE VARCHAR(100) UNIQUE NOT NULL,
+                   AP_TYPE_FR VARCHAR(100) UNIQUE NOT NULL, AP_Description VARCHAR(100), AP_Description_FR VARCHAR(100));
+CREATE TABLE AP_SD_INTERVENTION_CLASSIFICATION (id INTEGER PRIMARY KEY, AP_REQUEST_ID INTEGER UNIQUE,
+                   AP_RFC_NUMBER VARCHAR(100) UNIQUE NOT NULL,
+                   AP_INTERVENTION_TYPE INTEGER NOT NULL REFERENCES AP_SD_INTERVENTION_TYPE (id));
+'''
+
+
+def create_database(path, rows, tuned):
+    connection = sqlite3.connect(path)
+    connection.executescript(SCHEMA)
+    if tuned:
+        connection.execute("CREATE INDEX ix_AP_SD_INTERVENTION_CLASSIFICATION_AP_INTERVENTION_TYPE "
+                           "ON AP_SD_INTERVENTION_CLASSIFICATION (AP_INTERVENTION_TYPE)")
+    connection.executemany("INSERT INTO user (username, fullname, password, email, disabled) VALUES (?, ?, ?, ?, 0)",
+                           [("user{}".format(x), "User {}".format(x), "$2b$12$" + "x" * 53, "user{}@example.com".format(x)) for x in range(200)])
+    connection.executemany("INSERT INTO AP_SD_INTERVENTION_TYPE (id, AP_TYPE, AP_TYPE_FR) VALUES (?, ?, ?)",
+                           [(x, "type{}".format(x), "Type {}".format(x)) for x in range(1, 17)])
+    connection.executemany("INSERT INTO AP_SD_INTERVENTION_CLASSIFICATION (AP_REQUEST_ID, AP_RFC_NUMBER, AP_INTERVENTION_TYPE) VALUES (?, ?, ?)",
+                           [(x, "I{}".format(x), random.randint(1, 16)) for x in range(rows)])
+    connection.commit()
+    connection.close()
+
+
+def connect(path, pragmas):
+    connection = sqlite3.connect(path, timeout = 5, check_same_thread = False, cached_statements = DEFAULT_SQLITE_CACHED_STATEMENTS)
+    for name, value in pragmas.items():
+        connection.execute("PRAGMA {}={}".format(name, value))
+    return connection
+
+
+def worker(path, tuned, writer, rows, seconds, results):
+    connection = connect(path, DEFAULT_SQLITE_PRAGMAS if tuned else DEFAULT_PRAGMAS)
+    operations = errors = 0
+    deadline = time.perf_counter() + seconds
+
+    while time.perf_counter() < deadline:
+        try:
+            if writer:
+                connection.execute('''UPDATE AP_SD_INTERVENTION_CLASSIFICATION
+                                      SET AP_INTERVENTION_TYPE = (SELECT id FROM AP_SD_INTERVENTION_TYPE WHERE AP_TYPE_FR = ?)
+                                      WHERE AP_REQUEST_ID = ?''', ("Type {}".format(random.randint(1, 16)), random.randrange(rows)))
+                connection.commit()
+            else:
+                connection.execute("SELECT * FROM user WHERE username = ?", ("user{}".format(random.randrange(200)),)).fetchone()
+                connection.execute('''SELECT c.AP_INTERVENTION_TYPE, t.AP_TYPE_FR FROM AP_SD_INTERVENTION_CLASSIFICATION c
+                                      LEFT JOIN AP_SD_INTERVENTION_TYPE t ON c.AP_INTERVENTION_TYPE = t.id
+                                      WHERE c.AP_REQUEST_ID = ?''', (random.randrange(rows),)).fetchone()
+            operations += 1
+        except sqlite3.OperationalError:
+            errors += 1
+
+    connection.close()
+    results.put((writer, operations, errors))
+
+
+def run(mode, readers, writers, seconds, rows):
+    tuned = (mode == "tuned")
+    directory = tempfile.mkdtemp()
+    path = os.path.join(directory, "apollo.db")
+    create_database(path, rows, tuned)
+    if tuned:
+        connect(path, DEFAULT_SQLITE_PRAGMAS).close()
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target = worker, args = (path, tuned, x >= readers, rows, seconds, results))
+                 for x in range(readers + writers)]
+    for process in processes:
+        process.start()
+    outcome = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    reads = sum(x[1] for x in outcome if not x[0])
+    writes = sum(x[1] for x in outcome if x[0])
+    errors = sum(x[2] for x in outcome)
+    print("{:8} reads/s {:>9.0f}   writes/s {:>7.0f}   locked errors {}".format(mode, reads / seconds, writes / seconds, errors))
+
+
+def main():
+    parser = argparse.ArgumentParser(description = __doc__, formatter_class = argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--readers", type = int, default = 6)
+    parser.add_argument("--writers", type = int, default = 2)
+    parser.add_argument("--seconds", type = float, default = 5)
+    parser.add_argument("--rows", type = int, default = 50000)
+    args = parser.parse_args()
+
+    print("{} readers, {} writers, {}s, {} classified requests".format(args.readers, args.writers, args.seconds, args.rows))
+    for mode in ("default", "tuned"):
+        run(mode, args.readers, args.writers, args.seconds, args.rows)
+
+
+if __name__ == "__main__":
+    main()
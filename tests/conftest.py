@@ -0,0 +1,213 @@
+import os
+import sys
+import tempfile
+import types
+
+import numpy as np
+import pandas as pd
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+###############################
+# SITE SETTINGS
+###############################
+
+# apollo.main reads config.py and starts the API when it is imported, the modules under
+# test only need its site_settings: a stand-in module is registered before they are imported.
+
+TEST_DIRECTORY: str = tempfile.mkdtemp(prefix = "apollo_tests_")
+
+site_settings = types.SimpleNamespace(
+    TESTING = True,
+    DEBUG = False,
+    CACHE_EXPIRE = 600,
+    DB_LOCATION = os.path.join(TEST_DIRECTORY, "apollo.db"),
+    CLASSIFICATION_VERSION_FILE = os.path.join(TEST_DIRECTORY, "intervention_classification.version"),
+    SNAPSHOT_DIR = os.path.join(TEST_DIRECTORY, "snapshots"),
+    SNAPSHOT_SHM_DIR = os.path.join(TEST_DIRECTORY, "shm"),
+    MEMCACHE_CLIENT = "localhost",
+    VIP_LIST = ["DUPONT"]
+)
+
+apollo_main = types.ModuleType("apollo.main")
+apollo_main.site_settings = site_settings
+sys.modules["apollo.main"] = apollo_main
+
+###############################
+
+
+###############################
+# SPOT FRAMES
+###############################
+
+# Small SD_REQUEST / AM_ACTION extracts, generated from a fixed seed, in the format of
+# the SPOT exports (dates as text, ids as numbers). Every action type used by the rules
+# is present: notifications, suspensions, RDV and "under observation" tags.
+
+REFERENCE_NOW = pd.Timestamp("2021-03-17 10:30:00", tz = "Europe/Paris")
+
+ACTION_LABELS = ["Appel sortant utilisateur", "notification au demandeur", "Relance vers l'utilisateur",
+                 "Prise en charge", "Suspension", "Autre"]
+ACTION_DESCRIPTIONS = [None, "#tagp# rdv:12/03/2021", "#tagp# rdv:31/12/2030", "#tagp# sousobservation", "bla"]
+COMMENTS = ["<p>Bonjour, antivirus bloque</p>", "poste industriel HS, scada", "digipass perdu", "imprimante",
+            None, "<b>bon</b>jour", "PC lent"]
+
+
+def _spot_dates(rng: np.random.Generator, size: int, missing: float = 0.1) -> np.ndarray:
+    # local wall times over the 30 days before REFERENCE_NOW
+    dates = REFERENCE_NOW.tz_localize(None) - pd.to_timedelta(rng.uniform(0, 30 * 86400, size), unit = "s")
+    result = dates.strftime("%Y-%m-%d %H:%M:%S.%f").to_numpy().astype(object)
+    result[rng.random(size) < missing] = None
+    return result
+
+
+def make_spot_frames(no_of_requests: int = 120, seed: int = 0):
+    ''' Returns (e1, e2): the SD_REQUEST and AM_ACTION extracts '''
+    rng = np.random.default_rng(seed)
+    n = no_of_requests
+    m = n * 6
+
+    request_ids = np.arange(100000, 100000 + n)
+    rfc_numbers = np.array(["{}{:07d}".format(rng.choice(["I", "D"]), x) for x in request_ids], dtype = object)
+
+    e1 = pd.DataFrame({
+        "REQUEST_ID": request_ids,
+        "PARENT_REQUEST_ID": rng.choice([None, 5.0], n),
+        "RFC_NUMBER": rfc_numbers,
+        "CREATION_DATE_UT": _spot_dates(rng, n, 0),
+        "SUBMIT_DATE_UT": _spot_dates(rng, n),
+        "END_DATE_UT": _spot_dates(rng, n, 0.9),
+        "MAX_RESOLUTION_DATE_UT": _spot_dates(rng, n),
+        "LAST_UPDATE": _spot_dates(rng, n, 0),
+        "SUBMITTED_BY": rng.integers(1, 500, n),
+        "SUBMITTED_BY_LAST_NAME": rng.choice(["A", "B", "C"], n),
+        "REQUESTOR_ID": rng.integers(1, 500, n),
+        "REQUESTOR_LAST_NAME": rng.choice(["A", "B", "DUPONT"], n),
+        "REQUESTOR_LOCATION_RH": rng.choice(["CNR SIEGE SOCIAL", "CNR JEAN BART"], n),
+        "LOCATION_ID": rng.integers(1, 50, n),
+        "REQUESTOR_PHONE": rng.choice(["0102", None], n),
+        "RECIPIENT_ID": rng.integers(1, 500, n),
+        "RECIPIENT_LAST_NAME": rng.choice(["DUPONT", "Hélène", None, "MARTIN"], n),
+        "RECIPIENT_LOCATION_RH": rng.choice(["CNR SIEGE SOCIAL", "CNR JEAN BART", None], n),
+        "SD_CATALOG_ID": rng.choice([5535, 1200, 8000], n),
+        "CATALOG_NAME": rng.choice(["Cat A", "Cat B"], n),
+        "STATUS_ID": rng.choice([39, 42, 5, 20, 1, 8], n),
+        "STATUS_FR": rng.choice(["En cours", "Suspendu"], n),
+        "COMMENT": rng.choice(np.array(COMMENTS, dtype = object), n),
+        "DESCRIPTION": rng.choice(["long text", None], n),
+        "URGENCY_ID": rng.choice([5, 3, 2, 1], n),
+        "URGENCY_FR": rng.choice(["4-Normal", None, "1-Majeur"], n),
+        "CI_ID": rng.choice([9926, 10, 20], n),
+        "CI_NAME": rng.choice(["PC1", "POSTES INDUSTRIELS_ENV", "SKYPE_ENV"], n),
+        "OWNER_ID": rng.integers(1, 99, n),
+        "OWNER_LAST_NAME": rng.choice(["X", "Y"], n),
+        "OWNING_GROUP_ID": rng.integers(1, 9, n),
+        "OWNING_GROUP_NAME": rng.choice(["G1", "G2"], n),
+        "DEPARTMENT_ID": rng.integers(1, 9, n),
+        "REQUESTOR_FEEDBACK": None,
+        "ASSET_ID": rng.choice([1.0, np.nan], n),
+        "ASSET_TAG": rng.choice(["M1", None], n),
+        "FIRST_CALL_RESOLUTION": 0,
+        "SEVERITY_ID": 1,
+        "TIME_USED_TO_SOLVE_REQUEST": 0.0,
+        "REQUEST_ORIGIN_ID": 1,
+        "DELAY": 0,
+        "LAST_GROUP_ID": 5,
+        "LAST_DONE_BY_ID": rng.integers(1, 99, n),
+        "SLA_ID": 1,
+        "IMPACT_ID": 1,
+        "E_INFRA_COMMENT": None,
+        "IS_MAJOR_INCIDENT": 0,
+        "E_TYPE_SUPPORT": rng.choice(["S1", "S2"], n)
+    })
+
+    # every request has at least one action
+    action_request_ids = np.concatenate([request_ids, rng.choice(request_ids, m - n)])
+    e2 = pd.DataFrame({
+        "ACTION_ID": np.arange(m),
+        "REQUEST_ID": action_request_ids,
+        "RFC_NUMBER": rfc_numbers[action_request_ids - 100000],
+        "ACTION_NUMBER": 1,
+        "ASSET_ID": None,
+        "PARENT_ACTION_ID": rng.choice([1.0, np.nan], m),
+        "VALIDATOR_ID": None,
+        "ACTION_LABEL_FR": rng.choice(ACTION_LABELS, m),
+        "ACTION_TYPE_ID": np.concatenate([rng.choice([20, 32], n), rng.choice([5, 1, 2, 20, 65, 108, 3], m - n)]),
+        "ACTION_TYPE": rng.choice(["T1", "T2"], m),
+        "START_DATE_UT": _spot_dates(rng, m, 0.02),
+        "END_DATE_UT": _spot_dates(rng, m, 0.5),
+        "EXPECTED_START_DATE_UT": None,
+        "CREATION_DATE_UT": _spot_dates(rng, m, 0),
+        "EXPECTED_END_DATE_UT": None,
+        "LAST_UPDATE": _spot_dates(rng, m, 0),
+        "DESCRIPTION": rng.choice(np.array(ACTION_DESCRIPTIONS, dtype = object), m),
+        "PROCESS_STEP_ID": 1,
+        "LOCATION_ID": 1,
+        "DONE_BY_ID": rng.integers(1, 9, m),
+        "DONE_BY_NAME": rng.choice(["Émile ZOLA", "BERNARD Jean", None], m),
+        "GROUP_ID": 5,
+        "GROUP_FR": rng.choice(["Hotline", "Proxi"], m),
+        "CONTACT_ID": None,
+        "ELAPSED_TIME": 0,
+        "STATUS_ID_ON_CREATE": 1,
+        "STATUS_ID_ON_TERMINATE": 2,
+        "TIME_USED_TO_COMPLETE_ACTION": 0,
+        "ORIGIN_ACTION_ID": None,
+        "WORKFLOW_VALUE": None,
+        "WORKFLOW_ID": None,
+        "EXIT_VALUE": None,
+        "PREVIOUS_SIBLING_ID": None,
+        "HISTORY_ID": rng.integers(1, 1000, m)
+    })
+
+    return (e1, e2)
+
+
+class FakeClassification:
+    ''' Stands for crud.InterventionClassification, without the Apollo database '''
+    version = "test"
+
+
+def fake_requests_intervention_types(df: pd.DataFrame) -> pd.DataFrame:
+    # hotline, proxi or unclassified depending on the request id
+    request_ids = df["AP_SD_REQUEST_ID"].drop_duplicates().to_numpy()
+    intervention_types = np.array([1, 2, 3])[request_ids.astype("int64") % 3]
+
+    return pd.DataFrame({
+        "AP_REQUEST_ID": request_ids,
+        "AP_INTERVENTION_TYPE": intervention_types,
+        "AP_TYPE_FR": np.array(["Non classé", "Hotline", "Proxi"], dtype = object)[intervention_types - 1],
+        "AP_Description_FR": "-"
+    })
+
+
+@pytest.fixture
+def spot_frames():
+    return make_spot_frames()
+
+
+@pytest.fixture
+def enriched_snapshot(monkeypatch, spot_frames):
+    ''' The enriched (tickets, actions) of spot_frames, built at REFERENCE_NOW '''
+    from apollo import crud
+    from apollo.pipeline import data_schema, data_snapshot, feature_engineering
+
+    monkeypatch.setattr(crud, "get_intervention_classification", lambda: FakeClassification())
+    monkeypatch.setattr(feature_engineering, "get_requests_intervention_types", fake_requests_intervention_types)
+
+    e1, e2 = spot_frames
+    data_snapshot._snapshot_cache.clear()
+    data_snapshot._sorted_request_ids.clear()
+    data_snapshot._technician_index = None
+
+    with data_schema.reference_time(REFERENCE_NOW):
+        snapshot = data_snapshot.build_enriched_snapshot(e1.copy(), e2.copy())
+
+    yield snapshot
+
+    data_snapshot._snapshot_cache.clear()
+    data_snapshot._sorted_request_ids.clear()
+    data_snapshot._technician_index = None
+
+###############################
@@ -0,0 +1,213 @@
+import numpy as np
+import pandas as pd
+import pytest
+from pandas.tseries.offsets import BDay
+
+from apollo.pipeline import data_analysis
+
+###############################
+# BUSINESS DAYS
+###############################
+
+# _add_business_days and _count_business_days replaced timestamp + n * BDay() and
+# len(pd.date_range(first, last, freq=BDay())) in the notification rules, they must
+# give the same results, weekends and times of day included.
+
+
+def _wall_times(rng: np.random.Generator, size: int, missing: float = 0.0) -> pd.Series:
+    result = pd.Series(pd.Timestamp("2021-03-01") + pd.to_timedelta(rng.uniform(0, 30 * 86400, size), unit = "s"))
+    result[rng.random(size) < missing] = pd.NaT
+    return result
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_add_business_days_matches_bday(seed):
+    rng = np.random.default_rng(seed)
+    wall_time = _wall_times(rng, 2000, missing = 0.1)
+    days = rng.integers(1, 6, len(wall_time))
+
+    expected = [pd.NaT if pd.isnull(x) else x + int(n) * BDay() for x, n in zip(wall_time, days)]
+    result = data_analysis._add_business_days(wall_time.to_numpy(), days)
+
+    pd.testing.assert_series_equal(pd.Series(result), pd.Series(expected, dtype = "datetime64[ns]"))
+
+
+@pytest.mark.parametrize("start, days, expected", [
+    ("2021-03-12 18:00", 1, "2021-03-15 18:00"),  # Friday
+    ("2021-03-13 10:00", 1, "2021-03-15 10:00"),  # Saturday
+    ("2021-03-14 10:00", 3, "2021-03-17 10:00"),  # Sunday
+    ("2021-03-15 08:30", 3, "2021-03-18 08:30")
+])
+def test_add_business_days(start, days, expected):
+    result = data_analysis._add_business_days(np.array([start], dtype = "datetime64[ns]"), days)
+
+    assert result[0] == np.datetime64(expected)
+
+
+def test_add_business_days_keeps_missing_dates():
+    result = data_analysis._add_business_days(np.array(["NaT", "2021-03-12"], dtype = "datetime64[ns]"), np.array([1, 1]))
+
+    assert np.isnat(result[0])
+    assert result[1] == np.datetime64("2021-03-15")
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_count_business_days_matches_date_range(seed):
+    rng = np.random.default_rng(seed)
+    first = _wall_times(rng, 2000, missing = 0.05)
+    last = first + pd.to_timedelta(rng.uniform(-2 * 86400, 20 * 86400, len(first)), unit = "s")
+    # the same time of day as first, give or take a second
+    same_time = rng.random(len(first)) < 0.3
+    last[same_time] = (last.dt.floor("D") + (first - first.dt.floor("D")) + pd.to_timedelta(rng.integers(-1, 2, len(first)), unit = "s"))[same_time]
+
+    expected = [0 if pd.isnull(x) or pd.isnull(y) else len(pd.date_range(x, y, freq = BDay())) for x, y in zip(first, last)]
+    result = data_analysis._count_business_days(first.to_numpy(), last.to_numpy())
+
+    assert result.tolist() == expected
+
+
+@pytest.mark.parametrize("first, last, expected", [
+    ("2021-03-15 10:00", "2021-03-19 09:00", 4),  # Monday to Friday, before the time of first
+    ("2021-03-15 10:00", "2021-03-19 10:00", 5),
+    ("2021-03-10 21:00", "2021-03-13 18:00", 2),  # Saturday, rolled back to Friday 18:00
+    ("2021-03-10 09:00", "2021-03-13 18:00", 3),
+    ("2021-03-13 10:00", "2021-03-20 09:00", 5),  # Saturday to Saturday
+    ("2021-03-13 10:00", "2021-03-14 12:00", 0),
+    ("2021-03-19 10:00", "2021-03-15 10:00", 0),
+    ("NaT", "2021-03-15 10:00", 0)
+])
+def test_count_business_days(first, last, expected):
+    result = data_analysis._count_business_days(np.array([first], dtype = "datetime64[ns]"),
+                                                np.array([last], dtype = "datetime64[ns]"))
+
+    assert result.tolist() == [expected]
+
+###############################
+
+
+###############################
+# TICKET SCORING
+###############################
+
+# The points of the baseline rules, before they moved to scoring_rules.json:
+# (urgency id, ticket type) -> (creation base, creation pts/day, last action pts/day,
+# not suspended pts/day). The score of every ticket must stay the same.
+
+BASELINE_POINTS = {
+    (5, 0): (1, 3, 3, 25), (5, 1): (0, 1, 1, 10),
+    (3, 0): (10, 10, 10, 50), (3, 1): (3, 3, 3, 25),
+    (2, 0): (100, 100, 100, 100), (2, 1): (30, 30, 30, 50),
+    (1, 0): (1000, 1000, 1000, 1000), (1, 1): (300, 300, 300, 300)
+}
+
+
+def _baseline_points(ticket) -> int:
+    # one rule after the other, a rule depending on a missing date gives no points
+    def days(value):
+        return None if pd.isnull(value) else value.days
+
+    creation_days, last_action_days = days(ticket["C_TICKET_AGE"]), days(ticket["C_LAST_ACTION_DATE"])
+    points = 0
+
+    cell = BASELINE_POINTS.get((ticket["AP_SD_URGENCY_ID"], ticket["C_TICKET_TYPE"]))
+    if cell is not None:
+        base, creation_per_day, last_action_per_day, not_suspended_per_day = cell
+        if creation_days is not None:
+            points += base + creation_per_day * creation_days
+        if last_action_days is not None:
+            points += last_action_per_day * last_action_days
+            if ticket["AP_SD_STATUS_ID"] not in [5, 20, 39]:
+                points += not_suspended_per_day * last_action_days
+
+    if ticket["C_FLAG_SECURITY"]:
+        points += 1000
+    if (ticket["REQUESTOR_LAST_NAME"] == "DUPONT" or ticket["AP_SD_RECIPIENT_LAST_NAME"] == "DUPONT") \
+            and last_action_days is not None:
+        points += 500 + 100 * last_action_days
+    if ticket["C_FLAG_INDUSTRIAL"]:
+        points += 500
+
+    return points
+
+
+def _tickets(rng: np.random.Generator, size: int) -> pd.DataFrame:
+    def ages(missing: float):
+        result = pd.Series(pd.to_timedelta(rng.uniform(-86400, 40 * 86400, size), unit = "s"))
+        result[rng.random(size) < missing] = pd.NaT
+        return result
+
+    return pd.DataFrame({
+        "AP_SD_RFC_NUMBER": ["I{:07d}".format(x) for x in range(size)],
+        "AP_SD_URGENCY_ID": rng.choice([5, 3, 2, 1, 4], size),
+        "C_TICKET_TYPE": rng.choice([0, 1, 2], size, p = [0.45, 0.45, 0.1]),
+        "AP_SD_STATUS_ID": rng.choice([5, 20, 39, 42, 1, 8], size),
+        "C_TICKET_AGE": ages(0.05),
+        "C_LAST_ACTION_DATE": ages(0.1),
+        "C_FLAG_SECURITY": rng.random(size) < 0.1,
+        "C_FLAG_INDUSTRIAL": rng.random(size) < 0.1,
+        "REQUESTOR_LAST_NAME": rng.choice(["A", "DUPONT", None], size, p = [0.8, 0.1, 0.1]),
+        "AP_SD_RECIPIENT_LAST_NAME": rng.choice(["B", "DUPONT", None], size, p = [0.8, 0.1, 0.1])
+    })
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_calculate_ticket_flow_matches_the_baseline_rules(seed):
+    df = _tickets(np.random.default_rng(seed), 1000)
+
+    result = data_analysis.calculate_ticket_flow(df, pd.DataFrame())
+
+    assert result["C_POINTS"].tolist() == [_baseline_points(x) for _, x in df.iterrows()]
+    assert "C_POINTS" not in df.columns
+
+
+def _ticket(**columns) -> pd.DataFrame:
+    ticket = {
+        "AP_SD_RFC_NUMBER": "I0000001",
+        "AP_SD_URGENCY_ID": 5,
+        "C_TICKET_TYPE": 0,
+        "AP_SD_STATUS_ID": 42,
+        "C_TICKET_AGE": pd.Timedelta(days = 4, hours = 23),
+        "C_LAST_ACTION_DATE": pd.Timedelta(days = 2, hours = 1),
+        "C_FLAG_SECURITY": False,
+        "C_FLAG_INDUSTRIAL": False,
+        "REQUESTOR_LAST_NAME": "A",
+        "AP_SD_RECIPIENT_LAST_NAME": "B"
+    }
+    ticket.update(columns)
+
+    df = pd.DataFrame([ticket])
+    df["C_TICKET_AGE"] = pd.Series([ticket["C_TICKET_AGE"]], dtype = "timedelta64[ns]")
+    df["C_LAST_ACTION_DATE"] = pd.Series([ticket["C_LAST_ACTION_DATE"]], dtype = "timedelta64[ns]")
+    return df
+
+
+VIP_JUSTIFICATION = "500 base + 100 pts/day ticket VIP depuis dernière action "
+
+
+@pytest.mark.parametrize("columns, points, justification", [
+    ({}, 1 + 3 * 4 + 3 * 2 + 25 * 2,
+     ["+3 pt/jour pour Incident-Normal depuis creation", "+3 pt/jour pour Incident-Normal depuis dernière action",
+      "+25 pt/jour pour Incident-Normal non suspendu", "", "", ""]),
+    ({"AP_SD_URGENCY_ID": 2, "C_TICKET_TYPE": 1, "AP_SD_STATUS_ID": 20}, 30 + 30 * 4 + 30 * 2,
+     ["30 base + 30 pt/jour pour Demande-Important depuis creation",
+      "+30 pt/jour pour Demande-Important depuis dernière action", "", "", "", ""]),
+    ({"AP_SD_URGENCY_ID": 1, "C_TICKET_AGE": pd.NaT}, 1000 * 2 + 1000 * 2,
+     ["1000 base + 1000 pt/jour pour Incident-Majeur depuis creation",
+      "+1000 pt/jour pour Incident-Majeur depuis dernière action",
+      "+1000 pt/jour pour Incident-Majeur non suspendu", "", "", ""]),
+    ({"AP_SD_URGENCY_ID": 4, "C_FLAG_SECURITY": True, "C_FLAG_INDUSTRIAL": True}, 1000 + 500,
+     ["", "", "", "+1000 pts ticket sécurité ", "", "500 points pour poste industriel"]),
+    ({"C_TICKET_TYPE": 2, "AP_SD_RECIPIENT_LAST_NAME": "DUPONT"}, 500 + 100 * 2,
+     ["", "", "", "", VIP_JUSTIFICATION, ""]),
+    ({"C_TICKET_TYPE": 2, "REQUESTOR_LAST_NAME": "DUPONT", "C_LAST_ACTION_DATE": pd.NaT}, 0,
+     ["", "", "", "", VIP_JUSTIFICATION, ""])
+], ids = ["normal", "suspended", "no creation date", "outside the tables", "vip", "vip without action"])
+def test_calculate_ticket_flow(columns, points, justification):
+    # the justifications are those of the baseline, except the VIP one which
+    # gives its actual base (the baseline text said 1000 base for 500 points)
+    result = data_analysis.calculate_ticket_flow(_ticket(**columns), pd.DataFrame())
+
+    assert result["C_POINTS"].tolist() == [points]
+    assert data_analysis.get_points_justification(result).tolist() == [" // " + " // ".join(justification)]
+
+###############################
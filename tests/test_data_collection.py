@@ -0,0 +1,101 @@
+import pandas as pd
+import pytest
+from sqlalchemy import create_engine, text
+
+from apollo.pipeline import data_collection
+
+###############################
+# INCREMENTAL SYNC
+###############################
+
+# A small SD_REQUEST / AM_ACTION pair in an in-memory SQLite database. After any
+# change of the tables, the incremental sync of the previous pull must give the rows
+# of a full pull.
+
+SELECT_SQL = """SELECT AM_ACTION.ACTION_ID, AM_ACTION.REQUEST_ID, AM_ACTION.ACTION_LABEL_FR, AM_ACTION.LAST_UPDATE
+            FROM AM_ACTION
+            INNER JOIN SD_REQUEST ON SD_REQUEST.REQUEST_ID = AM_ACTION.REQUEST_ID"""
+FILTER_SQL = "SD_REQUEST.STATUS_ID <> 8"
+OPEN_IDS_SQL = "SELECT REQUEST_ID FROM SD_REQUEST WHERE STATUS_ID <> 8"
+FULL_SQL = SELECT_SQL + " WHERE " + FILTER_SQL
+
+DTYPES = {"ACTION_LABEL_FR": "category", "LAST_UPDATE": "datetime"}
+
+
+@pytest.fixture
+def connection():
+    engine = create_engine("sqlite://")
+
+    with engine.connect() as connection:
+        connection.execute(text("CREATE TABLE SD_REQUEST (REQUEST_ID INTEGER PRIMARY KEY, STATUS_ID INTEGER)"))
+        connection.execute(text("""CREATE TABLE AM_ACTION (ACTION_ID INTEGER PRIMARY KEY, REQUEST_ID INTEGER,
+                                   ACTION_LABEL_FR TEXT, LAST_UPDATE TEXT)"""))
+        # request 4 is closed
+        connection.execute(text("INSERT INTO SD_REQUEST VALUES (1, 1), (2, 1), (3, 39), (4, 8)"))
+        connection.execute(text("""INSERT INTO AM_ACTION VALUES
+                                   (10, 1, 'Prise en charge', '2021-03-01 08:00:00'),
+                                   (11, 1, 'Suspension', '2021-03-02 09:00:00'),
+                                   (20, 2, 'Prise en charge', '2021-03-03 10:00:00'),
+                                   (30, 3, 'Autre', '2021-03-04 11:00:00'),
+                                   (40, 4, 'Prise en charge', '2021-02-01 12:00:00')"""))
+        yield connection
+
+    engine.dispose()
+
+
+def _full_pull(connection) -> pd.DataFrame:
+    return data_collection._read_sql_typed(text(FULL_SQL), connection, DTYPES)
+
+
+def _load_incremental(connection, previous: pd.DataFrame):
+    return data_collection._load_incremental(connection, previous, "AM_ACTION", "ACTION_ID",
+                                             SELECT_SQL, FILTER_SQL, OPEN_IDS_SQL, dtypes = DTYPES)
+
+
+def _sorted(df: pd.DataFrame) -> pd.DataFrame:
+    df = df.sort_values("ACTION_ID").reset_index(drop = True)
+    # the categories of the merged frame are those of the previous pull and of the delta
+    df["ACTION_LABEL_FR"] = df["ACTION_LABEL_FR"].astype(object)
+    return df
+
+
+def test_load_incremental_matches_a_full_pull(connection):
+    previous = _full_pull(connection)
+
+    # an action updated, one added, one at the watermark, a request closed and one reopened
+    connection.execute(text("UPDATE AM_ACTION SET ACTION_LABEL_FR = 'Relance', LAST_UPDATE = '2021-03-05 08:00:00' WHERE ACTION_ID = 11"))
+    connection.execute(text("INSERT INTO AM_ACTION VALUES (21, 2, 'Nouvelle', '2021-03-05 09:00:00')"))
+    connection.execute(text("INSERT INTO AM_ACTION VALUES (31, 3, 'Autre', '2021-03-04 11:00:00')"))
+    connection.execute(text("UPDATE SD_REQUEST SET STATUS_ID = 8 WHERE REQUEST_ID = 2"))
+    connection.execute(text("UPDATE SD_REQUEST SET STATUS_ID = 1 WHERE REQUEST_ID = 4"))
+
+    result = _load_incremental(connection, previous)
+
+    pd.testing.assert_frame_equal(_sorted(result), _sorted(_full_pull(connection)))
+    assert result["ACTION_ID"].is_unique
+    assert isinstance(result["ACTION_LABEL_FR"].dtype, pd.CategoricalDtype)
+
+
+def test_load_incremental_without_change(connection):
+    previous = _full_pull(connection)
+
+    result = _load_incremental(connection, previous)
+
+    pd.testing.assert_frame_equal(_sorted(result), _sorted(previous))
+
+
+def test_load_incremental_needs_a_full_reload_without_watermark(connection):
+    previous = _full_pull(connection)
+    previous["LAST_UPDATE"] = pd.NaT
+
+    assert _load_incremental(connection, previous) is None
+
+
+def test_load_incremental_needs_a_full_reload_for_many_new_requests(monkeypatch, connection):
+    previous = _full_pull(connection)
+    connection.execute(text("UPDATE SD_REQUEST SET STATUS_ID = 1 WHERE REQUEST_ID = 4"))
+    monkeypatch.setattr(data_collection, "MAX_NEW_REQUESTS_INCREMENTAL", 0)
+
+    assert _load_incremental(connection, previous) is None
+
+###############################
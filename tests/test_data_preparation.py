@@ -0,0 +1,76 @@
+import json
+
+import pandas as pd
+import pytest
+
+from apollo.pipeline import data_preparation
+
+from conftest import make_spot_frames
+
+###############################
+# CLEANING
+###############################
+
+
+@pytest.mark.parametrize("comment, expected", [
+    ("<p>Bonjour</p><p>Merci", "erci"),  # the tags first, then the greeting and the character after it
+    ("bon<b>jour</b> vpn", "vpn"),
+    ("BONJOUR, PC lent", " PC lent"),
+    ("<br/>imprimante <i>HS</i>", "imprimante HS"),
+    ("a < b", "a < b"),
+    (None, "")
+])
+def test_clean_ticket_data_comment(comment, expected):
+    e1, _ = make_spot_frames(no_of_requests = 1)
+    e1["COMMENT"] = [comment]
+
+    df = data_preparation.clean_ticket_data(e1)
+
+    assert df["AP_SD_COMMENT"].tolist() == [expected]
+
+###############################
+
+
+###############################
+# DATATABLES
+###############################
+
+
+def test_parse_datatable_page():
+    page = data_preparation.parse_datatable_page(offset = 5, limit = 10, sort = "-Score",
+                                                 filters = ["Statut:en cours", "Description:a:b", "Score:"])
+
+    assert page == {"offset": 5, "limit": 10, "sort": ("C_POINTS", False),
+                    "filters": [("AP_SD_STATUS_FR", "en cours"), ("AP_SD_COMMENT", "a:b"), ("C_POINTS", "")]}
+
+
+def test_parse_datatable_page_defaults():
+    assert data_preparation.parse_datatable_page() == {"offset": 0, "limit": None, "sort": None, "filters": []}
+    assert data_preparation.parse_datatable_page(sort = "SPOT")["sort"] == ("AP_SD_RFC_NUMBER", True)
+
+
+@pytest.mark.parametrize("kwargs", [
+    {"offset": -1},
+    {"limit": -1},
+    {"sort": "Unknown"},
+    {"sort": "-C_POINTS_JUSTIFICATION"},
+    {"sort": "-"},
+    {"filters": ["C_RDV_DATE:2021"]},
+    {"filters": ["AP_SD_STATUS_FR:en"]}
+])
+def test_parse_datatable_page_errors(kwargs):
+    with pytest.raises(ValueError):
+        data_preparation.parse_datatable_page(**kwargs)
+
+
+def test_encode_datatable_without_rfc_number(enriched_snapshot):
+    df, _ = enriched_snapshot
+    df = df.copy()
+    df.iloc[0, df.columns.get_loc("AP_SD_RFC_NUMBER")] = pd.NA
+
+    records = json.loads(data_preparation.encode_datatable(data_preparation.format_datatable(df)))
+
+    assert records[0]["SPOT"] == ""
+    assert records[1]["SPOT"] == str(df["AP_SD_RFC_NUMBER"].iloc[1])
+
+###############################
@@ -0,0 +1,153 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from apollo.pipeline import data_schema
+
+###############################
+# SNAPSHOT SCHEMA
+###############################
+
+SCHEMA = {
+    "ID": data_schema.INT,
+    "LABEL": data_schema.CATEGORY,
+    "DATE": data_schema.DATETIME,
+    "TEXT": data_schema.STRING,
+    "MISSING": data_schema.INT
+}
+
+
+@pytest.mark.parametrize("values, dtype", [
+    ([1, 2, 127], "int8"),
+    ([1, -129], "int16"),
+    ([1, 40000], "int32"),
+    ([1, 2 ** 40], "int64"),
+    ([1.0, np.nan], "Int8"),
+    (["12", "x", None], "Int8"),
+    ([np.nan, np.nan], "Int64")
+])
+def test_apply_schema_int(values, dtype):
+    df = data_schema.apply_schema(pd.DataFrame({"ID": values}), SCHEMA)
+
+    assert df["ID"].dtype == dtype
+    assert df["ID"].tolist() == pd.to_numeric(pd.Series(values), errors = "coerce").astype(dtype).tolist()
+
+
+def test_apply_schema():
+    df = pd.DataFrame({
+        "ID": [3, 4, 5],
+        "LABEL": ["Suspendu", "En cours", None],
+        "DATE": ["2021-03-28 00:30:00.000", "2021-03-28 01:30:00.000", "not a date"],
+        "TEXT": ["<p>PC lent", None, "é"],
+        "OTHER": [1.5, 2.5, 3.5]
+    })
+
+    result = data_schema.apply_schema(df, SCHEMA)
+
+    assert result is df
+    assert df["ID"].dtype == "int8"
+    assert df["LABEL"].tolist() == ["Suspendu", "En cours", np.nan]
+    assert isinstance(df["LABEL"].dtype, pd.CategoricalDtype)
+    # naive UTC, the second one after the change to summer time
+    assert df["DATE"].dtype == data_schema.DATETIME_DTYPE
+    assert df["DATE"].iloc[:2].tolist() == [pd.Timestamp("2021-03-28 01:30:00", tz = "Europe/Paris"),
+                                            pd.Timestamp("2021-03-28 03:30:00", tz = "Europe/Paris")]
+    assert pd.isnull(df["DATE"].iloc[2])
+    assert df["TEXT"].dtype == data_schema.STRING_DTYPE
+    assert df["TEXT"].isna().tolist() == [False, True, False]
+    assert df["OTHER"].dtype == "float64"
+    assert "MISSING" not in df.columns
+
+    data_schema.validate_schema(df, SCHEMA, "test")
+
+
+def test_apply_schema_datetime_columns():
+    df = pd.DataFrame({
+        "DATE": pd.to_datetime(["2021-03-01 10:00", None]).tz_localize("America/New_York")
+    })
+
+    data_schema.apply_schema(df, SCHEMA)
+
+    assert df["DATE"].dtype == data_schema.DATETIME_DTYPE
+    assert df["DATE"].iloc[0] == pd.Timestamp("2021-03-01 16:00", tz = "Europe/Paris")
+    assert pd.isnull(df["DATE"].iloc[1])
+
+
+def test_apply_schema_keeps_the_columns_of_the_schema_dtype():
+    label = pd.Series(["a", "b"], dtype = "category")
+    df = pd.DataFrame({"ID": np.array([1, 2], dtype = "int8"), "LABEL": label})
+    expected = df.copy()
+
+    data_schema.apply_schema(df, SCHEMA)
+
+    pd.testing.assert_frame_equal(df, expected)
+
+
+def test_validate_schema():
+    df = pd.DataFrame({"ID": [1.5], "LABEL": ["a"], "TEXT": ["b"], "OTHER": [1]})
+
+    with pytest.raises(ValueError, match = "ID is float64, expected int, LABEL is object, expected category"):
+        data_schema.validate_schema(df, SCHEMA, "test")
+
+###############################
+
+
+###############################
+# DATES
+###############################
+
+# normalize_dates replaced one pd.to_datetime(..., utc=True).dt.tz_convert("Europe/Paris")
+# per column, it must give the same dates.
+
+DATE_COLUMNS = ["CREATION", "END", "LAST_UPDATE"]
+
+
+def _baseline_dates(df: pd.DataFrame, date_format: str = "%Y-%m-%d %H:%M:%S.%f") -> pd.DataFrame:
+    df = df.copy()
+    for x in DATE_COLUMNS:
+        df[x] = pd.to_datetime(df[x], format = date_format, errors = "coerce", utc = True).dt.tz_convert("Europe/Paris")
+
+    return df
+
+
+def _text_dates(rng: np.random.Generator, size: int, date_format: str) -> np.ndarray:
+    # around the changes to and from summer time, with missing and invalid values
+    dates = pd.Timestamp("2021-03-27") + pd.to_timedelta(rng.uniform(0, 220 * 86400, size), unit = "s")
+    result = dates.strftime(date_format).to_numpy().astype(object)
+    result[rng.random(size) < 0.1] = None
+    result[rng.random(size) < 0.02] = "31/02/2021"
+    # the same values in several columns share the cache of to_datetime
+    return rng.choice(result, size)
+
+
+@pytest.mark.parametrize("date_format", [None, "%d/%m/%Y %H:%M"])
+@pytest.mark.parametrize("seed", range(2))
+def test_normalize_dates_matches_the_baseline_parsing(seed, date_format):
+    rng = np.random.default_rng(seed)
+    text_format = date_format if date_format else data_schema.DATE_FORMAT
+    df = pd.DataFrame({x: _text_dates(rng, 1000, text_format) for x in DATE_COLUMNS}, index = rng.permutation(1000))
+    df["OTHER"] = np.arange(1000)
+
+    expected = _baseline_dates(df, text_format)
+    result = data_schema.normalize_dates(df, DATE_COLUMNS + ["MISSING"], date_format)
+
+    assert result is df
+    pd.testing.assert_frame_equal(result, expected)
+    assert all(df[x].dtype == data_schema.DATETIME_DTYPE for x in DATE_COLUMNS)
+
+
+def test_normalize_dates_datetime_columns():
+    naive_utc = pd.to_datetime(["2021-03-28 00:30", "2021-03-28 01:30", None])
+    df = pd.DataFrame({
+        "CREATION": naive_utc,
+        "END": naive_utc.tz_localize("UTC").tz_convert("Asia/Tokyo"),
+        "LAST_UPDATE": ["2021-03-28 00:30:00.000", "2021-03-28 01:30:00.000", None]
+    })
+
+    data_schema.normalize_dates(df, DATE_COLUMNS)
+
+    expected = pd.Series(naive_utc.tz_localize("UTC").tz_convert("Europe/Paris"))
+    for x in DATE_COLUMNS:
+        pd.testing.assert_series_equal(df[x], expected, check_names = False)
+
+###############################
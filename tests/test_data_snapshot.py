@@ -0,0 +1,91 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from apollo.pipeline import data_preparation, data_snapshot, scoring_rules
+
+###############################
+# DATATABLE PAGES
+###############################
+
+# The datatables are sorted like a stable sort_values of the values sent to the
+# client, in both orders, the missing values last. The cached order of the snapshot
+# and the sort of the rows themselves give the same rows.
+
+SORTABLE_COLUMNS = [column for field, column in data_preparation.DATATABLE_COLUMNS.items()
+                    if field not in data_preparation.DATATABLE_NOT_SORTABLE]
+
+
+def _reference_order(df: pd.DataFrame, column: str, ascending: bool) -> np.ndarray:
+    values = data_preparation.get_datatable_values(df, column).reset_index(drop = True)
+    return values.sort_values(ascending = ascending, kind = "mergesort", na_position = "last").index.to_numpy()
+
+
+@pytest.fixture(params = [True, False], ids = ["cached", "not cached"])
+def tickets(request, enriched_snapshot):
+    ''' The tickets of enriched_snapshot, with or without the snapshot in the cache of the worker '''
+    df, df_operations = enriched_snapshot
+    if request.param:
+        data_snapshot._snapshot_cache[("requests", "tasks", scoring_rules.get_scoring_rules().version)] = (
+            df, df_operations, "test")
+
+    return df
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+@pytest.mark.parametrize("column", SORTABLE_COLUMNS)
+def test_sort_datatable_matches_a_stable_sort(tickets, column, ascending):
+    # the rows of a rule: a subset of the tickets, in their order
+    df = tickets.loc[tickets["AP_SD_REQUEST_ID"] % 3 != 0]
+
+    assert data_snapshot.sort_datatable(df, column, ascending).tolist() == _reference_order(df, column, ascending).tolist()
+
+
+@pytest.mark.parametrize("ascending", [True, False])
+def test_sort_datatable_puts_the_missing_values_last(tickets, ascending):
+    df = tickets.iloc[::-1]
+    values = df["C_RDV_DATE"].iloc[data_snapshot.sort_datatable(df, "C_RDV_DATE", ascending)]
+    valid = int(values.notnull().sum())
+
+    assert 0 < valid < len(values.index)
+    assert values.iloc[valid:].isnull().all()
+    assert values.iloc[:valid].tolist() == sorted(values.iloc[:valid], reverse = not ascending)
+
+
+def test_sort_datatable_with_a_request_twice(tickets):
+    df = pd.concat([tickets.iloc[:10], tickets.iloc[:5]])
+
+    assert data_snapshot.sort_datatable(df, "C_POINTS", False).tolist() == _reference_order(df, "C_POINTS", False).tolist()
+
+
+@pytest.mark.parametrize("page_args", [
+    {},
+    {"offset": 5, "limit": 10, "sort": "-Score"},
+    {"offset": 100, "limit": 10, "sort": "Beneficiaire"},
+    {"limit": 20, "sort": "-Location", "filters": ["Statut:en", "Description:a"]},
+    {"sort": "-Priorite", "filters": ["Score:0"]},
+    {"offset": 3, "filters": ["Beneficiaire:DUP"]}
+])
+def test_get_datatable_page(tickets, page_args):
+    page = data_preparation.parse_datatable_page(**page_args)
+
+    result, total = data_snapshot.get_datatable_page(tickets, page)
+
+    expected = tickets
+    for column, text in page["filters"]:
+        expected = expected.loc[data_preparation.match_datatable_filter(expected, column, text)]
+    assert total == len(expected.index)
+
+    if page["sort"] is not None:
+        expected = expected.iloc[_reference_order(expected, *page["sort"])]
+    stop = None if page["limit"] is None else page["offset"] + page["limit"]
+    pd.testing.assert_frame_equal(result, expected.iloc[page["offset"]:stop])
+
+
+def test_get_datatable_page_without_page(tickets):
+    result, total = data_snapshot.get_datatable_page(tickets, None)
+
+    assert result is tickets
+    assert total == len(tickets.index)
+
+###############################
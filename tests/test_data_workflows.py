@@ -0,0 +1,75 @@
+import pandas as pd
+import pytest
+
+from apollo.pipeline import data_collection, data_preparation, data_snapshot, data_workflows, scoring_rules
+
+###############################
+# SHARED SNAPSHOT
+###############################
+
+# The enriched frames are cached by the worker and shared by the flows it runs: the
+# flows filter them into new frames and never write to the ones they are given.
+
+SNAPSHOT_VERSIONS = {data_collection.REQUESTS_DATASET: "requests", data_collection.TASKS_DATASET: "tasks"}
+
+PAGE = data_preparation.parse_datatable_page(offset = 5, limit = 10, sort = "-Score", filters = ["Statut:en"])
+
+FLOWS = [
+    (data_workflows.flow_get_rdv_calendar, ()),
+    (data_workflows.flow_get_tickets_under_observation_datatable, (None, PAGE)),
+    (data_workflows.flow_get_tickets_under_observation_indicator, ("zola",)),
+    (data_workflows.flow_get_software_installation_datatable, (None, None)),
+    (data_workflows.flow_get_new_arrivals_datatable, (None, PAGE)),
+    (data_workflows.flow_get_suspended_mail_not_recontacted_table, (None,)),
+    (data_workflows.flow_get_suspended_mail_not_recontacted_datatable, (None, None)),
+    (data_workflows.flow_get_suspended_gt_x_datatable, ("hotline", None, PAGE)),
+    (data_workflows.flow_get_suspended_gt_x_indicator, ("proxi", None)),
+    (data_workflows.flow_get_contacted_x_times_datatable, (None, None)),
+    (data_workflows.flow_get_not_suspended_incidents_datatable, ("bernard", PAGE)),
+    (data_workflows.flow_get_industrial_tickets_datatable, (None, None)),
+    (data_workflows.flow_get_security_tickets_datatable, (None, PAGE)),
+    (data_workflows.flow_get_vip_tickets_datatable, (None, None)),
+    (data_workflows.flow_get_ticket_flow_datatable, (None, None, None)),
+    (data_workflows.flow_get_ticket_flow_datatable, ("incident+hotline", None, PAGE)),
+    (data_workflows.flow_get_ticket_flow_score, ("proxy", None)),
+    (data_workflows.flow_get_tickets_by_expiration_table, (None, None)),
+    (data_workflows.flow_get_technician_tickets_table, ()),
+    (data_workflows.flow_get_dashboard, (None, None)),
+    (data_workflows.flow_get_dashboard, ("hotline", "zola"))
+]
+
+
+@pytest.fixture
+def cached_snapshot(enriched_snapshot):
+    ''' Puts enriched_snapshot in the cache of the worker, for SNAPSHOT_VERSIONS '''
+    df, df_operations = enriched_snapshot
+    key = (SNAPSHOT_VERSIONS[data_collection.REQUESTS_DATASET], SNAPSHOT_VERSIONS[data_collection.TASKS_DATASET],
+           scoring_rules.get_scoring_rules().version)
+    data_snapshot._snapshot_cache[key] = (df, df_operations, "test")
+
+    return (df, df_operations)
+
+
+@pytest.mark.parametrize("flow, param", FLOWS, ids = [func.__name__ for func, _ in FLOWS])
+def test_flows_leave_the_cached_snapshot_unchanged(cached_snapshot, flow, param):
+    df, df_operations = cached_snapshot
+    expected_df, expected_df_operations = df.copy(), df_operations.copy()
+
+    data_workflows.run_flow(SNAPSHOT_VERSIONS, flow, *param)
+
+    pd.testing.assert_frame_equal(df, expected_df)
+    pd.testing.assert_frame_equal(df_operations, expected_df_operations)
+
+
+def test_get_snapshot_does_not_load_a_cached_version(monkeypatch, cached_snapshot):
+    def load_dataset_version(*args, **kwargs):
+        raise AssertionError("the SPOT frames are loaded for a cached version")
+
+    monkeypatch.setattr(data_collection, "load_dataset_version", load_dataset_version)
+
+    df, df_operations = data_workflows.run_flow(SNAPSHOT_VERSIONS, data_workflows.get_snapshot)
+
+    assert len(df.index) == len(cached_snapshot[0].index)
+    assert df_operations is cached_snapshot[1]
+
+###############################
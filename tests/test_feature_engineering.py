@@ -0,0 +1,160 @@
+import re
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from apollo.pipeline import feature_engineering
+
+###############################
+# TEXT CLASSIFICATION
+###############################
+
+# The comment classifier replaced one str.contains per category, the flags must be
+# those of the baseline filters.
+
+BASELINE_COMMENT_REGEX = {
+    "C_FLAG_SECURITY": "(anti)?virus|^vol.?$|pirat(é|e)|malware|(mc)?afee",
+    "C_FLAG_INDUSTRIAL": "scada|tablette|conduite",
+    "C_FLAG_DIGIPASS": "big.?ip|vpn"
+}
+
+COMMENT_FRAGMENTS = ["Antivirus bloqué", "VIRUS", "vol", "vol.", "volet", "PIRATÉ", "piratage", "McAfee", "afee",
+                     "MALWARE", "scada", "Tablette", "conduite", "BigIP", "big-ip", "VPN", "imprimante", "PC lent",
+                     "\n", " "]
+
+
+def _tickets(comments) -> pd.DataFrame:
+    n = len(comments)
+    return pd.DataFrame({
+        "AP_SD_COMMENT": comments,
+        "AP_SD_CI_ID": np.resize([9926, 8696, 10, 20], n),
+        "AP_SD_CI_NAME": np.resize(["PC1", "POSTES INDUSTRIELS_ENV", "SKYPE_ENV", "DIGIPASS", "Mustang_Mobilité_ENV",
+                                    "TELETRAVAIL_ENV", "Azure.Microsoft"], n)
+    })
+
+
+def _baseline_flags(df: pd.DataFrame) -> pd.DataFrame:
+    result = pd.DataFrame(index = df.index)
+    for flag, category in feature_engineering.TICKET_CATEGORIES.items():
+        if "ci_id" in category:
+            mask_ci = df["AP_SD_CI_ID"].isin(category["ci_id"])
+        else:
+            mask_ci = df["AP_SD_CI_NAME"].isin(category["ci_name"])
+        mask_comment = df["AP_SD_COMMENT"].str.contains(BASELINE_COMMENT_REGEX[flag], regex = True,
+                                                        flags = re.IGNORECASE, na = False)
+        result[flag] = mask_ci | mask_comment
+
+    return result
+
+
+def test_categories_keep_the_baseline_patterns():
+    assert {flag: category["comment"] for flag, category in feature_engineering.TICKET_CATEGORIES.items()} \
+        == BASELINE_COMMENT_REGEX
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_get_ticket_text_classification_matches_the_baseline_filters(seed):
+    rng = np.random.default_rng(seed)
+    comments = ["".join(rng.choice(COMMENT_FRAGMENTS, rng.integers(0, 4))) for _ in range(1000)]
+    df = _tickets(comments + COMMENT_FRAGMENTS + [None, ""])
+
+    result = feature_engineering.get_ticket_text_classification(df.copy())
+
+    pd.testing.assert_frame_equal(result[list(BASELINE_COMMENT_REGEX)], _baseline_flags(df))
+
+
+@pytest.mark.parametrize("comment, flags", [
+    ("antivirus bloqué, VPN HS", ["C_FLAG_SECURITY", "C_FLAG_DIGIPASS"]),
+    ("vol", ["C_FLAG_SECURITY"]),
+    ("vol du poste", []),
+    ("scada: big ip", ["C_FLAG_INDUSTRIAL", "C_FLAG_DIGIPASS"]),
+    ("conduite piratée par un malware", ["C_FLAG_SECURITY", "C_FLAG_INDUSTRIAL"]),
+    ("imprimante", []),
+    (None, [])
+])
+def test_get_ticket_text_classification(comment, flags):
+    df = pd.DataFrame({"AP_SD_COMMENT": [comment], "AP_SD_CI_ID": [10], "AP_SD_CI_NAME": ["PC1"]})
+
+    result = feature_engineering.get_ticket_text_classification(df)
+
+    assert [flag for flag in BASELINE_COMMENT_REGEX if result.loc[0, flag]] == flags
+
+###############################
+
+
+###############################
+# TECHNICIAN FILTER
+###############################
+
+# The technician index replaced df["AP_AM_DONE_BY_OPERATOR_NAME"].str.contains(tech_filter,
+# flags=re.IGNORECASE). Both select the same tickets for the beginning of a word of
+# the names, the index also ignores the accents.
+
+TECHNICIAN_NAMES = ["BERNARD Jean", "Émile ZOLA", "DUPONT-MARTIN Anne", "Jean-Pierre LEGRAND", "LE GRAND Paul",
+                    "Hélène Bernardin", None]
+
+
+def _technician_tickets(seed: int = 0, size: int = 500) -> pd.DataFrame:
+    rng = np.random.default_rng(seed)
+    names = np.array(TECHNICIAN_NAMES, dtype = object)
+
+    return pd.DataFrame({"AP_AM_DONE_BY_OPERATOR_NAME": rng.choice(names, size),
+                         "AP_SD_REQUEST_ID": np.arange(size)},
+                        index = rng.permutation(size))
+
+
+def _baseline_filter_by_tech(df: pd.DataFrame, tech_filter: str) -> pd.DataFrame:
+    return df.loc[df["AP_AM_DONE_BY_OPERATOR_NAME"].str.contains(tech_filter, regex = True, flags = re.IGNORECASE,
+                                                                 na = False)]
+
+
+def _found_at_word_starts_only(tech_filter: str) -> bool:
+    return all(re.match(r"\S", name[i - 1:i]) is None
+               for name in TECHNICIAN_NAMES[:-1]
+               for i in [m.start() for m in re.finditer(re.escape(tech_filter), name, flags = re.IGNORECASE)])
+
+
+def _word_prefixes():
+    # the beginnings of the words of the names, as typed in upper, lower or the case of the
+    # name, which are not found inside another word too
+    for name in TECHNICIAN_NAMES[:-1]:
+        for word in name.split():
+            for i in range(1, len(word) + 1):
+                yield from {x for x in [word[:i], word[:i].lower(), word[:i].upper()] if _found_at_word_starts_only(x)}
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_filter_by_tech_matches_the_baseline_filter_on_word_prefixes(seed):
+    df = _technician_tickets(seed)
+    index = feature_engineering.TechnicianIndex(df["AP_AM_DONE_BY_OPERATOR_NAME"])
+
+    for tech_filter in list(_word_prefixes()) + ["bernard j", "LE GRAND P", "zola|legrand", "Anne|Jean"]:
+        expected = _baseline_filter_by_tech(df, tech_filter)
+
+        pd.testing.assert_frame_equal(feature_engineering.filter_by_tech(df, tech_filter, index), expected)
+        pd.testing.assert_frame_equal(feature_engineering.filter_by_tech(df, tech_filter), expected)
+
+
+@pytest.mark.parametrize("tech_filter, names", [
+    ("emile", ["Émile ZOLA"]),
+    ("HELENE", ["Hélène Bernardin"]),
+    ("bernard", ["BERNARD Jean", "Hélène Bernardin"]),
+    ("  zola | ", ["Émile ZOLA"]),
+    ("martin", []),  # inside a word
+    (".*", []),  # never a regex
+    ("|", [])
+])
+def test_technician_index_get_technicians(tech_filter, names):
+    index = feature_engineering.TechnicianIndex(pd.Series(TECHNICIAN_NAMES))
+
+    assert [TECHNICIAN_NAMES[i] for i in index.get_technicians(tech_filter)] == names
+
+
+def test_filter_by_tech_without_filter():
+    df = _technician_tickets()
+
+    assert feature_engineering.filter_by_tech(df, None) is df
+    assert feature_engineering.filter_by_tech(df, "") is df
+
+###############################
@@ -0,0 +1,114 @@
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from apollo.pipeline import scoring_rules
+
+###############################
+# SCORING RULE TABLE
+###############################
+
+
+def _load_default_rules() -> dict:
+    with open(scoring_rules.DEFAULT_SCORING_RULES_FILE, "rb") as rules_file:
+        return json.loads(rules_file.read().decode("utf-8"))
+
+
+@pytest.fixture
+def rules_file(monkeypatch, tmp_path):
+    ''' A copy of the default rule table, used by get_scoring_rules in place of the default one '''
+    from apollo.main import site_settings
+
+    path = tmp_path / "scoring_rules.json"
+    path.write_text(json.dumps(_load_default_rules()), encoding = "utf-8")
+
+    monkeypatch.setattr(site_settings, "SCORING_RULES_FILE", str(path), raising = False)
+    monkeypatch.setattr(scoring_rules, "_scoring_rules", None)
+    monkeypatch.setattr(scoring_rules, "_scoring_rules_mtime", None)
+
+    return path
+
+
+def _write_rules(path, content: str, mtime_ns: int):
+    path.write_text(content, encoding = "utf-8")
+    # a new mtime even when the file is written twice within the resolution of the clock
+    os.utime(path, ns = (mtime_ns, mtime_ns))
+
+
+def test_compiled_tables():
+    rules = scoring_rules.ScoringRules(_load_default_rules(), "test")
+
+    # one row per urgency (Normal, Sensible, Important, Majeur), one column per ticket type (Incident, Demande)
+    assert rules.creation_base.tolist() == [1, 0, 10, 3, 100, 30, 1000, 300]
+    assert rules.creation_per_day.tolist() == [3, 1, 10, 3, 100, 30, 1000, 300]
+    assert rules.last_action_per_day.tolist() == [3, 1, 10, 3, 100, 30, 1000, 300]
+    assert rules.not_suspended_per_day.tolist() == [25, 10, 50, 25, 100, 50, 1000, 300]
+    assert rules.suspended_status_ids == [5, 20, 39]
+    assert (rules.security_points, rules.vip_base, rules.vip_per_day, rules.industrial_points) == (1000, 500, 100, 500)
+
+    assert rules.creation_justifications[0] == "+3 pt/jour pour Incident-Normal depuis creation"
+    assert rules.creation_justifications[5] == "30 base + 30 pt/jour pour Demande-Important depuis creation"
+    assert rules.not_suspended_justifications[7] == "+300 pt/jour pour Demande-Majeur non suspendu"
+    # the empty justification of the tickets outside the tables
+    assert rules.creation_justifications[-1] == ""
+
+
+def test_get_cell():
+    rules = scoring_rules.ScoringRules(_load_default_rules(), "test")
+    df = pd.DataFrame({
+        "AP_SD_URGENCY_ID": [5, 5, 3, 2, 1, 4, 1, np.nan],
+        "C_TICKET_TYPE": [0, 1, 1, 0, 1, 0, 2, 0]
+    })
+
+    assert rules.get_cell(df).tolist() == [0, 1, 3, 4, 7, -1, -1, -1]
+
+
+def test_get_scoring_rules_reloads_a_changed_file(rules_file):
+    rules = scoring_rules.get_scoring_rules()
+
+    assert scoring_rules.get_scoring_rules() is rules
+
+    content = _load_default_rules()
+    content["security"]["base"] = 2000
+    _write_rules(rules_file, json.dumps(content), os.stat(rules_file).st_mtime_ns + 10 ** 9)
+    reloaded = scoring_rules.get_scoring_rules()
+
+    assert reloaded.security_points == 2000
+    assert reloaded.version != rules.version
+
+
+def test_get_scoring_rules_keeps_the_version_of_an_unchanged_file(rules_file):
+    rules = scoring_rules.get_scoring_rules()
+
+    _write_rules(rules_file, rules_file.read_text(encoding = "utf-8"), os.stat(rules_file).st_mtime_ns + 10 ** 9)
+
+    assert scoring_rules.get_scoring_rules() is rules
+
+
+@pytest.mark.parametrize("content", ["{not json", json.dumps({"urgencies": []}), json.dumps({"security": 1})])
+def test_get_scoring_rules_keeps_the_previous_rules_of_an_invalid_file(rules_file, content):
+    rules = scoring_rules.get_scoring_rules()
+
+    _write_rules(rules_file, content, os.stat(rules_file).st_mtime_ns + 10 ** 9)
+
+    assert scoring_rules.get_scoring_rules() is rules
+
+
+def test_get_scoring_rules_keeps_the_previous_rules_of_a_removed_file(rules_file):
+    rules = scoring_rules.get_scoring_rules()
+
+    os.remove(rules_file)
+
+    assert scoring_rules.get_scoring_rules() is rules
+
+
+def test_get_scoring_rules_raises_without_previous_rules(rules_file):
+    _write_rules(rules_file, "{not json", os.stat(rules_file).st_mtime_ns + 10 ** 9)
+
+    with pytest.raises(ValueError):
+        scoring_rules.get_scoring_rules()
+
+###############################